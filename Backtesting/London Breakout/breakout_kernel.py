@@ -0,0 +1,250 @@
+import sys
+from math import copysign
+
+import numpy as np
+import pandas as pd
+# compute_stats is private to backtesting.py (it turns trades and equity into the stats of
+# Backtest.run()); its signature changes between releases, so requirements.txt pins the version
+from backtesting._stats import compute_stats
+
+from session_calendar import NS_PER_DAY
+
+# Relative order size of Strategy.buy() / Strategy.sell() without a size (all the equity)
+FULL_EQUITY = 1 - sys.float_info.epsilon
+
+TRADE_COLUMNS = ['Size', 'EntryBar', 'ExitBar', 'EntryPrice', 'ExitPrice', 'SL', 'TP', 'PnL',
+                 'Commission', 'ReturnPct', 'EntryTime', 'ExitTime']
+
+
+def calculate_pip_difference(from_rate, to_rate, pip_point=4):
+    """Difference between two rates in pips, the pip being 10 ** -pip_point (2 for JPY pairs)."""
+    pip_size = 10 ** -pip_point
+    return (to_rate - from_rate) / pip_size
+
+
+def calculate_new_rate(rate, pips, pip_point=4):
+    """Rate ``pips`` pips away from ``rate``."""
+    pip_size = 10 ** -pip_point
+    return rate + (pips * pip_size)
+
+
+def _day_numbers(index):
+    # Calendar day of every bar in the index timezone, like Timestamp.date()
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.as_unit('ns').asi8 // NS_PER_DAY
+
+
+def _truthy(values):
+    # Same truth value as `if self.data.Column[-1]:` in Strategy.next. Session columns hold the
+    # session start or NaT, and both are truthy, so a datetime column lets every bar through.
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return np.ones(len(values), dtype=bool)
+    return values.fillna(True).astype(bool).to_numpy()
+
+
+def _first_exit(high, low, start, sl, tp, is_long, chunk=1024):
+    """Position of the first bar from ``start`` hitting the SL or the TP (len(high) if none)."""
+    n = len(high)
+    while start < n:
+        end = min(n, start + chunk)
+        if is_long:
+            hit = (low[start:end] <= sl) | (high[start:end] >= tp)
+        else:
+            hit = (high[start:end] >= sl) | (low[start:end] <= tp)
+        if hit.any():
+            return start + int(hit.argmax())
+        # Most trades end within a session, longer ones are scanned in growing chunks
+        start, chunk = end, chunk * 2
+    return n
+
+
+def simulate(open_, high, low, close, day, direction, sl, tp, cash=10_000, spread=0.0, commission=0.0):
+    """
+    Event-driven fill of one-trade-per-day bracket orders over contiguous price arrays.
+
+    ``direction`` is +1 / -1 on the bars where the strategy sends a buy / sell order (with
+    ``sl`` and ``tp`` for that order) and 0 elsewhere. Orders are filled like backtesting.py
+    with the default settings: at the next bar open with all the equity, the SL checked
+    before the TP on every bar including the entry bar, and no order sent while a position
+    is open or after a trade was entered on the same day. Only the bars where something
+    happens are visited, so the cost grows with the number of trades, not of bars.
+
+    Returns the closed trades as a dict of arrays and the equity curve.
+    """
+    n = len(close)
+    candidates = np.flatnonzero(direction)
+    # First bar of the next day, for every bar
+    next_day = np.searchsorted(day, day + 1)
+
+    trades = {column: [] for column in TRADE_COLUMNS if column not in ('EntryTime', 'ExitTime')}
+    cash_changes = [(0, float(cash))]
+    open_trade = None
+    last_entry_day = None
+    position = 1  # Strategy.next is first called on the second bar
+    while True:
+        k = np.searchsorted(candidates, position)
+        if k == len(candidates):
+            break
+        signal = candidates[k]
+        if day[signal] == last_entry_day:
+            position = next_day[signal]
+            continue
+        entry_bar = signal + 1
+        if entry_bar >= n:
+            # Order sent on the last bar, never filled
+            break
+
+        is_long = direction[signal] > 0
+        side = 1 if is_long else -1
+        price = open_[entry_bar]
+        adjusted_price = price * (1 + copysign(spread, side))
+        adjusted_price_plus_commission = adjusted_price + (abs(FULL_EQUITY) * price * commission) / abs(FULL_EQUITY)
+        size = int((max(0, cash) * 1.0 * FULL_EQUITY) // adjusted_price_plus_commission)
+        if not size or size * adjusted_price_plus_commission > max(0, cash):
+            # Canceled by the broker, the strategy may try again on the fill bar
+            position = entry_bar
+            continue
+        size *= side
+
+        entry_price = adjusted_price
+        cash -= abs(size) * entry_price * commission
+        cash_changes.append((entry_bar, cash))
+        last_entry_day = day[entry_bar]
+
+        exit_bar = _first_exit(high, low, entry_bar, sl[signal], tp[signal], is_long)
+        if exit_bar == n:
+            # Still open at the end: left out of the trades, like backtesting.py
+            open_trade = (entry_bar, size, entry_price)
+            break
+
+        stop_hit = low[exit_bar] <= sl[signal] if is_long else high[exit_bar] >= sl[signal]
+        if stop_hit:
+            exit_price = min(open_[exit_bar], sl[signal]) if is_long else max(open_[exit_bar], sl[signal])
+        else:
+            exit_price = max(open_[exit_bar], tp[signal]) if is_long else min(open_[exit_bar], tp[signal])
+
+        exit_commission = abs(size) * exit_price * commission
+        cash += (size * (exit_price - entry_price)) - exit_commission
+        cash_changes.append((exit_bar, cash))
+        commissions = exit_commission + abs(size) * entry_price * commission
+
+        trades['Size'].append(size)
+        trades['EntryBar'].append(entry_bar)
+        trades['ExitBar'].append(exit_bar)
+        trades['EntryPrice'].append(entry_price)
+        trades['ExitPrice'].append(exit_price)
+        trades['SL'].append(float(sl[signal]))
+        trades['TP'].append(float(tp[signal]))
+        trades['PnL'].append((size * (exit_price - entry_price)) - commissions)
+        trades['Commission'].append(commissions)
+        trades['ReturnPct'].append(side * (exit_price / entry_price - 1) - commissions / (abs(size) * entry_price))
+        # The strategy sees the flat position on the exit bar already
+        position = exit_bar
+
+    # Equity: cash as of each bar, plus the open profit of the trades in progress
+    bars, values = zip(*cash_changes)
+    equity = np.asarray(values)[np.searchsorted(bars, np.arange(n), side='right') - 1]
+    open_spans = zip(trades['EntryBar'], trades['ExitBar'], trades['Size'], trades['EntryPrice'])
+    if open_trade is not None:
+        open_spans = list(open_spans) + [(open_trade[0], n, open_trade[1], open_trade[2])]
+    for entry_bar, exit_bar, size, entry_price in open_spans:
+        equity[entry_bar:exit_bar] += close[entry_bar:exit_bar] * size - size * entry_price
+    if n > 1:
+        # No equity is recorded for the first bar, it is back-filled
+        equity[0] = equity[1]
+    return trades, equity
+
+
+class LondonBreakoutKernel:
+    """
+    LondonBreakOutStrategy of the notebook, run on NumPy arrays instead of Backtest.run().
+
+    The parameters have the same names and defaults as the strategy. The entry signals and
+    their SL/TP levels are computed for all the bars at once from the Asian session range
+    columns; `simulate` then only visits the bars with an order, a fill or an exit. The
+    trades and stats are the same as ``Backtest(df, LondonBreakOutStrategy, cash=...).run()``.
+    """
+
+    def __init__(self, pivot_high_low_bars=60, ratio_profit_loss=1.4,
+                 min_SL_pips_trade=25, set_sl_to_min=True, max_TP_pips_trade=75, set_tp_to_max=True,
+                 trade_in_range_of_asian_session=True, min_asian_session_size=10, max_asian_session_size=50,
+                 pair_pip_point=4):
+        self.pivot_high_low_bars = pivot_high_low_bars
+        self.ratio_profit_loss = ratio_profit_loss
+        self.min_SL_pips_trade = min_SL_pips_trade
+        self.set_sl_to_min = set_sl_to_min
+        self.max_TP_pips_trade = max_TP_pips_trade
+        self.set_tp_to_max = set_tp_to_max
+        self.trade_in_range_of_asian_session = trade_in_range_of_asian_session
+        self.min_asian_session_size = min_asian_session_size
+        self.max_asian_session_size = max_asian_session_size
+        self.pair_pip_point = pair_pip_point
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{k}={v}' for k, v in vars(self).items())})"
+
+    def signals(self, df, spread=0.0):
+        """Order direction (+1 buy, -1 sell, 0 none), SL and TP of every bar."""
+        close = df['Close'].to_numpy(dtype=float)
+        high_asian = df['HighAsianSession'].to_numpy(dtype=float)
+        low_asian = df['LowAsianSession'].to_numpy(dtype=float)
+        pip_point = self.pair_pip_point
+
+        # Pivot low / high of the last bars, the current one included
+        pivot_low = df['Low'].rolling(self.pivot_high_low_bars, min_periods=1).min().to_numpy(dtype=float)
+        pivot_high = df['High'].rolling(self.pivot_high_low_bars, min_periods=1).max().to_numpy(dtype=float)
+
+        with np.errstate(invalid='ignore'):
+            filter_ok = np.ones(len(df), dtype=bool)
+            if self.trade_in_range_of_asian_session:
+                asian_session_size = (high_asian - low_asian) * (10 ** self.pair_pip_point)
+                filter_ok = ~((asian_session_size < self.min_asian_session_size) |
+                              (asian_session_size > self.max_asian_session_size))
+            filter_ok &= _truthy(df['LondonSession'])
+            buy = filter_ok & (close > high_asian)
+            sell = filter_ok & ~buy & (close < low_asian)
+
+        # SL at the pivot, TP at ratio_profit_loss times the risk, both bounded in pips
+        sl = np.where(buy, pivot_low, pivot_high)
+        side = np.where(buy, 1.0, -1.0)
+        tp = close + side * (self.ratio_profit_loss * (side * (close - sl)))
+        if self.set_sl_to_min:
+            too_close = np.abs(calculate_pip_difference(close, sl, pip_point)) < self.min_SL_pips_trade
+            sl = np.where(too_close, calculate_new_rate(close, -side * self.min_SL_pips_trade, pip_point), sl)
+            tp = np.where(too_close, close + side * (self.ratio_profit_loss * (side * (close - sl))), tp)
+        if self.set_tp_to_max:
+            too_far = np.abs(calculate_pip_difference(close, tp, pip_point)) > self.max_TP_pips_trade
+            tp = np.where(too_far, calculate_new_rate(close, side * self.max_TP_pips_trade, pip_point), tp)
+
+        # Orders with SL and TP on the wrong side of the price are rejected by Strategy.buy/sell
+        reference = close * (1 + side * spread)
+        valid = np.where(buy, (sl < reference) & (reference < tp), (tp < reference) & (reference < sl))
+        direction = np.where(buy & valid, 1, np.where(sell & valid, -1, 0)).astype(np.int8)
+        return direction, sl, tp
+
+    def run(self, df, cash=10_000, spread=0.0, commission=0.0):
+        """Backtest stats of the strategy, in the same format as Backtest.run()."""
+        direction, sl, tp = self.signals(df, spread)
+        trades, equity = simulate(
+            df['Open'].to_numpy(dtype=float), df['High'].to_numpy(dtype=float),
+            df['Low'].to_numpy(dtype=float), df['Close'].to_numpy(dtype=float),
+            _day_numbers(df.index), direction, sl, tp, cash, spread, commission)
+
+        trades_df = pd.DataFrame(trades, columns=TRADE_COLUMNS)
+        trades_df['EntryTime'] = df.index[trades_df['EntryBar'].to_numpy(dtype=int)]
+        trades_df['ExitTime'] = df.index[trades_df['ExitBar'].to_numpy(dtype=int)]
+        trades_df['Duration'] = trades_df['ExitTime'] - trades_df['EntryTime']
+        trades_df['Tag'] = None
+
+        stats = compute_stats(trades=trades_df, equity=equity, ohlc_data=df, strategy_instance=None)
+        commissions = trades_df['Commission'].sum()
+        if commissions:
+            # Backtest.run() reports the commissions right after the equity peak
+            at = stats.index.get_loc('Equity Peak [$]') + 1
+            stats = type(stats)(pd.concat([stats.iloc[:at], pd.Series({'Commissions [$]': commissions}),
+                                           stats.iloc[at:]]), dtype=object)
+        stats['_strategy'] = self
+        return stats
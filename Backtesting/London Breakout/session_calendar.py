@@ -0,0 +1,163 @@
+import os
+from enum import Enum
+
+import numpy as np
+import pandas as pd
+
+NS_PER_MINUTE = 60 * 10 ** 9
+NS_PER_DAY = 24 * 60 * NS_PER_MINUTE
+
+
+# Create an enum for the forex markets
+class ForexMarket(Enum):
+    LONDON = "London"
+    TOKYO = "Tokyo"
+    SYDNEY = "Sydney"
+    NEW_YORK = "New York"
+
+
+# Market hours in GMT as (open, close) hours, for summer and winter time
+MARKET_HOURS = {
+    ForexMarket.LONDON: {'summer': (7, 16), 'winter': (8, 17)},
+    ForexMarket.TOKYO: {'summer': (23, 8), 'winter': (0, 9)},
+    ForexMarket.SYDNEY: {'summer': (22, 7), 'winter': (21, 6)},
+    ForexMarket.NEW_YORK: {'summer': (12, 21), 'winter': (13, 22)},
+}
+
+# Columns added by label_sessions, as (open column, session column)
+SESSION_COLUMNS = [
+    ('LondonOpen', 'LondonSession'),
+    ('TokyoOpen', 'TokyoSession'),
+    ('SydneyOpen', 'SydneySession'),
+    ('NewYorkOpen', 'NewYorkSession'),
+    ('AsiaOpen', 'AsianSession'),
+]
+
+
+def _last_sunday(year, month):
+    # Last Sunday of the month (March and October have 31 days), at 01:00 UTC
+    last_day = pd.Timestamp(year=year, month=month, day=31)
+    return last_day - pd.Timedelta(days=(last_day.weekday() + 1) % 7) + pd.Timedelta(hours=1)
+
+
+def dst_transitions(years):
+    """European summer time start and end (UTC nanoseconds) for each year."""
+    starts = np.array([_last_sunday(year, 3).value for year in years], dtype=np.int64)
+    ends = np.array([_last_sunday(year, 10).value for year in years], dtype=np.int64)
+    return starts, ends
+
+
+def _utc_nanoseconds(index):
+    # Naive timestamps are taken as GMT, like in is_market_open
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert('UTC')
+    return index.as_unit('ns').asi8
+
+
+def is_summer_time(index):
+    """Boolean array, True for the timestamps within European summer time."""
+    ns = _utc_nanoseconds(index)
+    if len(ns) == 0:
+        return np.zeros(0, dtype=bool)
+
+    # DST boundaries are computed once per year, then looked up for every bar
+    years = pd.DatetimeIndex(ns).year.to_numpy()
+    first_year = years.min()
+    starts, ends = dst_transitions(range(first_year, years.max() + 1))
+    year_position = years - first_year
+    return (ns >= starts[year_position]) & (ns < ends[year_position])
+
+
+def market_open(index, market, summer=None):
+    """Boolean array, True for the timestamps where the market is open (closed on weekends)."""
+    ns = _utc_nanoseconds(index)
+    if summer is None:
+        summer = is_summer_time(index)
+
+    time_of_day = ns % NS_PER_DAY
+    # 1970-01-01 was a Thursday (weekday 3)
+    weekday = (ns // NS_PER_DAY + 3) % 7
+
+    is_open = np.zeros(len(ns), dtype=bool)
+    for season, season_mask in (('summer', summer), ('winter', ~summer)):
+        open_hour, close_hour = MARKET_HOURS[market][season]
+        open_time, close_time = open_hour * 60 * NS_PER_MINUTE, close_hour * 60 * NS_PER_MINUTE
+        if open_time < close_time:
+            in_hours = (time_of_day >= open_time) & (time_of_day < close_time)
+        else:
+            # Markets with overnight hours (e.g. Sydney)
+            in_hours = (time_of_day >= open_time) | (time_of_day < close_time)
+        is_open |= season_mask & in_hours
+
+    return is_open & (weekday < 5)
+
+
+def session_starts(index, is_open):
+    """
+    Start timestamp of the continuous run of open bars each bar belongs to (NaT when closed).
+
+    Same as the notebook's identity_market_sessions, by run-length encoding of the mask.
+    """
+    is_open = np.asarray(is_open, dtype=bool)
+    starts = is_open & ~np.concatenate([[False], is_open[:-1]])
+    # Run number of every bar (1 for the first run), 0 before the first run
+    run_id = np.cumsum(starts)
+    start_positions = np.flatnonzero(starts)
+
+    index = pd.DatetimeIndex(index)
+    result = pd.Series(pd.NaT, index=index, dtype=index.dtype)
+    if len(start_positions):
+        open_positions = np.flatnonzero(is_open)
+        result.iloc[open_positions] = index[start_positions[run_id[open_positions] - 1]]
+    return result
+
+
+def label_sessions(df):
+    """
+    Add the market open flags and session start columns of the notebook to an OHLC frame.
+
+    LondonOpen, TokyoOpen, SydneyOpen, NewYorkOpen, AsiaOpen (Tokyo or Sydney, excluding
+    London) and the matching *Session columns holding the start of the current session.
+    """
+    df = df.copy()
+    summer = is_summer_time(df.index)
+
+    df['LondonOpen'] = market_open(df.index, ForexMarket.LONDON, summer)
+    df['TokyoOpen'] = market_open(df.index, ForexMarket.TOKYO, summer)
+    df['SydneyOpen'] = market_open(df.index, ForexMarket.SYDNEY, summer)
+    df['NewYorkOpen'] = market_open(df.index, ForexMarket.NEW_YORK, summer)
+    # Asian Session is considered Tokyo and Sydney, but excluding London
+    df['AsiaOpen'] = (df['TokyoOpen'] | df['SydneyOpen']) & ~df['LondonOpen']
+
+    for open_column, session_column in SESSION_COLUMNS:
+        df[session_column] = session_starts(df.index, df[open_column].to_numpy())
+    return df
+
+
+def cached_label_sessions(df, source_path, cache_dir=None):
+    """
+    label_sessions, cached on disk per data file.
+
+    The cache file name holds the modification time and size of ``source_path``, so a
+    changed data file is labelled again.
+    """
+    stat = os.stat(source_path)
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(source_path)), '.session_cache')
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    cache_path = os.path.join(cache_dir, f'{stem}-{stat.st_mtime_ns}-{stat.st_size}.parquet')
+
+    labels = [open_column for open_column, _ in SESSION_COLUMNS] + [session for _, session in SESSION_COLUMNS]
+    if os.path.exists(cache_path):
+        cached = pd.read_parquet(cache_path)
+        if len(cached) == len(df) and (cached.index == df.index).all():
+            return pd.concat([df, cached[labels]], axis=1)
+
+    labelled = label_sessions(df)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Labels of older versions of the file are not needed anymore
+    for name in os.listdir(cache_dir):
+        if name.startswith(f'{stem}-') and name.endswith('.parquet'):
+            os.remove(os.path.join(cache_dir, name))
+    labelled[labels].to_parquet(cache_path)
+    return labelled
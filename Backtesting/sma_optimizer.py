@@ -0,0 +1,359 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from backtesting import Backtest, Strategy
+
+PIP_VALUE = 0.0001
+# Strategy parameters that are SMA lengths, served from the indicator cache
+SMA_PARAMS = ('sma_fast_length', 'sma_slow_length')
+
+
+def calculate_price(current_price, pips, pip_value):
+    price_change = pips * pip_value
+    new_price = current_price + price_change
+    return new_price
+
+
+def sma(close, length):
+    # Same as ta.sma without TA-Lib
+    return pd.Series(close, dtype=float).rolling(length).mean().to_numpy()
+
+
+class IndicatorCache:
+    """SMA of every distinct length, each computed once over the full close series."""
+
+    def __init__(self, index, close=None, lengths=(), values=None):
+        self.index = pd.DatetimeIndex(index)
+        self.lengths = sorted({int(length) for length in lengths})
+        self._rows = {length: row for row, length in enumerate(self.lengths)}
+        if values is None:
+            values = np.vstack([sma(close, length) for length in self.lengths]) if self.lengths \
+                else np.empty((0, len(self.index)))
+        self.values = values
+
+    def __contains__(self, length):
+        return length in self._rows
+
+    def lookup(self, length, index):
+        """SMA values for the dates of ``index``, a contiguous window of the cached dates."""
+        start = self.index.searchsorted(index[0])
+        stop = start + len(index)
+        if stop > len(self.index) or self.index[start] != index[0] or self.index[stop - 1] != index[-1]:
+            return None
+        return self.values[self._rows[length], start:stop]
+
+
+# Cache used by SmaCross in this process: set by the optimizer, or in each worker
+_indicator_cache = None
+
+
+def cached_sma(close, length):
+    """SMA from the indicator cache when it holds the length and the dates, computed otherwise."""
+    if _indicator_cache is not None and length in _indicator_cache:
+        values = _indicator_cache.lookup(length, close.index)
+        if values is not None:
+            return values
+    return sma(close, length)
+
+
+class SmaCross(Strategy):
+
+    sma_fast_length = 9
+    sma_slow_length = 100
+    sl_pips = 50
+    tp_pips = 100
+
+    def init(self):
+        # set up the indicators
+        close = pd.Series(self.data.Close, index=self.data.index)
+        self.smaFast = self.I(cached_sma, close, self.sma_fast_length, name=f'SMA({self.sma_fast_length})')
+        self.smaSlow = self.I(cached_sma, close, self.sma_slow_length, name=f'SMA({self.sma_slow_length})')
+
+    def next(self):
+        if (self.smaFast[-1] > self.smaSlow[-1]) and (self.smaFast[-2] < self.smaSlow[-2]):
+            if self.position.size == 0:
+                sl = calculate_price(self.data.Close[-1], -1 * self.sl_pips, PIP_VALUE)
+                tp = calculate_price(self.data.Close[-1], self.tp_pips, PIP_VALUE)
+                self.buy(limit=self.data.Close[-1], sl=sl, tp=tp)
+            elif self.position.is_short:
+                self.position.close()
+        if (self.smaFast[-1] < self.smaSlow[-1]) and (self.smaFast[-2] > self.smaSlow[-2]):
+            if self.position.size == 0:
+                sl = calculate_price(self.data.Close[-1], self.sl_pips, PIP_VALUE)
+                tp = calculate_price(self.data.Close[-1], -1 * self.tp_pips, PIP_VALUE)
+                self.sell(limit=self.data.Close[-1], sl=sl, tp=tp)
+            elif self.position.is_long:
+                self.position.close()
+
+
+# ----------------------------------------------------------------------
+# Shared memory and worker processes
+# ----------------------------------------------------------------------
+
+def _to_shared(array, blocks):
+    block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    blocks.append(block)
+    return block.name, array.shape, array.dtype.str
+
+
+def _from_shared(descriptor, blocks):
+    name, shape, dtype = descriptor
+    # Workers share the resource tracker of the parent, which unlinks the block when done
+    block = shared_memory.SharedMemory(name=name)
+    blocks.append(block)
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+# State of each worker process, set once by the pool initializer
+_shared = {}
+
+
+def _init_worker(descriptors, columns, tz, lengths, strategy, backtest_kwargs):
+    global _indicator_cache
+    blocks = []
+    index = pd.DatetimeIndex(_from_shared(descriptors['index'], blocks).view('datetime64[ns]'))
+    if tz is not None:
+        index = index.tz_localize('UTC').tz_convert(tz)
+    data = pd.DataFrame(_from_shared(descriptors['ohlc'], blocks), index=index, columns=columns, copy=False)
+    _indicator_cache = IndicatorCache(index, lengths=lengths, values=_from_shared(descriptors['sma'], blocks))
+    _shared.update(blocks=blocks, data=data, strategy=strategy, backtest_kwargs=backtest_kwargs)
+
+
+def _public_stats(stats):
+    return {key: value for key, value in stats.items() if not key.startswith('_')}
+
+
+def _run_batch(data, strategy, backtest_kwargs, combinations, start, stop):
+    window = data.iloc[start:stop]
+    backtest = Backtest(window, strategy, **backtest_kwargs)
+    return [_public_stats(backtest.run(**params)) for params in combinations]
+
+
+def _run_batch_in_worker(combinations, start, stop):
+    return _run_batch(_shared['data'], _shared['strategy'], _shared['backtest_kwargs'], combinations, start, stop)
+
+
+def _heatmap(combinations, scores, names, maximize):
+    index = pd.MultiIndex.from_frame(pd.DataFrame(combinations, columns=names))
+    return pd.Series(scores, index=index, name=maximize if isinstance(maximize, str) else 'Score')
+
+
+class SmaCrossOptimizer:
+    """
+    Parameter sweeps of SmaCross (or a strategy with the same SMA parameters) on one data set.
+
+    Every distinct SMA length of a sweep is computed once over the full history and served
+    to all the runs from an indicator cache. With ``n_jobs`` > 1 the OHLC arrays and the
+    cache are put in shared memory once and the combinations are spread over a process
+    pool. Besides the full grid, the parameters can be searched with scikit-optimize and
+    validated walk-forward. Windows of the data reuse the indicators of the full history,
+    so they need no warm-up bars.
+    """
+
+    def __init__(self, data, strategy=SmaCross, n_jobs=1, sma_params=SMA_PARAMS, **backtest_kwargs):
+        self.data = data
+        self.strategy = strategy
+        self.n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+        self.sma_params = sma_params
+        self.backtest_kwargs = backtest_kwargs
+        self._pool = None
+
+    # ------------------------------------------------------------------
+    # Evaluation
+    # ------------------------------------------------------------------
+
+    def _sma_lengths(self, ranges):
+        return {int(value) for name in self.sma_params if name in ranges for value in ranges[name]}
+
+    def _start(self, lengths):
+        """Indicator cache for the lengths, and the worker pool sharing it when n_jobs > 1."""
+        global _indicator_cache
+        _indicator_cache = IndicatorCache(self.data.index, self.data['Close'].to_numpy(dtype=float), lengths)
+        if self.n_jobs == 1:
+            return
+
+        index = self.data.index
+        tz = getattr(index, 'tz', None)
+        nanoseconds = (index.tz_convert('UTC').tz_localize(None) if tz is not None else index).as_unit('ns').asi8
+        self._blocks = []
+        descriptors = {
+            'index': _to_shared(nanoseconds, self._blocks),
+            'ohlc': _to_shared(np.ascontiguousarray(self.data.to_numpy(dtype=float)), self._blocks),
+            'sma': _to_shared(np.ascontiguousarray(_indicator_cache.values), self._blocks),
+        }
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.n_jobs, initializer=_init_worker,
+            initargs=(descriptors, list(self.data.columns), tz, _indicator_cache.lengths,
+                      self.strategy, self.backtest_kwargs))
+
+    def _stop(self):
+        global _indicator_cache
+        _indicator_cache = None
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            for block in self._blocks:
+                block.close()
+                block.unlink()
+            self._blocks = []
+
+    def _evaluate(self, combinations, start=0, stop=None):
+        """Public stats of every combination on the bars [start, stop), in order."""
+        stop = len(self.data) if stop is None else stop
+        if self._pool is None or len(combinations) < 2:
+            return _run_batch(self.data, self.strategy, self.backtest_kwargs, combinations, start, stop)
+        # A few batches per worker, to balance the slow and fast combinations
+        size = max(1, len(combinations) // (self.n_jobs * 4))
+        batches = [combinations[i:i + size] for i in range(0, len(combinations), size)]
+        results = self._pool.map(_run_batch_in_worker, batches, [start] * len(batches), [stop] * len(batches))
+        return [stats for batch in results for stats in batch]
+
+    def _run(self, params, start=0, stop=None):
+        # Full stats (trades, equity curve) of one combination, in this process
+        return Backtest(self.data.iloc[start:stop], self.strategy, **self.backtest_kwargs).run(**params)
+
+    @staticmethod
+    def _score(stats, maximize):
+        return maximize(pd.Series(stats)) if callable(maximize) else stats[maximize]
+
+    # ------------------------------------------------------------------
+    # Searches
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def grid(constraint=None, **ranges):
+        """Every combination of the parameter values, as a list of dicts, filtered by ``constraint``."""
+        names = list(ranges)
+        combinations = [dict(zip(names, values)) for values in itertools.product(*ranges.values())]
+        if constraint is not None:
+            combinations = [params for params in combinations if constraint(SimpleNamespace(**params))]
+        return combinations
+
+    def _grid_search(self, combinations, maximize, start=0, stop=None):
+        results = self._evaluate(combinations, start, stop)
+        scores = [self._score(stats, maximize) for stats in results]
+        return combinations[int(np.nanargmax(scores))], _heatmap(combinations, scores, list(combinations[0]), maximize)
+
+    def optimize(self, maximize='Return [%]', constraint=None, **ranges):
+        """
+        Full grid search, like ``Backtest.optimize(method='grid', return_heatmap=True)``.
+
+        Returns the stats of the best combination and the heatmap of ``maximize`` over all
+        the combinations.
+        """
+        combinations = self.grid(constraint, **ranges)
+        try:
+            self._start(self._sma_lengths(ranges))
+            best, heatmap = self._grid_search(combinations, maximize)
+            return self._run(best), heatmap
+        finally:
+            self._stop()
+
+    def _bayesian_search(self, maximize, constraint, ranges, n_calls, random_state, start=0, stop=None):
+        from skopt import Optimizer
+        from skopt.space import Categorical, Integer, Real
+
+        names = list(ranges)
+        dimensions = []
+        for name, values in ranges.items():
+            values = list(values)
+            if all(isinstance(value, (int, np.integer)) for value in values):
+                dimensions.append(Integer(min(values), max(values), name=name))
+            elif all(isinstance(value, (int, float, np.number)) for value in values):
+                dimensions.append(Real(min(values), max(values), name=name))
+            else:
+                dimensions.append(Categorical(values, name=name))
+
+        optimizer = Optimizer(dimensions, base_estimator='GP', random_state=random_state)
+        batch_size = max(1, self.n_jobs)
+        combinations, scores = [], []
+        # Points rejected by the constraint count as calls, so a constraint rejecting most of
+        # the space cannot keep the search going forever
+        asked = 0
+        while asked < n_calls:
+            points = optimizer.ask(n_points=min(batch_size, n_calls - asked))
+            asked += len(points)
+            batch = [{name: value.item() if isinstance(value, np.generic) else value
+                      for name, value in zip(names, point)} for point in points]
+            valid = [constraint is None or constraint(SimpleNamespace(**params)) for params in batch]
+            results = iter(self._evaluate([params for params, ok in zip(batch, valid) if ok], start, stop))
+            batch_scores = [self._score(next(results), maximize) if ok else np.nan for ok in valid]
+
+            combinations += [params for params, ok in zip(batch, valid) if ok]
+            scores += [score for score, ok in zip(batch_scores, valid) if ok]
+            # Invalid and undefined scores count as the worst score seen so far
+            worst = np.nanmin(scores) if np.isfinite(scores).any() else 0.0
+            optimizer.tell(points, [-(worst if np.isnan(score) else score) for score in batch_scores])
+
+        if not np.isfinite(scores).any():
+            raise ValueError(f"None of the {n_calls} points of the search satisfied the constraint with a "
+                             f"defined score, widen the ranges or relax the constraint")
+        heatmap = _heatmap(combinations, scores, names, maximize)
+        return combinations[int(np.nanargmax(scores))], heatmap, optimizer.get_result()
+
+    def optimize_skopt(self, maximize='Return [%]', constraint=None, n_calls=200, random_state=None, **ranges):
+        """
+        Bayesian search with scikit-optimize, batches of ``n_jobs`` points evaluated in parallel.
+
+        Integer and float parameters are searched between the min and max of their values.
+        ``n_calls`` counts the points rejected by ``constraint`` too.
+
+        Returns the stats of the best combination, the heatmap of the evaluated
+        combinations and the scikit-optimize result.
+        """
+        sma_ranges = {name: range(min(values), max(values) + 1) for name, values in ranges.items()
+                      if name in self.sma_params}
+        try:
+            self._start(self._sma_lengths(sma_ranges))
+            best, heatmap, result = self._bayesian_search(maximize, constraint, ranges, n_calls, random_state)
+            return self._run(best), heatmap, result
+        finally:
+            self._stop()
+
+    def walk_forward(self, n_splits=4, anchored=False, method='grid', maximize='Return [%]', constraint=None,
+                     n_calls=100, random_state=None, **ranges):
+        """
+        Walk-forward validation: optimize on each training window, then test on the next one.
+
+        The data is cut into ``n_splits`` + 1 consecutive blocks; split k trains on block k
+        (or on all the blocks up to k when ``anchored``) and tests on block k + 1. Returns
+        one row per split with the windows, the best parameters and the in-sample and
+        out-of-sample scores.
+        """
+        edges = np.linspace(0, len(self.data), n_splits + 2).astype(int)
+        if method == 'skopt':
+            lengths = self._sma_lengths({name: range(min(values), max(values) + 1) for name, values in ranges.items()
+                                         if name in self.sma_params})
+        else:
+            lengths = self._sma_lengths(ranges)
+            combinations = self.grid(constraint, **ranges)
+
+        rows = []
+        try:
+            self._start(lengths)
+            for split in range(n_splits):
+                train_start, train_stop, test_stop = edges[0 if anchored else split], edges[split + 1], edges[split + 2]
+                if method == 'skopt':
+                    best, heatmap, _ = self._bayesian_search(maximize, constraint, ranges, n_calls, random_state,
+                                                             train_start, train_stop)
+                else:
+                    best, heatmap = self._grid_search(combinations, maximize, train_start, train_stop)
+                test_stats = self._evaluate([best], train_stop, test_stop)[0]
+                rows.append({
+                    'Train Start': self.data.index[train_start],
+                    'Train End': self.data.index[train_stop - 1],
+                    'Test Start': self.data.index[train_stop],
+                    'Test End': self.data.index[test_stop - 1],
+                    **best,
+                    'In-Sample': heatmap.max(),
+                    'Out-of-Sample': self._score(test_stats, maximize),
+                })
+        finally:
+            self._stop()
+        return pd.DataFrame(rows)
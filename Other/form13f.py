@@ -0,0 +1,219 @@
+import io
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Partition keys read as strings: inferred, a CIK folder name like 0001067983 would become an integer
+PARTITIONING = ds.partitioning(pa.schema([('filer', pa.string()), ('period', pa.string())]), flavor='hive')
+
+# Tags of an infoTable element kept, with the name of their column
+FIELDS = {
+    'nameOfIssuer': 'nameOfIssuer',
+    'titleOfClass': 'titleOfClass',
+    'cusip': 'cusip',
+    'value': 'value',
+    'sshPrnamt': 'sharesAmount',
+    'sshPrnamtType': 'sharesType',
+    'putCall': 'putCall',
+    'investmentDiscretion': 'investmentDiscretion',
+}
+
+NUMERIC_COLUMNS = ['value', 'sharesAmount']
+STRING_COLUMNS = [column for column in FIELDS.values() if column not in NUMERIC_COLUMNS]
+
+
+def _open(source):
+    # A path, or the content of a filing (requests' response.content / response.text)
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    if isinstance(source, str) and source.lstrip().startswith('<'):
+        return io.BytesIO(source.encode())
+    return source
+
+
+def parse_info_table(source):
+    """
+    Holdings of a 13F information table, one row per infoTable element.
+
+    The XML is read with iterparse and every infoTable is dropped from the tree once its
+    fields are read, so memory does not grow with the size of the filing. Namespaces are
+    ignored. ``value`` and ``sharesAmount`` are integers as filed.
+    """
+    columns = {column: [] for column in FIELDS.values()}
+    holding = {}
+    context = ET.iterparse(_open(source), events=('start', 'end'))
+    _, root = next(context)
+    for event, elem in context:
+        if event != 'end':
+            continue
+        tag = elem.tag.rpartition('}')[2]
+        if tag in FIELDS:
+            holding[FIELDS[tag]] = elem.text
+        elif tag == 'infoTable':
+            for column, values in columns.items():
+                values.append(holding.get(column))
+            holding = {}
+            # The infoTables already read are the only children of the root
+            root.clear()
+
+    df = pd.DataFrame({column: pd.array(values, dtype='string') for column, values in columns.items()})
+    for column in NUMERIC_COLUMNS:
+        df[column] = pd.to_numeric(df[column].str.replace(',', ''), errors='coerce').astype('Int64')
+    return df
+
+
+def aggregate_holdings(holdings, scale=1000):
+    """Value and shares per issuer, divided by ``scale``, as the notebook's parse13f returns them."""
+    df = holdings[['nameOfIssuer', 'cusip', 'value', 'sharesAmount']].copy()
+    df[NUMERIC_COLUMNS] = df[NUMERIC_COLUMNS].astype(float) / scale
+    df[['nameOfIssuer', 'cusip']] = df[['nameOfIssuer', 'cusip']].astype(object)
+    return df.groupby(['nameOfIssuer', 'cusip'], as_index=False).sum()
+
+
+def parse13f(xml, scale=1000):
+    """Holdings of a filing per issuer (same result as the notebook's ElementTree version)."""
+    return aggregate_holdings(parse_info_table(xml), scale)
+
+
+def _partition(root, filer, period):
+    return os.path.join(root, f'filer={filer}', f'period={period}')
+
+
+def ingest_filing(root, filer, period, source):
+    """Parse one filing and write its holdings to the filer / period partition, returns the rows."""
+    holdings = parse_info_table(source)
+    folder = _partition(root, filer, period)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, 'holdings.parquet')
+    # Written aside and renamed, so an interrupted ingestion never leaves a truncated partition
+    holdings.to_parquet(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+    return len(holdings)
+
+
+class HoldingsStore:
+    """
+    13F holdings of many filers, stored as typed Parquet partitioned by filer and period
+    (``<root>/filer=1067983/period=2023Q4/holdings.parquet``).
+
+    ``ingest`` parses the filings of a quarter (or of any number of quarters) in a process
+    pool. Periods are labels sorting in chronological order, like '2023Q4'. The analyses
+    (``position_changes``, ``wide_holdings``) are joins and group-bys over the holdings of
+    all the filers at once.
+    """
+
+    def __init__(self, root, max_workers=None):
+        self.root = root
+        self.max_workers = max_workers
+
+    def ingest(self, filings):
+        """
+        Store the holdings of ``filings``, an iterable of (filer, period, source) where the
+        source is a path or the content of the information table XML. Returns the number of
+        holdings per (filer, period).
+        """
+        filings = list(filings)
+        rows = {}
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {(filer, period): pool.submit(ingest_filing, self.root, filer, period, source)
+                       for filer, period, source in filings}
+            for key, future in futures.items():
+                try:
+                    rows[key] = future.result()
+                except Exception as e:
+                    print(f"Failed to parse the {key[1]} filing of {key[0]}: {e}")
+        return rows
+
+    def load(self, filers=None, periods=None, columns=None):
+        """Holdings of the filers and periods (all by default), with filer and period columns."""
+        filters = []
+        if filers is not None:
+            filters.append(('filer', 'in', [str(filer) for filer in filers]))
+        if periods is not None:
+            filters.append(('period', 'in', [str(period) for period in periods]))
+        df = pd.read_parquet(self.root, columns=columns and list(columns) + ['filer', 'period'],
+                             filters=filters or None, partitioning=PARTITIONING)
+        return df
+
+    def holdings(self, filer, period, scale=1000):
+        """Holdings of one filing per issuer, like the notebook's parse13f."""
+        return aggregate_holdings(self.load([filer], [period]), scale)
+
+
+def _positions(holdings, value_columns):
+    # One row per (filer, period, cusip), the issuer name of the last row
+    keys = ['filer', 'period', 'cusip']
+    df = holdings.astype({column: float for column in value_columns})
+    return df.groupby(keys, as_index=False, sort=False).agg(
+        {'nameOfIssuer': 'last', **{column: 'sum' for column in value_columns}})
+
+
+def position_changes(holdings, value_columns=('sharesAmount', 'value')):
+    """
+    Change of every position between consecutive periods of each filer: one row per
+    (filer, period, cusip) held in the period or in the previous one, with the previous
+    and current amounts, their difference and a status (new, closed, increased, decreased
+    or unchanged). Computed for all the filers with one outer join of the positions on
+    the positions of the previous period.
+    """
+    value_columns = list(value_columns)
+    positions = _positions(holdings, value_columns)
+    periods = np.sort(positions['period'].unique())
+    positions['position'] = np.searchsorted(periods, positions['period'])
+
+    previous = positions.assign(position=positions['position'] + 1)
+    previous = previous[previous['position'] < len(periods)].drop(columns='period')
+    current = positions[positions['position'] > 0].drop(columns='period')
+    changes = pd.merge(previous, current, on=['filer', 'position', 'cusip'], how='outer', suffixes=('_previous', ''))
+    changes['period'] = periods[changes['position']]
+    changes['previous_period'] = periods[changes['position'] - 1]
+    changes['nameOfIssuer'] = changes['nameOfIssuer'].fillna(changes['nameOfIssuer_previous'])
+
+    # Only filers that filed in both periods have changes
+    filed = pd.MultiIndex.from_frame(positions[['filer', 'position']].drop_duplicates())
+    both = pd.MultiIndex.from_arrays([changes['filer'], changes['position']]).isin(filed) & \
+        pd.MultiIndex.from_arrays([changes['filer'], changes['position'] - 1]).isin(filed)
+    changes = changes[both]
+
+    for column in value_columns:
+        changes[f'{column}_change'] = changes[column].fillna(0) - changes[f'{column}_previous'].fillna(0)
+    amount, before = changes[value_columns[0]], changes[f'{value_columns[0]}_previous']
+    changes['status'] = np.select(
+        [before.isna(), amount.isna(), amount > before, amount < before],
+        ['new', 'closed', 'increased', 'decreased'], 'unchanged')
+
+    columns = ['filer', 'previous_period', 'period', 'cusip', 'nameOfIssuer'] + \
+        [f'{column}{suffix}' for column in value_columns for suffix in ('_previous', '', '_change')] + ['status']
+    return changes[columns].sort_values(['filer', 'period', 'cusip']).reset_index(drop=True)
+
+
+def wide_holdings(holdings, labels=None, scale=1000):
+    """
+    Holdings of one filer with one column per period for the value, the shares and the
+    percentage of the portfolio (``value_Q423``, ``sharesAmount_Q423``, ``inv_perc_Q423``).
+    ``labels`` maps the periods to the column suffixes, latest period first by default.
+    """
+    positions = _positions(holdings, NUMERIC_COLUMNS)
+    positions[NUMERIC_COLUMNS] = positions[NUMERIC_COLUMNS] / scale
+    positions['inv_perc'] = positions['value'] / positions.groupby('period')['value'].transform('sum') * 100
+    labels = labels or {period: period for period in sorted(positions['period'].unique(), reverse=True)}
+
+    names = positions.groupby('cusip')['nameOfIssuer'].last()
+    wide = positions.pivot_table(index='cusip', columns='period', values=['value', 'sharesAmount', 'inv_perc'],
+                                 aggfunc='sum')
+    wide.columns = [f'{column}_{labels[period]}' for column, period in wide.columns]
+    order = [f'{column}_{label}' for label in labels.values() for column in ['value', 'sharesAmount', 'inv_perc']]
+    wide = wide.reindex(columns=order)
+    wide.insert(0, 'nameOfIssuer', names.reindex(wide.index))
+    return wide.reset_index()[['nameOfIssuer', 'cusip'] + order].sort_values(['nameOfIssuer', 'cusip'],
+                                                                              ignore_index=True)
+
+
+def changed(frame):
+    """True for the rows with more than one distinct value (NaN skipped), like apply(nunique) > 1."""
+    return frame.max(axis=1) > frame.min(axis=1)
@@ -2,12 +2,13 @@
 
 import streamlit as st
 import pandas as pd
-import numpy as np
-import json
 import os
 import plotly.express as px
 import plotly.graph_objects as go
-from collections import defaultdict
+
+from compute_service import DashboardService
+from plotting import add_line_traces
+from profiling import RerunProfiler
 
 # Set page configuration
 st.set_page_config(
@@ -16,65 +17,38 @@ st.set_page_config(
     layout="wide"
 )
 
-# Function to load portfolio data
-@st.cache_data
-def load_portfolio_data():
-    try:
-        with open("portfolio.json", "r") as f:
-            portfolio_data = json.load(f)
-        return portfolio_data
-    except FileNotFoundError:
-        st.error("portfolio.json file not found in the current directory.")
-        st.info("Current working directory: " + os.getcwd())
-        return {}
-
-# Function to load price data
-@st.cache_data
-def load_price_data():
-    try:
-        price_data = pd.read_csv("prices.csv")
-        price_data['date'] = pd.to_datetime(price_data['date'])
-        price_data.set_index('date', inplace=True)
-        return price_data
-    except FileNotFoundError:
-        st.error("prices.csv file not found in the current directory.")
-        st.info("Current working directory: " + os.getcwd())
-        return pd.DataFrame()
-
-# Function to load currency data
-@st.cache_data
-def load_currency_data():
-    try:
-        with open("currencies.json", "r") as f:
-            currency_data = json.load(f)
-        return currency_data
-    except FileNotFoundError:
-        st.error("currencies.json file not found in the current directory.")
-        st.info("Current working directory: " + os.getcwd())
-        return {}
+# Opt-in timing of the blocks of the page, to find what makes a rerun slow: open the app
+# with ?profile=1 (or ?profile=calls to add a cProfile report), or set DASHBOARD_PROFILE
+profile_mode = st.query_params.get('profile') or os.getenv('DASHBOARD_PROFILE')
+profiler = RerunProfiler(enabled=bool(profile_mode) and profile_mode != '0', profile_calls=profile_mode == 'calls')
+
+# Headless compute service, shared by every session of this process: it watches the
+# data files in the background and keeps the derived metrics ready to be served
+@st.cache_resource
+def get_dashboard_service():
+    return DashboardService(os.getcwd()).start()
 
 # Load data
 try:
-    portfolio_data = load_portfolio_data()
-    price_data = load_price_data()
-    currency_data = load_currency_data()
-
-    # Convert portfolio data to DataFrame
-    portfolio_df = pd.DataFrame([
-        {
-            'Asset': asset,
-            'Name': details.get('name', ''),
-            'Type': details.get('type', ''),
-            'Quantity': details.get('quantity', 0),
-            'Currency': details.get('currency', ''),
-            'Last Price': details.get('last_price', 0),
-            'Change (%)': details.get('change_perc', 0),
-            'Total Value in Main Cur': details.get('total_value_in_main_currency', 0),
-            'PnL in Main Cur': details.get('pnl_in_main_currency', 0),
-            'Weight (%)': details.get('weight', 0)
-        }
-        for asset, details in portfolio_data.items()
-    ])
+    with profiler.section('Load data'):
+        dashboard_service = get_dashboard_service()
+        snapshot = dashboard_service.snapshot()
+
+    if snapshot.refresh_error:
+        st.warning(f"Showing the data of {pd.Timestamp(snapshot.refreshed_at, unit='s'):%Y-%m-%d %H:%M:%S} UTC, "
+                   f"the last refresh failed: {snapshot.refresh_error}")
+
+    for file_name in snapshot.missing_files:
+        st.error(f"{file_name} file not found in the current directory.")
+        st.info("Current working directory: " + os.getcwd())
+
+    portfolio_data = snapshot.portfolio_data
+    price_data = snapshot.price_data
+    currency_data = snapshot.currency_data
+    exposure_engine = snapshot.exposure_engine
+
+    # Portfolio data as a DataFrame
+    portfolio_df = snapshot.portfolio_df
 
     # Display header with refresh button
     header_col1, header_col2 = st.columns([0.85, 0.15])
@@ -82,23 +56,22 @@ try:
         st.title("My Portfolio 360 Dashboard")
     with header_col2:
         if st.button("🔄 Refresh", help="Refresh dashboard data"):
-            # Clear the cache to reload fresh data
-            st.cache_data.clear()
+            # Rebuild whatever changed on disk without waiting for the background poll
+            dashboard_service.refresh()
             st.rerun()
 
     # Create 2 columns for the pie charts
     col1, col2 = st.columns([0.2,0.8])
 
-    with col1:
-        # Calculate total portfolio value and changes
-        total_value = sum(details.get('total_value_in_main_currency', 0) for details in portfolio_data.values())
-        total_pnl = sum(details.get('pnl_in_main_currency', 0) for details in portfolio_data.values())
-
-        # Calculate daily change value
-        total_previous = sum(details.get('previous_price', 0) * details.get('quantity', 0) /
-                             currency_data[details.get('currency', 'EUR')]['rate_to_main']
-                             for details in portfolio_data.values())
-        daily_change = ((total_value - total_previous) / total_previous) * 100 if total_previous else 0
+    with col1, profiler.section('Headline metrics and gauges'):
+        # Total portfolio value, P&L and daily change from the vectorized valuation of the book
+        valuation = snapshot.valuation
+        if valuation is not None:
+            total_value, total_pnl = valuation.total_value, valuation.total_pnl
+            daily_change = valuation.daily_change
+        else:
+            st.warning(f"Error valuing the portfolio: {snapshot.valuation_error}")
+            total_value, total_pnl, daily_change = 0.0, 0.0, 0.0
 
         # Create 3 columns for centering the metrics
         left_spacer, center_col, right_spacer = st.columns([1,2, 1])
@@ -109,119 +82,15 @@ try:
                       delta=f"{(total_pnl / total_value) * 100:.2f}%" if total_value else "0%")
             st.metric(label="Number of Assets", value=f"{len(portfolio_data)}")
 
-            # Get weights from portfolio data
-            weights = np.array([asset_data['weight'] for asset, asset_data in portfolio_data.items()])
-
-            # Calculate daily returns for all assets
-            returns = price_data.pct_change().dropna()
-
-
-            # 1. Herfindahl-based PDI
-            def calculate_herfindahl_pdi(weights):
-                try:
-                    if len(weights) == 0:
-                        return 0.0  # No diversification if no weights
-
-                    # Normalize weights to sum to 1
-                    normalized_weights = weights / weights.sum()
-
-                    # Calculate Herfindahl index
-                    hi = np.sum(normalized_weights ** 2)
-
-                    return 1 - hi
-                except Exception as e:
-                    st.warning(f"Error calculating Herfindahl-based PDI: {e}")
-                    return 0.0
-
-
-            # 2. Diversification Ratio
-            def calculate_diversification_ratio(weights, returns_data):
-                try:
-                    # Filter returns data to include only assets in the portfolio
-                    assets = list(portfolio_data.keys())
-
-                    # Check which assets have price data
-                    available_assets = [asset for asset in assets if asset in returns_data.columns]
-
-                    if not available_assets:
-                        return 1.0  # Default value if no assets have price data
-
-                    # Filter weights to include only assets with price data
-                    asset_indices = [i for i, asset in enumerate(assets) if asset in available_assets]
-                    filtered_weights = weights[asset_indices]
-
-                    # Normalize weights to sum to 1
-                    filtered_weights = filtered_weights / filtered_weights.sum()
-
-                    # Filter returns data
-                    filtered_returns = returns_data[available_assets].copy().dropna()
-
-                    if filtered_returns.empty:
-                        return 1.0  # Default value if no data
-
-                    # Calculate individual volatilities (standard deviations)
-                    individual_volatilities = filtered_returns.std() * np.sqrt(252)  # Annualized
-
-                    # Calculate covariance matrix
-                    cov_matrix = filtered_returns.cov() * 252  # Annualized
-
-                    # Portfolio volatility
-                    port_volatility = np.sqrt(filtered_weights.T @ cov_matrix.values @ filtered_weights)
-
-                    # Weighted average individual volatility
-                    avg_individual_vol = np.sum(filtered_weights * individual_volatilities.values)
-
-                    return avg_individual_vol / port_volatility if port_volatility > 0 else 1.0
-                except Exception as e:
-                    st.warning(f"Error calculating Diversification Ratio: {e}")
-                    return 1.0
-
-
-            # 3. Effective Number of Bets
-            def calculate_effective_bets(weights, returns_data):
-                try:
-                    # Filter returns data to include only assets in the portfolio
-                    assets = list(portfolio_data.keys())
-
-                    # Check which assets have price data
-                    available_assets = [asset for asset in assets if asset in returns_data.columns]
-
-                    if not available_assets:
-                        return 1.0  # Default value if no assets have price data
-
-                    # Filter weights to include only assets with price data
-                    asset_indices = [i for i, asset in enumerate(assets) if asset in available_assets]
-                    filtered_weights = weights[asset_indices]
-
-                    # Normalize weights to sum to 1
-                    filtered_weights = filtered_weights / filtered_weights.sum()
-
-                    # Filter returns data
-                    filtered_returns = returns_data[available_assets].copy().dropna()
-
-                    if filtered_returns.empty:
-                        return 1.0  # Default value if no data
-
-                    # Calculate correlation matrix
-                    corr_matrix = filtered_returns.corr()
-
-                    # Calculate ENB denominator
-                    denominator = 0
-                    n = len(filtered_weights)
-                    for i in range(n):
-                        for j in range(n):
-                            denominator += filtered_weights[i] * filtered_weights[j] * corr_matrix.iloc[i, j]
-
-                    return 1 / denominator if denominator > 0 else 1.0
-                except Exception as e:
-                    st.warning(f"Error calculating Effective Number of Bets: {e}")
-                    return 1.0
-
-
-            # Calculate the metrics
-            herfindahl_pdi = calculate_herfindahl_pdi(weights)
-            div_ratio = calculate_diversification_ratio(weights, returns)
-            enb = calculate_effective_bets(weights, returns)
+            # Diversification metrics precomputed by the compute service
+            stats = snapshot.stats
+            if stats is not None:
+                herfindahl_pdi = stats.herfindahl_pdi()
+                div_ratio = stats.diversification_ratio()
+                enb = stats.effective_bets()
+            else:
+                st.warning(f"Error calculating diversification metrics: {snapshot.stats_error}")
+                herfindahl_pdi, div_ratio, enb = 0.0, 1.0, 1.0
 
             # Create gauge charts for each metric
 
@@ -294,14 +163,15 @@ try:
     with col2:
 
         # Display the DataFrame
-        st.dataframe(
-            portfolio_df,
-            hide_index=True,
-            column_config={
-                'Weight (%)': st.column_config.NumberColumn(format="%.2f%%"),
-                'Last Price': st.column_config.NumberColumn(format="%.2f")
-            }
-        )
+        with profiler.section('Holdings table'):
+            st.dataframe(
+                portfolio_df,
+                hide_index=True,
+                column_config={
+                    'Weight (%)': st.column_config.NumberColumn(format="%.2f%%"),
+                    'Last Price': st.column_config.NumberColumn(format="%.2f")
+                }
+            )
 
         tab1, tab2, tab3 = st.tabs(["Allocations", "Exposures", "Correlations"])
 
@@ -311,7 +181,7 @@ try:
         with tab2:
             col_countries, col_sectors = st.columns(2)
 
-        with tab3:
+        with tab3, profiler.section('Correlations'):
 
             # Add dropdown for selecting window size
             window_options = [10, 30, 90, 180, 352, 720]
@@ -321,14 +191,8 @@ try:
                 index=2  # Default to 90 days (index 2)
             )
 
-            # Get all assets from price_data
-            assets = price_data.columns.tolist()
-
-            # Filter out assets with too many missing values
-            valid_assets = []
-            for asset in assets:
-                if price_data[asset].count() >= selected_window:  # Ensure enough data for selected window
-                    valid_assets.append(asset)
+            # Filter out assets with too many missing values (ensure enough data for selected window)
+            valid_assets = price_data.columns[price_data.count() >= selected_window].tolist()
 
             # Create checkboxes for asset selection
             st.write("Select assets to include in correlation analysis:")
@@ -352,47 +216,40 @@ try:
             if len(selected_asset_list) < 2:
                 st.warning("Please select at least two assets to show correlations.")
             else:
-                # Generate pairs from selected assets
-                import itertools
-                asset_pairs = list(itertools.combinations(selected_asset_list, 2))
+                # All pairwise rolling correlations in one pass, cached per (assets, window)
+                with profiler.section('Rolling correlations'):
+                    rolling_corrs = snapshot.correlation_engine.rolling(selected_asset_list, selected_window)
+                num_pairs = rolling_corrs.shape[1]
 
-                # Create a single plot for selected correlations
-                num_pairs = len(asset_pairs)
+                # Keep the pairs with some correlation data, with their mean over the whole history
+                rolling_corrs = rolling_corrs.loc[:, rolling_corrs.notna().any()]
+                mean_correlations = rolling_corrs.mean()
 
                 # Create a figure for all correlations
                 fig = go.Figure()
 
-                # Dictionary to store mean correlations for the legend
-                mean_correlations = {}
-
-                # Add each asset pair correlation to the figure
-                for pair_idx, (asset1, asset2) in enumerate(asset_pairs):
-                    # Filter out NaN values for the selected assets
-                    valid_data = price_data[[asset1, asset2]].dropna()
-
-                    if len(valid_data) >= selected_window:  # Ensure we have enough data for the selected window
-                        rolling_corr = valid_data[asset1].rolling(window=selected_window).corr(valid_data[asset2])
-
-                        # Create a DataFrame for plotting
-                        corr_df = pd.DataFrame({
-                            'date': rolling_corr.index,
-                            'correlation': rolling_corr.values
-                        }).dropna()
-
-                        if not corr_df.empty:
-                            # Calculate mean correlation
-                            mean_corr = rolling_corr.mean()
-                            mean_correlations[f"{asset1} vs {asset2}"] = mean_corr
-
-                            # Add line to the plot
-                            fig.add_trace(
-                                go.Scatter(
-                                    x=corr_df['date'],
-                                    y=corr_df['correlation'],
-                                    mode='lines',
-                                    name=f"{asset1} vs {asset2} (Mean: {mean_corr:.2f})"
-                                )
-                            )
+                if not rolling_corrs.empty:
+                    # Zoom: the selected dates are sliced from the full-resolution data
+                    # before downsampling, so narrow ranges show every point
+                    dates = rolling_corrs.index[rolling_corrs.notna().any(axis=1)]
+                    first_date, last_date = dates[0].to_pydatetime(), dates[-1].to_pydatetime()
+                    if first_date < last_date:
+                        zoom_start, zoom_end = st.slider(
+                            "Zoom into dates:",
+                            min_value=first_date,
+                            max_value=last_date,
+                            value=(first_date, last_date),
+                            format="YYYY-MM-DD"
+                        )
+                        rolling_corrs = rolling_corrs.loc[zoom_start:zoom_end]
+
+                    # Add each asset pair correlation to the figure, downsampled to screen resolution
+                    add_line_traces(
+                        fig,
+                        rolling_corrs,
+                        [f"{asset1} vs {asset2} (Mean: {mean_correlations[(asset1, asset2)]:.2f})"
+                         for asset1, asset2 in rolling_corrs.columns]
+                    )
 
                 # Only display the plot if we have valid pairs
                 if len(fig.data) > 0:
@@ -423,7 +280,7 @@ try:
                 else:
                     st.warning("No valid correlation data found for the selected asset pairs.")
 
-    with col_weights:
+    with col_weights, profiler.section('Asset allocation'):
 
         # Create DataFrame directly from portfolio data
         asset_weights_df = pd.DataFrame([
@@ -440,94 +297,38 @@ try:
         )
         st.plotly_chart(fig_assets, use_container_width=True)
 
-    with col_types:
+    with col_types, profiler.section('Asset types'):
 
-        portfolio_df = pd.DataFrame([
-            {'Asset': asset, 'type': asset_data['type'], 'Weight': asset_data.get('weight', 0)}
-            for asset, asset_data in portfolio_data.items()
-        ])
-
-        # Group by currency and sum the weights
-        types_weights_df = portfolio_df.groupby('type')['Weight'].sum().reset_index()
+        # Sum of the weights per asset type
+        types_weights_df = exposure_engine.breakdown('type', by='weight', name='type')
 
         # Create pie chart using Plotly
         fig_assets = px.pie(
             types_weights_df,
-            values='Weight',
+            values='value',
             names='type',
             title='Portfolio Asset Allocation'
         )
         st.plotly_chart(fig_assets, use_container_width=True)
 
-    with col_currencies:
+    with col_currencies, profiler.section('Currency exposure'):
 
-        portfolio_df = pd.DataFrame([
-            {'Asset': asset, 'Currency': asset_data['currency'], 'Weight': asset_data.get('weight', 0)}
-            for asset, asset_data in portfolio_data.items()
-        ])
-
-        # Group by currency and sum the weights
-        currency_weights_df = portfolio_df.groupby('Currency')['Weight'].sum().reset_index()
+        # Sum of the weights per currency
+        currency_weights_df = exposure_engine.breakdown('currency', by='weight', name='Currency')
 
         # Create pie chart using Plotly
         fig_assets = px.pie(
             currency_weights_df,
-            values='Weight',
+            values='value',
             names='Currency',
             title='Currency Exposure'
         )
         st.plotly_chart(fig_assets, use_container_width=True)
 
-    with col_countries:
-
-        country_exposure = defaultdict(float)
-        total_portfolio_value = 0
-
-        for symbol, details in portfolio_data.items():
-            # Get the position value in main currency
-            position_value = details.get('total_value_in_main_currency', 0)
-            total_portfolio_value += position_value
-
-            # Handle both simple sector strings and sector dictionaries
-            country_data = details.get('country_exposure', '')
-
-            if isinstance(country_data, str):
-                # Direct sector assignment
-                country_exposure[country_data] += position_value
-            elif isinstance(country_data, dict):
-                # For ETFs with sector breakdown
-                for country, allocation in country_data.items():
-                    # Get the equity percentage and convert to decimal
-                    equity_pct = float(allocation.get('Relative_to_Category', 0)) / 100
-                    # Add weighted position value to sector
-                    country_exposure[country] += position_value * equity_pct
-
-        df_country_exposure = pd.DataFrame(
-            {'country': list(country_exposure.keys()), 'value': list(country_exposure.values())})
-
-        # Calculate percentages
-        total_value = df_country_exposure['value'].sum()
-        df_country_exposure['percentage'] = df_country_exposure['value'] / total_value * 100
-
-        # Group countries with less than 3% into "Other"
-        mask = df_country_exposure['percentage'] < 3
-        other_small = df_country_exposure[mask]['value'].sum()
-        df_country_exposure = pd.concat([
-            df_country_exposure[~mask],
-            pd.DataFrame({'country': ['Other'], 'value': [other_small]}) if other_small > 0 else pd.DataFrame()
-        ]).reset_index(drop=True)
-
-        # Sort by value in descending order
-        df_country_exposure = df_country_exposure.sort_values('value', ascending=False)
-
-        # If still more than 4 countries, keep top 4 and group rest into "Other"
-        if len(df_country_exposure) > 4:
-            top_4 = df_country_exposure.head(4)
-            other_sum = df_country_exposure.iloc[4:]['value'].sum()
-            df_country_exposure = pd.concat([
-                top_4,
-                pd.DataFrame({'country': ['Other'], 'value': [other_sum]})
-            ]).reset_index(drop=True)
+    with col_countries, profiler.section('Country exposure'):
+
+        # Look-through country exposure: countries under 3% and beyond the top 4 go to "Other"
+        df_country_exposure = exposure_engine.breakdown('country', min_percentage=3, top_n=4)
 
         # Create pie chart using Plotly
         fig_assets = px.pie(
@@ -538,56 +339,10 @@ try:
         )
         st.plotly_chart(fig_assets, use_container_width=True)
 
-    with col_sectors:
-
-        sector_exposure = defaultdict(float)
-        total_portfolio_value = 0
-
-        for symbol, details in portfolio_data.items():
-            # Get the position value in main currency
-            position_value = details.get('total_value_in_main_currency', 0)
-            total_portfolio_value += position_value
-
-            # Handle both simple sector strings and sector dictionaries
-            sector_data = details.get('sector', '')
-
-            if isinstance(sector_data, str):
-                # Direct sector assignment
-                sector_exposure[sector_data] += position_value
-            elif isinstance(sector_data, dict):
-                # For ETFs with sector breakdown
-                for sector, allocation in sector_data.items():
-                    # Get the equity percentage and convert to decimal
-                    equity_pct = float(allocation.get('Relative_to_Category', 0)) / 100
-                    # Add weighted position value to sector
-                    sector_exposure[sector] += position_value * equity_pct
-
-        df_sector_exposure = pd.DataFrame(
-            {'sector': list(sector_exposure.keys()), 'value': list(sector_exposure.values())})
-
-        # Calculate percentages
-        total_value = df_sector_exposure['value'].sum()
-        df_sector_exposure['percentage'] = df_sector_exposure['value'] / total_value * 100
-
-        # Group sectors with less than 3% into "Other"
-        mask = df_sector_exposure['percentage'] < 3
-        other_small = df_sector_exposure[mask]['value'].sum()
-        df_sector_exposure = pd.concat([
-            df_sector_exposure[~mask],
-            pd.DataFrame({'sector': ['Other'], 'value': [other_small]}) if other_small > 0 else pd.DataFrame()
-        ]).reset_index(drop=True)
-
-        # Sort by value in descending order
-        df_sector_exposure = df_sector_exposure.sort_values('value', ascending=False)
-
-        # If still more than 4 sectors, keep top5 and group rest into "Other"
-        if len(df_sector_exposure) > 5:
-            top_5 = df_sector_exposure.head(5)
-            other_sum = df_sector_exposure.iloc[5:]['value'].sum()
-            df_sector_exposure = pd.concat([
-                top_5,
-                pd.DataFrame({'sector': ['Other'], 'value': [other_sum]})
-            ]).reset_index(drop=True)
+    with col_sectors, profiler.section('Sector exposure'):
+
+        # Look-through sector exposure: sectors under 3% and beyond the top 5 go to "Other"
+        df_sector_exposure = exposure_engine.breakdown('sector', min_percentage=3, top_n=5)
 
         # Create pie chart using Plotly
         fig_assets = px.pie(
@@ -601,3 +356,19 @@ try:
 except Exception as e:
     st.error(f"An error occurred: {e}")
     st.error("Please make sure all required files (portfolio.json, prices.csv, currencies.json) are in the correct location.")
+
+if profiler.enabled:
+    profiler.stop()
+    with st.expander("⏱️ Rerun profile", expanded=True):
+        st.caption(f"Whole rerun: {profiler.total * 1000:,.1f} ms")
+        st.dataframe(
+            profiler.frame(),
+            hide_index=True,
+            column_config={
+                'Time (ms)': st.column_config.NumberColumn(format="%.1f"),
+                'Share (%)': st.column_config.NumberColumn(format="%.1f%%")
+            }
+        )
+        call_stats = profiler.call_stats()
+        if call_stats:
+            st.code(call_stats, language=None)
@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field, replace
+
+import pandas as pd
+
+from exposures import ExposureEngine
+from portfolio_stats import PortfolioStats
+from price_store import PriceStore, file_fingerprint
+from rolling_correlation import RollingCorrelationEngine
+from valuation import PortfolioValuation
+
+logger = logging.getLogger(__name__)
+
+PORTFOLIO_FILE = 'portfolio.json'
+PRICES_FILE = 'prices.csv'
+CURRENCIES_FILE = 'currencies.json'
+
+
+@dataclass(frozen=True)
+class DashboardSnapshot:
+    # Inputs, as of the fingerprints below
+    portfolio_data: dict
+    price_data: pd.DataFrame
+    currency_data: dict
+    fingerprints: dict
+    missing_files: list = field(default_factory=list)
+    # Precomputed results served to every session
+    portfolio_df: pd.DataFrame = None
+    stats: PortfolioStats = None
+    stats_error: str = None
+    exposure_engine: ExposureEngine = None
+    correlation_engine: RollingCorrelationEngine = None
+    valuation: PortfolioValuation = None
+    valuation_error: str = None
+    refreshed_at: float = 0.0
+    # Last failed background refresh since this snapshot was built, the snapshot is then stale
+    refresh_error: str = None
+
+
+def _portfolio_table(portfolio_data):
+    return pd.DataFrame([
+        {
+            'Asset': asset,
+            'Name': details.get('name', ''),
+            'Type': details.get('type', ''),
+            'Quantity': details.get('quantity', 0),
+            'Currency': details.get('currency', ''),
+            'Last Price': details.get('last_price', 0),
+            'Change (%)': details.get('change_perc', 0),
+            'Total Value in Main Cur': details.get('total_value_in_main_currency', 0),
+            'PnL in Main Cur': details.get('pnl_in_main_currency', 0),
+            'Weight (%)': details.get('weight', 0)
+        }
+        for asset, details in portfolio_data.items()
+    ])
+
+
+def _load_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class DashboardService:
+    """
+    Headless compute layer of the dashboard, one per process and shared by all sessions.
+
+    It owns the portfolio, price and currency data and everything derived from them.
+    A background thread polls the file fingerprints and rebuilds only what depends on
+    the files that changed; sessions just read the latest immutable snapshot.
+    """
+
+    def __init__(self, base_dir='.', poll_interval=5.0, refresh_interval=None):
+        self.base_dir = base_dir
+        self.poll_interval = poll_interval
+        # Optional forced rebuild on a schedule, in seconds (e.g. after a nightly data prep)
+        self.refresh_interval = refresh_interval
+        self.price_store = PriceStore(self._path(PRICES_FILE))
+
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _path(self, file_name):
+        return os.path.join(self.base_dir, file_name)
+
+    def _fingerprints(self):
+        return {name: file_fingerprint(self._path(name))
+                for name in (PORTFOLIO_FILE, PRICES_FILE, CURRENCIES_FILE)}
+
+    # ------------------------------------------------------------------
+    # Computation
+    # ------------------------------------------------------------------
+
+    def _build(self, previous, fingerprints, force=False):
+        def changed(name):
+            return force or previous is None or previous.fingerprints.get(name) != fingerprints[name]
+
+        missing = [name for name, fingerprint in fingerprints.items() if fingerprint is None]
+
+        if changed(PORTFOLIO_FILE):
+            portfolio_data = _load_json(self._path(PORTFOLIO_FILE)) if fingerprints[PORTFOLIO_FILE] else {}
+            portfolio_df = _portfolio_table(portfolio_data)
+            exposure_engine = ExposureEngine(portfolio_data)
+        else:
+            portfolio_data, portfolio_df = previous.portfolio_data, previous.portfolio_df
+            exposure_engine = previous.exposure_engine
+
+        if changed(PRICES_FILE):
+            price_data = self.price_store.load() if fingerprints[PRICES_FILE] else pd.DataFrame()
+            correlation_engine = RollingCorrelationEngine(price_data)
+        else:
+            price_data, correlation_engine = previous.price_data, previous.correlation_engine
+
+        if changed(CURRENCIES_FILE):
+            currency_data = _load_json(self._path(CURRENCIES_FILE)) if fingerprints[CURRENCIES_FILE] else {}
+        else:
+            currency_data = previous.currency_data
+
+        if changed(PORTFOLIO_FILE) or changed(PRICES_FILE):
+            weights = [details.get('weight', 0) for details in portfolio_data.values()]
+            try:
+                stats, stats_error = PortfolioStats(price_data, portfolio_data.keys(), weights), None
+            except Exception as e:
+                stats, stats_error = None, str(e)
+        else:
+            stats, stats_error = previous.stats, previous.stats_error
+
+        if changed(PORTFOLIO_FILE) or changed(CURRENCIES_FILE):
+            try:
+                # Positions without a currency are taken in EUR, the main currency of the data prep
+                valuation = PortfolioValuation.from_portfolio(portfolio_data, currency_data, default_currency='EUR')
+                valuation_error = None
+            except Exception as e:
+                valuation, valuation_error = None, str(e)
+        else:
+            valuation, valuation_error = previous.valuation, previous.valuation_error
+
+        return DashboardSnapshot(
+            portfolio_data=portfolio_data,
+            price_data=price_data,
+            currency_data=currency_data,
+            fingerprints=fingerprints,
+            missing_files=missing,
+            portfolio_df=portfolio_df,
+            stats=stats,
+            stats_error=stats_error,
+            exposure_engine=exposure_engine,
+            correlation_engine=correlation_engine,
+            valuation=valuation,
+            valuation_error=valuation_error,
+            refreshed_at=time.time(),
+        )
+
+    def refresh(self, force=False):
+        """Rebuild the parts of the snapshot whose files changed; returns the snapshot."""
+        with self._lock:
+            fingerprints = self._fingerprints()
+            previous = self._snapshot
+            if force or previous is None or previous.fingerprints != fingerprints:
+                self._snapshot = self._build(previous, fingerprints, force)
+            return self._snapshot
+
+    def snapshot(self):
+        """The latest snapshot, built on first use."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.refresh()
+        return snapshot
+
+    # ------------------------------------------------------------------
+    # Background refresh
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        last_forced = time.time()
+        while not self._stop.wait(self.poll_interval):
+            force = self.refresh_interval is not None and time.time() - last_forced >= self.refresh_interval
+            try:
+                self.refresh(force=force)
+            except Exception as e:
+                # Keep serving the last good snapshot, e.g. while a file is half written
+                logger.exception("Dashboard refresh failed")
+                with self._lock:
+                    if self._snapshot is not None:
+                        self._snapshot = replace(self._snapshot, refresh_error=str(e))
+                continue
+            if force:
+                last_forced = time.time()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='dashboard-refresh', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Exposure dimension -> key of the position details in portfolio.json
+DIMENSIONS = {
+    'country': 'country_exposure',
+    'sector': 'sector',
+    'currency': 'currency',
+    'type': 'type',
+}
+
+
+class ExposureEngine:
+    """
+    Look-through exposures of the portfolio compiled into sparse matrices.
+
+    For every dimension (countries, sectors, currencies, types) the positions are
+    compiled once into a sparse label x position matrix holding the fraction of each
+    position allocated to each label: 1 for a plain string (a stock's sector), the
+    ``Relative_to_Category`` percentages for an ETF breakdown. Any breakdown is then a
+    single sparse matrix-vector product with the position values or weights.
+    """
+
+    def __init__(self, portfolio_data, dimensions=DIMENSIONS):
+        self.assets = list(portfolio_data.keys())
+        details = list(portfolio_data.values())
+
+        self.values = np.array([d.get('total_value_in_main_currency', 0) for d in details], dtype=float)
+        self.weights = np.array([d.get('weight', 0) for d in details], dtype=float)
+
+        self.labels = {}
+        self._matrices = {}
+        for dimension, key in dimensions.items():
+            self.labels[dimension], self._matrices[dimension] = self._compile(details, key)
+
+    @staticmethod
+    def _compile(details, key):
+        label_index = {}
+        rows, cols, data = [], [], []
+
+        for position, detail in enumerate(details):
+            exposure = detail.get(key, '')
+
+            if isinstance(exposure, str):
+                # Direct assignment, the whole position goes to one label
+                items = [(exposure, 1.0)]
+            elif isinstance(exposure, dict):
+                # For ETFs with a breakdown, as a percentage of the position
+                items = [(label, float(allocation.get('Relative_to_Category', 0)) / 100)
+                         for label, allocation in exposure.items()]
+            else:
+                continue
+
+            for label, fraction in items:
+                rows.append(label_index.setdefault(label, len(label_index)))
+                cols.append(position)
+                data.append(fraction)
+
+        matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(label_index), len(details)))
+        # Duplicate (label, position) entries are summed by the conversion
+        matrix.sum_duplicates()
+        return np.array(list(label_index.keys()), dtype=object), matrix
+
+    def exposure(self, dimension, by='value'):
+        """Labels and exposure amounts of a dimension, by position 'value' or 'weight'."""
+        vector = self.values if by == 'value' else self.weights
+        return self.labels[dimension], self._matrices[dimension] @ vector
+
+    def breakdown(self, dimension, by='value', min_percentage=None, top_n=None, name=None):
+        """
+        Exposure of a dimension as a DataFrame ready for a pie chart.
+
+        Labels under ``min_percentage`` of the total are grouped into "Other", then only
+        the ``top_n`` largest entries are kept and the rest is added to "Other".
+        """
+        labels, amounts = self.exposure(dimension, by)
+        name = name or dimension
+
+        other = 0.0
+        if min_percentage is not None and len(amounts):
+            total = amounts.sum()
+            small = (amounts / total * 100 < min_percentage) if total else np.zeros(len(amounts), dtype=bool)
+            other += amounts[small].sum()
+            labels, amounts = labels[~small], amounts[~small]
+
+        # Sort by amount in descending order
+        order = np.argsort(-amounts, kind='stable')
+        labels, amounts = labels[order], amounts[order]
+
+        if top_n is not None and len(amounts) + (other > 0) > top_n:
+            # "Other" competes for the top places like any other label
+            if other > 0:
+                position = np.searchsorted(-amounts, -other, side='right')
+                labels = np.insert(labels, position, 'Other')
+                amounts = np.insert(amounts, position, other)
+                other = 0.0
+            other += amounts[top_n:].sum()
+            labels, amounts = labels[:top_n], amounts[:top_n]
+            is_other = labels == 'Other'
+            if is_other.any():
+                other += amounts[is_other].sum()
+                labels, amounts = labels[~is_other], amounts[~is_other]
+            labels, amounts = np.append(labels, 'Other'), np.append(amounts, other)
+        elif other > 0:
+            labels, amounts = np.append(labels, 'Other'), np.append(amounts, other)
+
+        return pd.DataFrame({name: labels, 'value': amounts})
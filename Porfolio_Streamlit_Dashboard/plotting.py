@@ -0,0 +1,90 @@
+import numpy as np
+import plotly.graph_objects as go
+
+# Points kept per series: about one per horizontal pixel of a wide chart
+SCREEN_POINTS = 1500
+# Above this many points in a figure, traces are drawn with WebGL
+WEBGL_THRESHOLD = 10_000
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling of several series sharing the same x.
+
+    ``x`` has shape (n,) and ``y`` shape (n, k). Returns an (n_out, k) array with the
+    positions of the points to keep for each series. The buckets are walked once and
+    every step is vectorized over the k series; NaN values are never selected unless
+    a bucket holds nothing else.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if y.ndim == 1:
+        y = y[:, None]
+    n, k = y.shape
+    if n_out >= n or n_out < 3:
+        return np.repeat(np.arange(n)[:, None], k, axis=1)
+
+    # First and last points are always kept; the middle is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty((n_out, k), dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    columns = np.arange(k)
+    a_x = np.full(k, x[0])
+    a_y = y[0].copy()
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Average point of the next bucket (the last point for the last bucket)
+        if bucket + 2 < len(edges):
+            next_start, next_end = end, edges[bucket + 2]
+            next_y = y[next_start:next_end]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                c_y = np.nansum(next_y, axis=0) / (~np.isnan(next_y)).sum(axis=0)
+            c_x = x[next_start:next_end].mean()
+        else:
+            c_x, c_y = x[-1], y[-1]
+
+        # Twice the area of the triangles (a, point, c) for every point of the bucket
+        bx = x[start:end, None]
+        by = y[start:end]
+        area = np.abs((a_x - c_x) * (by - a_y) - (a_x - bx) * (c_y - a_y))
+        area = np.where(np.isnan(area), -1.0, area)
+        best = start + np.argmax(area, axis=0)
+        selected[bucket + 1] = best
+
+        # The selected point is the anchor of the next bucket, unless it is missing
+        best_y = y[best, columns]
+        has_value = ~np.isnan(best_y)
+        a_x = np.where(has_value, x[best], a_x)
+        a_y = np.where(has_value, best_y, a_y)
+    return selected
+
+
+def add_line_traces(fig, frame, names, max_points=SCREEN_POINTS, webgl_threshold=WEBGL_THRESHOLD):
+    """
+    Add one line per column of ``frame``, downsampled to ``max_points`` with LTTB.
+
+    NaN values are left out of each line. Above ``webgl_threshold`` points in total the
+    traces are ``Scattergl`` instead of ``Scatter``.
+    """
+    values = frame.to_numpy(dtype=float)
+    if len(frame) > max_points:
+        x = frame.index.asi8 if hasattr(frame.index, 'asi8') else np.arange(len(frame))
+        positions = lttb_indices(x, values, max_points)
+    else:
+        positions = np.repeat(np.arange(len(frame))[:, None], frame.shape[1], axis=1)
+
+    series = []
+    for column in range(frame.shape[1]):
+        rows = positions[:, column]
+        y = values[rows, column]
+        keep = ~np.isnan(y)
+        series.append((frame.index[rows[keep]], y[keep]))
+
+    total_points = sum(len(y) for _, y in series)
+    trace_type = go.Scattergl if total_points > webgl_threshold else go.Scatter
+    for (x, y), name in zip(series, names):
+        if len(y):
+            fig.add_trace(trace_type(x=x, y=y, mode='lines', name=name))
+    return fig
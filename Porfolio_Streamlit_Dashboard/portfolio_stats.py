@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+
+class PortfolioStats:
+    """
+    Diversification statistics of the portfolio, computed once from the price history.
+
+    The weights are aligned to the return columns and the covariance matrix is
+    computed a single time; every metric is then derived from it with matrix operations.
+    """
+
+    def __init__(self, price_data, assets, weights, periods_per_year=252):
+        self.assets = list(assets)
+        self.weights = np.asarray(weights, dtype=float)
+        self.periods_per_year = periods_per_year
+
+        # Calculate daily returns for all assets
+        returns = price_data.pct_change().dropna()
+
+        # Keep only the assets of the portfolio that have price data (in portfolio order)
+        mask = np.array([asset in returns.columns for asset in self.assets], dtype=bool)
+        self.available_assets = [asset for asset, ok in zip(self.assets, mask) if ok]
+
+        self.filtered_weights = np.array([])
+        self.cov_matrix = np.empty((0, 0))
+        if not self.available_assets:
+            return
+
+        filtered_returns = returns[self.available_assets].dropna()
+        if filtered_returns.empty:
+            return
+
+        # Normalize the weights of the available assets to sum to 1
+        filtered_weights = self.weights[mask]
+        self.filtered_weights = filtered_weights / filtered_weights.sum()
+
+        # Annualized covariance matrix, the only O(n^2) object we build
+        self.cov_matrix = np.cov(filtered_returns.to_numpy(), rowvar=False, ddof=1).reshape(
+            len(self.available_assets), len(self.available_assets)) * periods_per_year
+
+    @property
+    def has_data(self):
+        return self.cov_matrix.size > 0
+
+    @property
+    def volatilities(self):
+        # Annualized volatility of every asset, the diagonal of the covariance matrix
+        return np.sqrt(np.diag(self.cov_matrix))
+
+    @property
+    def corr_matrix(self):
+        vol = self.volatilities
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.cov_matrix / np.outer(vol, vol)
+
+    def herfindahl_pdi(self):
+        # 1 minus the Herfindahl index of the normalized weights of all the holdings
+        if len(self.weights) == 0:
+            return 0.0
+        normalized_weights = self.weights / self.weights.sum()
+        return 1 - np.sum(normalized_weights ** 2)
+
+    def portfolio_volatility(self):
+        if not self.has_data:
+            return 0.0
+        w = self.filtered_weights
+        return float(np.sqrt(max(w @ self.cov_matrix @ w, 0.0)))
+
+    def diversification_ratio(self):
+        # Weighted average individual volatility over portfolio volatility
+        if not self.has_data:
+            return 1.0
+        port_volatility = self.portfolio_volatility()
+        avg_individual_vol = self.filtered_weights @ self.volatilities
+        return float(avg_individual_vol / port_volatility) if port_volatility > 0 else 1.0
+
+    def effective_bets(self):
+        # Effective Number of Bets: 1 / (w' C w) with C the correlation matrix
+        if not self.has_data:
+            return 1.0
+        w = self.filtered_weights
+        denominator = w @ np.nan_to_num(self.corr_matrix) @ w
+        return float(1 / denominator) if denominator > 0 else 1.0
+
+    def summary(self):
+        return pd.Series({
+            'herfindahl_pdi': self.herfindahl_pdi(),
+            'diversification_ratio': self.diversification_ratio(),
+            'effective_bets': self.effective_bets(),
+            'portfolio_volatility': self.portfolio_volatility(),
+        })
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import threading
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+# Size of the block hashed at the end of the already converted part of the CSV
+TAIL_CHECK_BYTES = 64 * 1024
+
+
+def file_fingerprint(path):
+    # (modification time, size) of a file, None if it does not exist
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _hash_block(path, end, size=TAIL_CHECK_BYTES):
+    # Hash of the `size` bytes before `end`, used to check that a grown file kept its prefix
+    with open(path, 'rb') as f:
+        f.seek(max(0, end - size))
+        return hashlib.sha1(f.read(end - max(0, end - size))).hexdigest()
+
+
+class PriceStore:
+    """
+    Columnar copy of ``prices.csv`` stored as memory-mapped Arrow IPC segments.
+
+    The CSV is converted once. When only new dates are appended to it, just the new
+    rows are parsed and written as an extra segment; any other change of the file
+    rebuilds the store. Loading memory-maps the segments instead of re-parsing the CSV.
+    """
+
+    def __init__(self, csv_path='prices.csv', store_dir=None, index_col='date', max_segments=16):
+        self.csv_path = csv_path
+        self.store_dir = store_dir or os.path.join(os.path.dirname(os.path.abspath(csv_path)), '.price_store')
+        self.index_col = index_col
+        self.max_segments = max_segments
+        self._manifest_path = os.path.join(self.store_dir, 'manifest.json')
+        self._loaded = (None, None)
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Manifest and segments
+    # ------------------------------------------------------------------
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_manifest(self, manifest):
+        tmp_path = self._manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _write_segment(self, table, generation, number):
+        name = f'prices-g{generation}-{number:05d}.arrow'
+        # Uncompressed IPC files can be memory-mapped without a copy
+        with pa.OSFile(os.path.join(self.store_dir, name), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return name
+
+    def _read_segments(self, manifest):
+        tables = []
+        for name in manifest['segments']:
+            source = pa.memory_map(os.path.join(self.store_dir, name), 'r')
+            tables.append(pa.ipc.open_file(source).read_all())
+        return pa.concat_tables(tables) if tables else None
+
+    def _parse_csv(self, data, columns=None):
+        # Fast path: Arrow's multithreaded CSV reader, with the price columns forced to
+        # float64 so that a short tail with empty columns keeps the same schema
+        column_types = {self.index_col: pa.timestamp('ns')}
+        if columns is not None:
+            column_types.update({column: pa.float64() for column in columns if column != self.index_col})
+        return pa_csv.read_csv(
+            pa.BufferReader(data) if isinstance(data, bytes) else data,
+            convert_options=pa_csv.ConvertOptions(column_types=column_types),
+        )
+
+    def _header(self):
+        with open(self.csv_path, 'rb') as f:
+            return f.readline()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def sync(self):
+        """Bring the store up to date with the CSV; returns True when it changed."""
+        with self._lock:
+            return self._sync()
+
+    def _sync(self):
+        fingerprint = file_fingerprint(self.csv_path)
+        if fingerprint is None:
+            raise FileNotFoundError(self.csv_path)
+
+        manifest = self._read_manifest()
+        if manifest is not None and tuple(manifest['fingerprint']) == fingerprint:
+            return False
+
+        size = fingerprint[1]
+        if manifest is not None and self._can_append(manifest, size):
+            self._append_tail(manifest, size)
+        else:
+            self._rebuild(size)
+        return True
+
+    def _can_append(self, manifest, size):
+        # The CSV only grew and the part already converted is untouched
+        offset = manifest['offset']
+        if size <= offset or len(manifest['segments']) >= self.max_segments:
+            return False
+        if self._header().decode('utf-8') != manifest['header']:
+            return False
+        if _hash_block(self.csv_path, offset) != manifest['tail_hash']:
+            return False
+        # The converted part must end at a line break
+        with open(self.csv_path, 'rb') as f:
+            f.seek(offset - 1)
+            return f.read(1) == b'\n'
+
+    def _append_tail(self, manifest, size):
+        with open(self.csv_path, 'rb') as f:
+            f.seek(manifest['offset'])
+            tail = f.read(size - manifest['offset'])
+        table = self._parse_csv(manifest['header'].encode('utf-8') + tail, manifest['columns'])
+        if table.num_rows:
+            table = table.select(manifest['columns'])
+            manifest['segments'].append(
+                self._write_segment(table, manifest['generation'], len(manifest['segments'])))
+        manifest.update(offset=size, tail_hash=_hash_block(self.csv_path, size),
+                        fingerprint=list(file_fingerprint(self.csv_path)))
+        self._write_manifest(manifest)
+
+    def _rebuild(self, size):
+        os.makedirs(self.store_dir, exist_ok=True)
+        old_manifest = self._read_manifest()
+
+        table = self._parse_csv(self.csv_path)
+        table = table.cast(pa.schema([
+            pa.field(name, pa.timestamp('ns') if name == self.index_col else pa.float64())
+            for name in table.column_names
+        ]))
+        manifest = {
+            'header': self._header().decode('utf-8'),
+            'columns': table.column_names,
+            'segments': [],
+            'offset': size,
+            'tail_hash': _hash_block(self.csv_path, size),
+            'fingerprint': list(file_fingerprint(self.csv_path)),
+        }
+        # Write the new generation next to the old one before switching the manifest
+        generation = (old_manifest or {}).get('generation', 0) + 1
+        manifest['generation'] = generation
+        manifest['segments'] = [self._write_segment(table, generation, 0)]
+        self._write_manifest(manifest)
+
+        for old_name in (old_manifest or {}).get('segments', []):
+            if old_name not in manifest['segments']:
+                try:
+                    os.remove(os.path.join(self.store_dir, old_name))
+                except OSError:
+                    pass
+
+    def append(self, new_prices):
+        """
+        Append rows with dates after the last stored date, to both the CSV and the store.
+
+        ``new_prices`` is indexed by date and has (a subset of) the stored columns.
+        """
+        with self._lock:
+            self._sync()
+            manifest = self._read_manifest()
+            columns = [column for column in manifest['columns'] if column != self.index_col]
+
+            new_prices = new_prices.reindex(columns=columns)
+            new_prices.index.name = self.index_col
+            new_prices.to_csv(self.csv_path, mode='a', header=False)
+
+            # The CSV grew by exactly these rows, so this always takes the append path
+            self._sync()
+
+    def load(self):
+        """Prices as a DataFrame indexed by date, read from the memory-mapped segments."""
+        with self._lock:
+            self._sync()
+            manifest = self._read_manifest()
+            key = (manifest['generation'], tuple(manifest['segments']))
+            if self._loaded[0] == key:
+                return self._loaded[1]
+
+            table = self._read_segments(manifest)
+            # split_blocks avoids consolidating the columns into one freshly copied block
+            price_data = table.to_pandas(split_blocks=True).set_index(self.index_col)
+            self._loaded = (key, price_data)
+            return price_data
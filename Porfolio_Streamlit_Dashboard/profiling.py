@@ -0,0 +1,68 @@
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+
+class RerunProfiler:
+    """
+    Wall time of the named sections of one run of the dashboard script.
+
+    Disabled by default, and then ``section`` does nothing. Sections can be nested; each
+    one is timed on its own and reported with its share of the whole run. With
+    ``profile_calls`` the run is also profiled with cProfile, to look inside a slow section.
+    """
+
+    def __init__(self, enabled=False, profile_calls=False):
+        self.enabled = enabled
+        self.sections = []
+        self.total = None
+        self._started = 0
+        self._depth = 0
+        self._start = time.perf_counter()
+        self._profile = None
+        if enabled and profile_calls:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def section(self, name):
+        return self._timed(name) if self.enabled else nullcontext()
+
+    @contextmanager
+    def _timed(self, name):
+        order, depth = self._started, self._depth
+        self._started += 1
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.sections.append((order, depth, name, time.perf_counter() - start))
+
+    def stop(self):
+        if self._profile is not None:
+            self._profile.disable()
+        self.total = time.perf_counter() - self._start
+
+    def frame(self):
+        """Sections in the order they started, indented by nesting, with their time in ms and % of the run."""
+        # Sections are recorded when they end, inner ones first
+        sections = pd.DataFrame(self.sections, columns=['order', 'depth', 'Section', 'seconds']).sort_values('order')
+        total = self.total if self.total is not None else time.perf_counter() - self._start
+        return pd.DataFrame({
+            'Section': ['\u2003' * depth + name for depth, name in zip(sections['depth'], sections['Section'])],
+            'Time (ms)': sections['seconds'].to_numpy() * 1000,
+            'Share (%)': sections['seconds'].to_numpy() / total * 100 if total else 0.0,
+        })
+
+    def call_stats(self, limit=30, sort='cumulative'):
+        """Text report of the functions taking the most time, when ``profile_calls`` is on."""
+        if self._profile is None:
+            return ''
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
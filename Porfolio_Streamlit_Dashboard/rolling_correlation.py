@@ -0,0 +1,120 @@
+import itertools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+class RollingCorrelationEngine:
+    """
+    All pairwise rolling correlations of a price table in a single vectorized pass.
+
+    For every pair the rolling window runs over the dates where both assets have a
+    price (the same as ``price_data[[a1, a2]].dropna()`` followed by ``rolling().corr()``).
+    The cumulative moments of the pairs do not depend on the window, so they are kept
+    and reused when the window or the selected assets change.
+    """
+
+    def __init__(self, price_data, max_cached_results=32):
+        self.index = price_data.index
+        self.columns = list(price_data.columns)
+        self._positions = {asset: i for i, asset in enumerate(self.columns)}
+
+        values = price_data.to_numpy(dtype=float)
+        self._valid = ~np.isnan(values)
+        # Centering every column improves the precision of the cumulative sums
+        with np.errstate(invalid='ignore'):
+            col_means = np.nanmean(values, axis=0) if len(values) else np.zeros(values.shape[1])
+        self._values = np.where(self._valid, values - np.nan_to_num(col_means), 0.0)
+
+        # pair -> (count, sum_x, sum_y, sum_xx, sum_yy, sum_xy), each of length T + 1
+        self._moments = {}
+        # Last stacked selection, so that changing only the window skips the re-stacking
+        self._stacked = (None, None)
+        self._results = OrderedDict()
+        self._max_cached_results = max_cached_results
+        self._lock = threading.Lock()
+
+    def _compute_moments(self, pairs):
+        # Cumulative moments with a leading zero, one row per pair (pairs x T + 1)
+        i = np.array([self._positions[a1] for a1, _ in pairs])
+        j = np.array([self._positions[a2] for _, a2 in pairs])
+        mask = (self._valid[:, i] & self._valid[:, j]).T
+        x = np.where(mask, self._values[:, i].T, 0.0)
+        y = np.where(mask, self._values[:, j].T, 0.0)
+
+        def cumulative(a):
+            out = np.zeros((a.shape[0], a.shape[1] + 1))
+            np.cumsum(a, axis=1, out=out[:, 1:])
+            return out
+
+        moments = [cumulative(mask.astype(float)), cumulative(x), cumulative(y),
+                   cumulative(x * x), cumulative(y * y), cumulative(x * y)]
+        for k, pair in enumerate(pairs):
+            self._moments[pair] = tuple(m[k] for m in moments)
+
+    def _stacked_moments(self, pairs):
+        if self._stacked[0] == pairs:
+            return self._stacked[1]
+        missing = [pair for pair in pairs if pair not in self._moments]
+        if missing:
+            self._compute_moments(missing)
+        stacked = [np.stack([self._moments[pair][k] for pair in pairs]) for k in range(6)]
+        self._stacked = (pairs, stacked)
+        return stacked
+
+    def _rolling(self, pairs, window):
+        count, sx, sy, sxx, syy, sxy = self._stacked_moments(pairs)
+        n_pairs, length = count.shape
+
+        # The window ends at each valid date and starts `window` valid dates earlier:
+        # find, per pair, the last cumulative position whose count is count - window.
+        # Offsetting every pair by `length` lets one searchsorted serve all of them.
+        offsets = (np.arange(n_pairs) * (length + 1))[:, None]
+        keys = (count + offsets).ravel()
+        targets = count - window
+        start = np.searchsorted(keys, (targets + offsets).ravel(), side='right') - 1
+        end = np.arange(keys.size)
+
+        def window_sum(cumulative):
+            flat = cumulative.ravel()
+            return (flat[end] - flat[start]).reshape(n_pairs, length)[:, 1:]
+
+        wx, wy = window_sum(sx), window_sum(sy)
+        cov = window_sum(sxy) - wx * wy / window
+        var_x = window_sum(sxx) - wx * wx / window
+        var_y = window_sum(syy) - wy * wy / window
+
+        # Only dates where both prices exist and a full window is available
+        increments = np.diff(count, axis=1)
+        usable = (increments > 0) & (targets[:, 1:] >= 0)
+        # Flat windows have no correlation; guard against rounding noise as well
+        usable &= (var_x > 1e-12 * window_sum(sxx)) & (var_y > 1e-12 * window_sum(syy))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = np.where(usable, cov / np.sqrt(var_x * var_y), np.nan)
+        return np.clip(corr, -1.0, 1.0).T
+
+    def rolling(self, assets, window):
+        """DataFrame of rolling correlations, one column per pair ``(asset1, asset2)``."""
+        assets = tuple(assets)
+        key = (assets, window)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+
+            pairs = list(itertools.combinations(assets, 2))
+            if pairs:
+                values = self._rolling(pairs, window)
+            else:
+                values = np.empty((len(self.index), 0))
+            result = pd.DataFrame(values, index=self.index,
+                                  columns=pd.MultiIndex.from_tuples(pairs, names=['asset1', 'asset2'])
+                                  if pairs else None)
+
+            self._results[key] = result
+            if len(self._results) > self._max_cached_results:
+                self._results.popitem(last=False)
+            return result
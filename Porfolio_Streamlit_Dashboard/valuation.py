@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+class PortfolioValuation:
+    """
+    Valuation of the portfolio in the main currency, from an array-backed position table.
+
+    Every position is a row of plain arrays (quantity, purchase price, last and previous
+    price) with the integer code of its currency, and the currencies are a vector of
+    ``rate_to_main`` rates (units of the currency per unit of the main currency, as in
+    currencies.json). Values, P&L, daily changes and weights of all the positions are
+    then a few array operations.
+
+    The totals are kept per currency, in the currency, so a price tick only moves the
+    subtotals of the positions that ticked and an FX tick only changes the rate vector:
+    the headline figures cost one dot product over the currencies, whatever the number
+    of positions. Positions without a price are left out of the totals.
+    """
+
+    def __init__(self, assets, quantities, currencies, purchase_prices, rates, last_prices=None,
+                 previous_prices=None):
+        self.assets = list(assets)
+        self._rows = pd.Index(self.assets)
+        n = len(self.assets)
+
+        self.currencies = list(rates.keys())
+        self._codes = pd.Index(self.currencies)
+        self.codes = self._codes.get_indexer(list(currencies)).astype(np.int32)
+        if (self.codes < 0).any():
+            unknown = sorted({str(c) for c, code in zip(currencies, self.codes) if code < 0})
+            raise ValueError(f"No rate to the main currency for {', '.join(unknown)}")
+        self.rates = np.array([rates[currency] for currency in self.currencies], dtype=float)
+
+        self.quantities = np.asarray(quantities, dtype=float)
+        self.purchase_prices = np.asarray(purchase_prices, dtype=float)
+        self.last_prices = np.full(n, np.nan) if last_prices is None else np.array(last_prices, dtype=float)
+        self.previous_prices = np.full(n, np.nan) if previous_prices is None else \
+            np.array(previous_prices, dtype=float)
+        self._resum()
+
+    @classmethod
+    def from_portfolio(cls, portfolio_data, currency_data, default_currency=None):
+        """
+        From the portfolio and currency dictionaries of portfolio.json and currencies.json.
+        Positions without a currency get ``default_currency``, or raise a ValueError.
+        """
+        currencies = []
+        for asset, details in portfolio_data.items():
+            currency = details.get('currency')
+            if _missing(currency):
+                if default_currency is None:
+                    raise ValueError(f"Currency not defined for asset {asset}")
+                currency = default_currency
+            currencies.append(str(currency).strip())
+        details = list(portfolio_data.values())
+        return cls(
+            portfolio_data.keys(),
+            [d.get('quantity', 0) for d in details],
+            currencies,
+            [d.get('avg_weighted_purchase_price', np.nan) for d in details],
+            {currency: rate['rate_to_main'] for currency, rate in currency_data.items()},
+            [d.get('last_price', np.nan) for d in details],
+            [d.get('previous_price', np.nan) for d in details],
+        )
+
+    # ------------------------------------------------------------------
+    # Totals per currency
+    # ------------------------------------------------------------------
+
+    def _amounts(self, rows=slice(None)):
+        # Market value, previous value and cost of the rows, in their currency, 0 without a price
+        quantities = self.quantities[rows]
+        last, previous = self.last_prices[rows], self.previous_prices[rows]
+        priced = ~np.isnan(last)
+        value = np.where(priced, quantities * last, 0.0)
+        previous_value = np.where(priced & ~np.isnan(previous), quantities * previous, 0.0)
+        # Without a purchase price the position adds no P&L
+        purchase = np.where(np.isnan(self.purchase_prices[rows]), last, self.purchase_prices[rows])
+        cost = np.where(priced, quantities * purchase, 0.0)
+        return value, previous_value, cost
+
+    def _resum(self):
+        n_currencies = len(self.currencies)
+        self._totals = np.vstack([np.bincount(self.codes, weights=amount, minlength=n_currencies)
+                                  for amount in self._amounts()])
+        self._updated = 0
+
+    def update_prices(self, last_prices, previous_prices=None):
+        """
+        New prices of some positions, as mappings (or Series) asset -> price. Only the
+        currency subtotals of these positions are moved.
+        """
+        last_prices = pd.Series(last_prices, dtype=float)
+        rows = self._rows.get_indexer(last_prices.index)
+        if (rows < 0).any():
+            raise KeyError(f"Unknown assets: {list(last_prices.index[rows < 0])}")
+        if previous_prices is not None:
+            previous_prices = pd.Series(previous_prices, dtype=float).reindex(last_prices.index)
+
+        before = self._amounts(rows)
+        self.last_prices[rows] = last_prices.to_numpy()
+        if previous_prices is not None:
+            self.previous_prices[rows] = previous_prices.fillna(
+                pd.Series(self.previous_prices[rows], index=last_prices.index)).to_numpy()
+        after = self._amounts(rows)
+
+        for totals, old, new in zip(self._totals, before, after):
+            np.add.at(totals, self.codes[rows], new - old)
+        self._updated += len(rows)
+        if self._updated >= len(self.assets):
+            # Re-summed once as many rows as the book has were updated, so rounding errors do not pile up
+            self._resum()
+        return self
+
+    def update_rates(self, rates):
+        """New ``rate_to_main`` of some currencies, as a mapping currency -> rate."""
+        codes = self._codes.get_indexer(list(rates.keys()))
+        if (codes < 0).any():
+            raise KeyError(f"Unknown currencies: {[c for c, code in zip(rates, codes) if code < 0]}")
+        self.rates[codes] = np.fromiter(rates.values(), dtype=float, count=len(codes))
+        return self
+
+    # ------------------------------------------------------------------
+    # Book totals
+    # ------------------------------------------------------------------
+
+    def _to_main(self, amounts):
+        return float(amounts @ (1 / self.rates))
+
+    @property
+    def total_value(self):
+        return self._to_main(self._totals[0])
+
+    @property
+    def total_previous(self):
+        return self._to_main(self._totals[1])
+
+    @property
+    def total_pnl(self):
+        return self._to_main(self._totals[0] - self._totals[2])
+
+    @property
+    def daily_change(self):
+        """Change of the book's value since the previous close, in %."""
+        previous = self.total_previous
+        return (self.total_value - previous) / previous * 100 if previous else 0.0
+
+    # ------------------------------------------------------------------
+    # Positions
+    # ------------------------------------------------------------------
+
+    @property
+    def fx(self):
+        # Factor from the currency of every position to the main currency
+        return 1 / self.rates[self.codes]
+
+    def values(self):
+        """Value of every position in its currency and in the main currency."""
+        value = self.quantities * self.last_prices
+        return value, value * self.fx
+
+    def pnl(self):
+        """P&L of every position in its currency and in the main currency."""
+        pnl = self.quantities * (self.last_prices - self.purchase_prices)
+        return pnl, pnl * self.fx
+
+    def change_perc(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (self.last_prices - self.previous_prices) / self.previous_prices * 100
+
+    def weights(self):
+        """Weight of every position in the value of the book, in %."""
+        total = self.total_value
+        _, value = self.values()
+        return value / total * 100 if total else np.zeros(len(self.assets))
+
+    def frame(self):
+        """All the figures of the positions, one row per asset, named like the keys of portfolio.json."""
+        total_value, value_in_main = self.values()
+        pnl, pnl_in_main = self.pnl()
+        return pd.DataFrame({
+            'currency': np.asarray(self.currencies, dtype=object)[self.codes],
+            'quantity': self.quantities,
+            'last_price': self.last_prices,
+            'previous_price': self.previous_prices,
+            'change_perc': self.change_perc(),
+            'total_value': total_value,
+            'pnl': pnl,
+            'total_value_in_main_currency': value_in_main,
+            'pnl_in_main_currency': pnl_in_main,
+            'weight': self.weights(),
+        }, index=pd.Index(self.assets, name='asset'))
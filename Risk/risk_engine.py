@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+METRICS = ['standard_deviation', 'beta', 'max_drawdown', 'sharpe_ratio', 'sortino_ratio', 'treynor_ratio',
+           'calmar_ratio', 'ulcer_index', 'var', 'cvar', 'downside_deviation', 'r_squared']
+
+# Metrics needing the benchmark returns
+BENCHMARK_METRICS = {'beta', 'treynor_ratio', 'r_squared'}
+
+# Metrics computed on the whole path of each window (the others come from running sums)
+PATH_METRICS = {'max_drawdown', 'calmar_ratio', 'ulcer_index', 'var', 'cvar'}
+
+
+def _window_sums(values, ends, window):
+    """Sum of the ``window`` rows ending at each of ``ends``, from one cumulative sum."""
+    cumulative = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+    return cumulative[ends + 1] - cumulative[ends + 1 - window]
+
+
+class RiskEngine:
+    """
+    Risk metrics of the Risk Metrics notebook for a panel of returns (one column per asset),
+    over rolling windows.
+
+    The moments (standard deviation, downside deviation, beta, R-squared and the ratios
+    built on them) come from running sums, updated by adding the return entering each
+    window and removing the one leaving it. The drawdowns and the VaR / CVaR depend on
+    the order of the returns in the window: they are computed on windows of the running
+    log wealth and with one partial sort per window, in chunks of windows.
+
+    Definitions follow the notebook: population standard deviations, the VaR as the
+    return at position int(n * (1 - confidence)) of the sorted window and the CVaR as
+    the mean of the returns below it, non-annualized Sharpe and Sortino ratios. The max
+    drawdown is the largest fall from a previous peak of the wealth within the window.
+    """
+
+    def __init__(self, returns, benchmark=None, risk_free_rate=0.0, confidence_level=0.95, periods=252):
+        if isinstance(benchmark, str):
+            benchmark = returns[benchmark]
+        self.returns = returns.astype(float)
+        self.benchmark = None if benchmark is None else benchmark.reindex(returns.index).astype(float)
+        self.risk_free_rate = risk_free_rate
+        self.confidence_level = confidence_level
+        self.periods = periods
+
+    def _moments(self, values, benchmark, ends, window, metrics):
+        excess = values - self.risk_free_rate
+        valid = ~np.isnan(values)
+        count = _window_sums(valid.astype(float), ends, window)
+        # Centered on the column means, so that the running sums of squares stay accurate
+        center = np.nanmean(values, axis=0)
+        centered = np.where(valid, values - center, 0)
+
+        mean = _window_sums(centered, ends, window) / window + center
+        variance = np.maximum(_window_sums(centered ** 2, ends, window) / window - (mean - center) ** 2, 0)
+        std = np.sqrt(variance)
+        excess_mean = mean - self.risk_free_rate
+
+        downside = np.where(valid, np.minimum(excess, 0), 0)
+        downside_mean = _window_sums(downside, ends, window) / window
+        downside_std = np.sqrt(np.maximum(_window_sums(downside ** 2, ends, window) / window - downside_mean ** 2, 0))
+
+        result = {'mean': mean, 'count': count}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result['standard_deviation'] = std
+            result['sharpe_ratio'] = excess_mean / std
+            result['downside_deviation'] = downside_std
+            result['sortino_ratio'] = np.where(downside_std == 0, np.inf, excess_mean / downside_std)
+
+            if benchmark is not None and metrics & BENCHMARK_METRICS:
+                market_center = np.nanmean(benchmark)
+                market = np.where(np.isnan(benchmark), 0, benchmark - market_center)[:, None]
+                market_mean = _window_sums(market, ends, window) / window
+                market_variance = _window_sums(market ** 2, ends, window) / window - market_mean ** 2
+                covariance = _window_sums(centered * market, ends, window) / window - (mean - center) * market_mean
+                beta = covariance / market_variance
+                residual = np.where(valid, values - benchmark[:, None], 0)
+                result['beta'] = beta
+                result['treynor_ratio'] = np.where(beta == 0, np.inf, excess_mean / beta)
+                result['r_squared'] = 1 - _window_sums(residual ** 2, ends, window) / (window * variance)
+                result['count'] = np.minimum(count, _window_sums(~np.isnan(benchmark[:, None]), ends, window))
+        return result
+
+    def _paths(self, values, ends, window, metrics, chunk_size):
+        """Drawdown and tail metrics of the windows ending at ``ends``, chunk by chunk."""
+        n_ends, n_assets = len(ends), values.shape[1]
+        result = {}
+        starts = ends - window + 1
+        rows = max(1, chunk_size // max(1, n_assets * window))
+        position = int(window * (1 - self.confidence_level))
+
+        if metrics & {'var', 'cvar'}:
+            # Rolling order statistic (kept sorted as the window slides): the return at position
+            # int(n * (1 - confidence)) of the sorted window
+            quantile = pd.DataFrame(values).rolling(window).quantile(position / max(1, window - 1),
+                                                                     interpolation='nearest')
+            result['var'] = -quantile.to_numpy()[ends]
+
+        # Assets as rows, so that every window is contiguous in memory
+        return_windows = sliding_window_view(np.ascontiguousarray(values.T), window, axis=1)
+        # Log wealth: the wealth of a window relative to its running peak does not depend on its start
+        log_wealth = np.ascontiguousarray(np.cumsum(np.log1p(values), axis=0).T)
+        wealth_windows = sliding_window_view(log_wealth, window, axis=1)
+        for name in metrics & {'max_drawdown', 'ulcer_index', 'cvar'} | \
+                ({'max_drawdown'} if 'calmar_ratio' in metrics else set()):
+            result[name] = np.full((n_ends, n_assets), np.nan)
+
+        for first in range(0, n_ends, rows):
+            chunk = starts[first:first + rows]
+            block = slice(first, first + rows)
+            if 'max_drawdown' in result or 'ulcer_index' in result:
+                wealth = wealth_windows[:, chunk]
+                log_drawdowns = wealth - np.maximum.accumulate(wealth, axis=-1)
+                if 'max_drawdown' in result:
+                    result['max_drawdown'][block] = np.expm1(log_drawdowns.min(axis=-1)).T
+                if 'ulcer_index' in result:
+                    result['ulcer_index'][block] = np.sqrt(np.mean(np.expm1(log_drawdowns) ** 2, axis=-1)).T
+            if 'cvar' in result and position:
+                # Mean of the ``position`` lowest returns: the ones below the VaR return, completed
+                # with copies of it when it is tied
+                windows = return_windows[:, chunk]
+                threshold = -result['var'][block].T[..., None]
+                below = windows < threshold
+                total = np.where(below, windows, 0).sum(axis=-1) + (position - below.sum(axis=-1)) * threshold[..., 0]
+                result['cvar'][block] = -(total / position).T
+        return result
+
+    def rolling(self, window, metrics=None, step=1, chunk_size=250_000):
+        """
+        Metrics of every asset for the windows of ``window`` returns ending every ``step``
+        rows, as a frame indexed by (window end date, asset) with one column per metric.
+        Windows with a missing return are left NaN.
+        """
+        metrics = list(metrics or METRICS)
+        if self.benchmark is None:
+            metrics = [metric for metric in metrics if metric not in BENCHMARK_METRICS]
+        wanted = set(metrics)
+        values = self.returns.to_numpy()
+        benchmark = None if self.benchmark is None else self.benchmark.to_numpy()
+        ends = np.arange(window - 1, len(values), step)
+
+        result = self._moments(values, benchmark, ends, window, wanted)
+        if wanted & PATH_METRICS:
+            result.update(self._paths(np.where(np.isnan(values), 0, values), ends, window, wanted, chunk_size))
+        if 'calmar_ratio' in wanted:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result['calmar_ratio'] = np.where(result['max_drawdown'] == 0, np.inf,
+                                                  result['mean'] * self.periods / np.abs(result['max_drawdown']))
+
+        complete = result['count'] == window
+        index = pd.MultiIndex.from_product([self.returns.index[ends], self.returns.columns],
+                                           names=[self.returns.index.name or 'Date', 'asset'])
+        return pd.DataFrame({metric: np.where(complete, result[metric], np.nan).ravel() for metric in metrics},
+                            index=index)
+
+    def summary(self, metrics=None):
+        """Metrics of every asset over the whole period, one row per asset."""
+        return self.rolling(len(self.returns), metrics).droplevel(0)
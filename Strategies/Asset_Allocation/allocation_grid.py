@@ -0,0 +1,155 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+METRICS = ['final_equity_return', 'max_drawdown', 'sharpe_ratio', 'volatility']
+
+# Most T x chunk float64 arrays alive at once in _evaluate_chunk: the returns of the
+# curves, the curves and their running maximum (or the std's deviations from the mean)
+CHUNK_ARRAYS = 3
+
+
+@lru_cache(maxsize=None)
+def _compositions(total, parts):
+    # All the ways to split `total` units into `parts` non-negative integers, in lexicographic order
+    if parts == 1:
+        return np.array([[total]], dtype=np.int32)
+    blocks = []
+    for first in range(total + 1):
+        rest = _compositions(total - first, parts - 1)
+        blocks.append(np.column_stack([np.full(len(rest), first, dtype=np.int32), rest]))
+    return np.concatenate(blocks)
+
+
+def allocation_grid(asset_names, step=5, cash='MMF'):
+    """
+    Every allocation of 100% across the assets in multiples of `step` percent.
+
+    Rows are in the same order as the nested loops of the notebook; allocations fully in
+    `cash` are left out since they have no invested part.
+    """
+    if 100 % step:
+        raise ValueError("The step should divide 100")
+    grid = _compositions(100 // step, len(asset_names)) * step
+    grid = pd.DataFrame(grid, columns=asset_names)
+    if cash in grid.columns:
+        grid = grid[grid[cash] < 100].reset_index(drop=True)
+    return grid
+
+
+def _evaluate_chunk(returns, invested_returns, weights, invested_weights, risk_free_rate, periods):
+    # Equity curves of every combination as one returns x weights matrix product. The
+    # T x chunk arrays are updated in place and dropped once used, so at most
+    # CHUNK_ARRAYS of them are alive at once (see AllocationGridEngine.chunk_size)
+    growth = returns @ weights
+    growth += 1
+    final_equity_return = (np.prod(growth, axis=0) - 1) * 100
+    del growth
+
+    # The risk metrics use the curve without the cash
+    combined = invested_returns @ invested_weights
+    equity_curve = combined + 1
+    np.cumprod(equity_curve, axis=0, out=equity_curve)
+    cumulative_max = np.maximum.accumulate(equity_curve, axis=0)
+    equity_curve -= cumulative_max
+    equity_curve /= cumulative_max
+    max_drawdown = np.min(equity_curve, axis=0) * 100
+    del equity_curve, cumulative_max
+
+    # Daily returns of the curve (the first day has no previous value)
+    daily_returns = combined[1:]
+    excess_returns = daily_returns - risk_free_rate / periods
+    sharpe_ratio = excess_returns.mean(axis=0) / excess_returns.std(axis=0) * np.sqrt(periods)
+    del excess_returns
+    volatility = daily_returns.std(axis=0, ddof=1) * np.sqrt(periods)
+
+    return np.column_stack([final_equity_return, max_drawdown, sharpe_ratio, volatility])
+
+
+# Returns shared with the worker processes, set once by the pool initializer
+_shared = {}
+
+
+def _init_worker(returns, invested_returns, risk_free_rate, periods):
+    _shared.update(returns=returns, invested_returns=invested_returns,
+                   risk_free_rate=risk_free_rate, periods=periods)
+
+
+def _evaluate_in_worker(weights, invested_weights):
+    return _evaluate_chunk(_shared['returns'], _shared['invested_returns'], weights, invested_weights,
+                           _shared['risk_free_rate'], _shared['periods'])
+
+
+class AllocationGridEngine:
+    """
+    Evaluates a grid of asset allocations on a table of daily asset returns.
+
+    The weight grid is a matrix (one row per combination, weights in percent); all the
+    equity curves of a chunk of combinations come from a single matrix product and the
+    drawdown, Sharpe ratio and volatility are computed column-wise. Chunks are sized to
+    stay under `max_memory_mb` and can be spread over a process pool.
+    """
+
+    def __init__(self, returns, cash='MMF', risk_free_rate=0.01, periods=252, max_memory_mb=512):
+        self.asset_names = list(returns.columns)
+        self.cash = cash if cash in self.asset_names else None
+        self.invested_assets = [asset for asset in self.asset_names if asset != self.cash]
+        self.risk_free_rate = risk_free_rate
+        self.periods = periods
+        self.max_memory_mb = max_memory_mb
+
+        self.index = returns.index
+        self._returns = np.ascontiguousarray(returns.to_numpy(dtype=float))
+        self._invested_returns = np.ascontiguousarray(returns[self.invested_assets].to_numpy(dtype=float))
+
+    def _weight_matrices(self, grid):
+        weights = grid[self.asset_names].to_numpy(dtype=float)
+        invested = grid[self.invested_assets].to_numpy(dtype=float)
+        # Weights of the invested assets rescaled to 100% without the cash
+        invested = invested / invested.sum(axis=1, keepdims=True)
+        return (weights / 100).T, invested.T
+
+    def chunk_size(self, n_combinations=0):
+        """
+        Combinations evaluated at once so that ``max_memory_mb`` holds the arrays of the
+        whole grid (weights and metrics) and the CHUNK_ARRAYS T x chunk arrays of a chunk.
+        """
+        # The two weight matrices, the metrics of the chunks and their concatenation
+        grid_bytes = n_combinations * (len(self.asset_names) + len(self.invested_assets) + 2 * len(METRICS)) * 8
+        budget = self.max_memory_mb * 1024 ** 2 - grid_bytes
+        return max(1, int(budget // (CHUNK_ARRAYS * len(self.index) * 8)))
+
+    def evaluate(self, grid, n_jobs=1):
+        """DataFrame of the grid with the final return, max drawdown, Sharpe ratio and volatility."""
+        weights, invested_weights = self._weight_matrices(grid)
+        size = self.chunk_size(len(grid))
+        chunks = [(weights[:, start:start + size], invested_weights[:, start:start + size])
+                  for start in range(0, weights.shape[1], size)]
+
+        if n_jobs == 1 or len(chunks) == 1:
+            metrics = [_evaluate_chunk(self._returns, self._invested_returns, w, iw,
+                                       self.risk_free_rate, self.periods) for w, iw in chunks]
+        else:
+            n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                     initargs=(self._returns, self._invested_returns,
+                                               self.risk_free_rate, self.periods)) as executor:
+                metrics = list(executor.map(_evaluate_in_worker, *zip(*chunks)))
+
+        metrics = np.concatenate(metrics) if metrics else np.empty((0, len(METRICS)))
+        results = grid.reset_index(drop=True).copy()
+        results[METRICS] = metrics
+        return results
+
+    def equity_curves(self, grid, exclude_cash=False):
+        """Equity curves (starting from 100) of a few combinations, one column per 'a_b_c_d_e' tag."""
+        weights, invested_weights = self._weight_matrices(grid)
+        if exclude_cash:
+            curves = np.cumprod(1 + self._invested_returns @ invested_weights, axis=0) * 100
+        else:
+            curves = np.cumprod(1 + self._returns @ weights, axis=0) * 100
+        tags = ['_'.join(map(str, row)) for row in grid[self.asset_names].itertuples(index=False)]
+        return pd.DataFrame(curves, index=self.index, columns=tags)
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import squareform
+
+
+class CorrelationStats:
+    """
+    Running sums behind the pairwise correlations of a panel with missing values.
+
+    For every pair of columns (i, j) the rows where both are known are counted, and the
+    sums of x_i, of x_i squared and of x_i * x_j over those rows are kept. Each is one
+    matrix product of the (values, mask) matrices, so a whole window costs a few BLAS
+    calls, and rolling the window forward only adds the new rows and removes the old ones.
+    """
+
+    def __init__(self, n_columns):
+        self.counts = np.zeros((n_columns, n_columns), dtype=np.float32)
+        self.sums = np.zeros((n_columns, n_columns))
+        self.squares = np.zeros((n_columns, n_columns))
+        self.products = np.zeros((n_columns, n_columns))
+
+    @classmethod
+    def from_values(cls, values):
+        stats = cls(values.shape[1])
+        stats.add(values)
+        return stats
+
+    def _update(self, values, sign):
+        values = np.asarray(values, dtype=float)
+        mask = (~np.isnan(values)).astype(float)
+        known = np.where(mask > 0, values, 0.0)
+        update = np.add if sign > 0 else np.subtract
+        update(self.counts, mask.T @ mask, out=self.counts, casting='unsafe')
+        sums = np.hstack([known, known ** 2]).T @ mask
+        update(self.sums, sums[:values.shape[1]], out=self.sums)
+        update(self.squares, sums[values.shape[1]:], out=self.squares)
+        update(self.products, known.T @ known, out=self.products)
+
+    def add(self, values):
+        self._update(values, 1)
+
+    def remove(self, values):
+        self._update(values, -1)
+
+    def correlation(self, min_periods=2):
+        """Pairwise complete correlations (the values of DataFrame.corr), NaN below ``min_periods``."""
+        counts = self.counts.astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_i = self.sums / counts
+            mean_j = mean_i.T
+            covariance = self.products / counts - mean_i * mean_j
+            variance_i = np.maximum(self.squares / counts - mean_i ** 2, 0)
+            variance_j = variance_i.T
+            corr = covariance / np.sqrt(variance_i * variance_j)
+        corr = np.clip(corr, -1, 1)
+        corr[counts < max(min_periods, 2)] = np.nan
+        np.fill_diagonal(corr, np.where(np.diag(counts) >= max(min_periods, 2), 1.0, np.nan))
+        return corr
+
+    def save(self, path):
+        np.savez(path, counts=self.counts, sums=self.sums, squares=self.squares, products=self.products)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        stats = cls(data['counts'].shape[0])
+        stats.counts, stats.sums, stats.squares, stats.products = \
+            data['counts'], data['sums'], data['squares'], data['products']
+        return stats
+
+
+def shrink(corr, shrinkage=0.0, target='identity'):
+    """
+    Correlation matrix shrunk towards ``target``: the identity, or 'constant' for the
+    average correlation off the diagonal. Missing correlations are taken as the target.
+    """
+    corr = np.asarray(corr, dtype=float)
+    n = len(corr)
+    if target == 'identity':
+        prior = np.eye(n)
+    elif target == 'constant':
+        off_diagonal = corr[~np.eye(n, dtype=bool)]
+        prior = np.full((n, n), np.nanmean(off_diagonal) if off_diagonal.size else 0.0)
+        np.fill_diagonal(prior, 1.0)
+    else:
+        raise ValueError(f"Unknown shrinkage target: {target}")
+    return np.where(np.isnan(corr), prior, (1 - shrinkage) * corr + shrinkage * prior)
+
+
+def masked_correlation(returns, min_periods=2, shrinkage=0.0, target='identity'):
+    """Pairwise complete correlation of a returns panel with missing values, optionally shrunk."""
+    corr = CorrelationStats.from_values(returns.to_numpy(dtype=float)).correlation(min_periods)
+    if shrinkage:
+        corr = shrink(corr, shrinkage, target)
+    return pd.DataFrame(corr, index=returns.columns, columns=returns.columns)
+
+
+def row_hashes(frame):
+    """One 64-bit hash per row of a frame (date and values), to notice revised rows."""
+    return pd.util.hash_pandas_object(frame, index=True).to_numpy()
+
+
+class CorrelationClustering:
+    """
+    Hierarchical clustering of the tickers of a returns panel on their correlations, as in
+    the Clustering notebook: distance sqrt(2 (1 - correlation)), average linkage.
+
+    ``fit`` uses the last ``window`` rows (all of them by default). The correlation and the
+    linkage tree are cached in ``cache_dir`` under the window (tickers, first and last date,
+    a hash of the values and parameters), so fitting the same window again only reads them
+    back. When the window has rolled forward since the previous fit of the same tickers, the
+    correlation sums are updated with the rows that entered and left it instead of being
+    recomputed, unless some rows of the previous window were revised since (a partial last
+    bar, an adjusted price). Changing the number of clusters only re-cuts the cached tree.
+    """
+
+    def __init__(self, window=None, min_periods=20, shrinkage=0.0, target='identity', method='average',
+                 cache_dir=None):
+        self.window = window
+        self.min_periods = min_periods
+        self.shrinkage = shrinkage
+        self.target = target
+        self.method = method
+        self.cache_dir = cache_dir
+        self.tickers = None
+        self.start = self.end = None
+        self.correlation = None
+        self.linkage = None
+        self._stats = None
+        self._hashes = None
+
+    def _params(self):
+        return [self.min_periods, self.shrinkage, self.target, self.method]
+
+    def _universe_key(self, tickers):
+        return hashlib.sha1(json.dumps([list(map(str, tickers)), self.window]).encode()).hexdigest()
+
+    def _window_key(self, tickers, start, end, hashes):
+        key = hashlib.sha1(json.dumps([list(map(str, tickers)), str(start), str(end), self._params()]).encode())
+        key.update(hashes.tobytes())
+        return key.hexdigest()
+
+    def _path(self, *names):
+        return os.path.join(self.cache_dir, *names)
+
+    def _load_cached(self, key, tickers):
+        if self.cache_dir is None or not os.path.exists(self._path(key, 'linkage.npy')):
+            return False
+        self.correlation = pd.DataFrame(np.load(self._path(key, 'correlation.npy')), index=tickers, columns=tickers)
+        self.linkage = np.load(self._path(key, 'linkage.npy'))
+        self._stats = None
+        return True
+
+    def _previous_state(self, tickers):
+        """Sums, window and row hashes of the previous fit of these tickers, from memory or from the cache."""
+        if self._stats is not None and list(self.tickers) == list(tickers):
+            return self._stats, self.start, self.end, self._hashes
+        if self.cache_dir is None:
+            return None
+        latest = self._path(f'latest-{self._universe_key(tickers)}.json')
+        if not os.path.exists(latest):
+            return None
+        with open(latest) as f:
+            meta = json.load(f)
+        if not os.path.exists(self._path(meta['key'], 'rows.npy')):
+            return None
+        return CorrelationStats.load(self._path(meta['key'], 'stats.npz')), pd.Timestamp(meta['start']), \
+            pd.Timestamp(meta['end']), np.load(self._path(meta['key'], 'rows.npy'))
+
+    def _window_stats(self, returns, window_returns):
+        """
+        Sums of the window, rolled from the previous window when it only moved forward and
+        none of its rows changed since (the sums of the rows leaving and staying are reused).
+        """
+        state = self._previous_state(window_returns.columns)
+        start, end = window_returns.index[0], window_returns.index[-1]
+        if state is not None:
+            stats, previous_start, previous_end, previous_hashes = state
+            index = returns.index
+            if previous_start in index and previous_end in index and previous_start <= start \
+                    and previous_end <= end and start <= previous_end \
+                    and np.array_equal(row_hashes(returns.loc[previous_start:previous_end]), previous_hashes):
+                stats.remove(returns.loc[previous_start:start].iloc[:-1].to_numpy(dtype=float))
+                stats.add(returns.loc[previous_end:end].iloc[1:].to_numpy(dtype=float))
+                return stats
+        return CorrelationStats.from_values(window_returns.to_numpy(dtype=float))
+
+    def fit(self, returns):
+        """Correlation and linkage tree of the last ``window`` rows of ``returns`` (one column per ticker)."""
+        returns = returns.sort_index()
+        window_returns = returns.iloc[-self.window:] if self.window else returns
+        tickers = list(window_returns.columns)
+        start, end = window_returns.index[0], window_returns.index[-1]
+        hashes = row_hashes(window_returns)
+        key = self._window_key(tickers, start, end, hashes)
+
+        if not self._load_cached(key, tickers):
+            self._stats = self._window_stats(returns, window_returns)
+            self._hashes = hashes
+            corr = shrink(self._stats.correlation(self.min_periods), self.shrinkage, self.target)
+            self.correlation = pd.DataFrame(corr, index=tickers, columns=tickers)
+            distance = np.sqrt(np.clip(2 * (1 - corr), 0, None))
+            np.fill_diagonal(distance, 0)
+            self.linkage = linkage(squareform(distance, checks=False), method=self.method)
+            self._save(key, tickers, start, end)
+        self.tickers, self.start, self.end = tickers, start, end
+        return self
+
+    def _save(self, key, tickers, start, end):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self._path(key), exist_ok=True)
+        np.save(self._path(key, 'correlation.npy'), self.correlation.to_numpy())
+        np.save(self._path(key, 'linkage.npy'), self.linkage)
+        self._stats.save(self._path(key, 'stats.npz'))
+        np.save(self._path(key, 'rows.npy'), self._hashes)
+        with open(self._path(f'latest-{self._universe_key(tickers)}.json'), 'w') as f:
+            json.dump({'key': key, 'start': str(start), 'end': str(end)}, f)
+
+    def clusters(self, t=11, criterion='maxclust'):
+        """Cluster of every ticker, cutting the linkage tree like fcluster(Z, t, criterion)."""
+        return pd.Series(fcluster(self.linkage, t=t, criterion=criterion), index=self.tickers, name='cluster')
@@ -0,0 +1,156 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+
+def _pair_legs(pair):
+    # 'EURUSD' or a currencies_pairs.json entry {'name': 'EURUSD', 'buycur': 'EUR', 'sellcur': 'USD'}
+    if isinstance(pair, dict):
+        return pair['name'], pair['buycur'], pair['sellcur']
+    return pair, pair[:3], pair[3:]
+
+
+class CurrencyIndexEngine:
+    """
+    Weighted indices of every currency of a set of FX pairs, as in the custom Indices notebook.
+
+    The index of a currency follows its pairs against the other currencies (the rate when
+    it is the base currency, the inverse rate when it is the quote currency), weighted by
+    the GDP of the other currency: it is the cumulated weighted sum of their returns, times
+    ``scale``. With ``invert=True`` the pairs are followed from the other side, like
+    calc_cur_index of FOREX_Strength_and_Weakness. When both EURUSD and USDEUR are given,
+    the last one is used, as the notebooks do.
+
+    The pairs and weights are compiled once into a signed currency x pair incidence matrix,
+    so all the indices come from one product with the matrix of pair returns, and a new bar
+    only costs one matrix-vector product (``update``).
+    """
+
+    def __init__(self, pairs, weights, currencies=None, invert=False, scale=1000):
+        legs = [_pair_legs(pair) for pair in (pairs.values() if isinstance(pairs, dict) else pairs)]
+        self.pairs = [name for name, _, _ in legs]
+        self.currencies = list(currencies) if currencies is not None else \
+            list(dict.fromkeys(currency for _, base, quote in legs for currency in (base, quote)))
+        self.invert = invert
+        self.scale = scale
+
+        # Pair followed by each (currency, other currency), the last one listed wins
+        components = {}
+        for position, (_, base, quote) in enumerate(legs):
+            direct_side, inverse_side = (quote, base) if invert else (base, quote)
+            components[(direct_side, inverse_side)] = (position, False)
+            components[(inverse_side, direct_side)] = (position, True)
+
+        rows = {currency: row for row, currency in enumerate(self.currencies)}
+        self.direct = np.zeros((len(self.currencies), len(self.pairs)))
+        self.inverse = np.zeros((len(self.currencies), len(self.pairs)))
+        for currency in self.currencies:
+            others = [(other, component) for (owner, other), component in components.items() if owner == currency]
+            gdp = np.array([weights[other]['GDP'] if isinstance(weights[other], dict) else weights[other]
+                            for other, _ in others], dtype=float)
+            for (other, (position, inverted)), weight in zip(others, gdp / gdp.sum()):
+                (self.inverse if inverted else self.direct)[rows[currency], position] = weight
+        self._used = (self.direct != 0) | (self.inverse != 0)
+
+        self._last_rates = None
+        self._levels = None
+
+    @classmethod
+    def from_json(cls, pairs_path, weights_path, **kwargs):
+        """Engine of the currencies_pairs.json and currencies_weights.json files."""
+        with open(pairs_path) as f:
+            pairs = json.load(f)
+        with open(weights_path) as f:
+            weights = json.load(f)
+        return cls(pairs, weights, **kwargs)
+
+    @property
+    def incidence(self):
+        """Signed weights as a frame: positive for the rates followed, negative for the inverted ones."""
+        return pd.DataFrame(self.direct - self.inverse, index=self.currencies, columns=self.pairs)
+
+    def _changes(self, previous, current):
+        """Weighted index change of every currency between two rate rows (or matrices)."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            direct = current / previous - 1
+            inverse = previous / current - 1
+        missing = np.isnan(direct)
+        changes = np.where(missing, 0, direct) @ self.direct.T + np.where(missing, 0, inverse) @ self.inverse.T
+        # A missing return of any of its pairs leaves the change of a currency undefined, like DataFrame.dot
+        return np.where(missing @ self._used.T > 0, np.nan, changes)
+
+    def index_changes(self, rates):
+        """Weighted returns of the currency indices (first row NaN), one column per currency."""
+        values = rates[self.pairs].to_numpy(dtype=float)
+        changes = np.full((len(values), len(self.currencies)), np.nan)
+        if len(values) > 1:
+            changes[1:] = self._changes(values[:-1], values[1:])
+        return pd.DataFrame(changes, index=rates.index, columns=self.currencies)
+
+    def indices(self, rates):
+        """
+        Index of every currency, from rates with one column per pair. The undefined changes
+        (rows with a missing rate) are skipped and left NaN, like cumsum.
+        """
+        changes = self.index_changes(rates)
+        return changes.cumsum() * self.scale
+
+    def start(self, rates):
+        """Indices of the history, keeping the state for the bars passed to ``update``."""
+        indices = self.indices(rates)
+        self._last_rates = rates[self.pairs].to_numpy(dtype=float)[-1]
+        self._levels = indices.ffill().iloc[-1].fillna(0).to_numpy()
+        return indices
+
+    def update(self, rates):
+        """Index levels after a new bar, from its rates (a Series indexed by pair)."""
+        current = pd.Series(rates).reindex(self.pairs).to_numpy(dtype=float)
+        if self._last_rates is None:
+            self._last_rates = current
+            self._levels = np.zeros(len(self.currencies))
+        else:
+            changes = self._changes(self._last_rates, current)
+            self._levels = self._levels + np.nan_to_num(changes) * self.scale
+            self._last_rates = current
+        return pd.Series(self._levels, index=self.currencies)
+
+    def strength_strategy(self, rates, indices=None, window=5, currencies=None):
+        """
+        Returns of trading, on every bar, the pair of the strongest currency against the
+        weakest one of the previous bar, as in FOREX_Strength_and_Weakness. The strength
+        of a currency is the distance of its index to its ``window`` bars moving average.
+
+        Returns a frame with the trading pair and the strategy return of every bar, from
+        the bar ``window`` on.
+        """
+        currencies = list(currencies or self.currencies)
+        if indices is None:
+            indices = self.indices(rates).ffill()
+        levels = indices[currencies]
+        average = levels.rolling(window=window, min_periods=1).mean()
+        strength = ((levels - average) / average).iloc[window:].to_numpy()
+
+        pair_returns = (rates[self.pairs] / rates[self.pairs].shift(1) - 1).iloc[window:].to_numpy()
+        # Column of every (base, quote) pair, -1 when it is not traded
+        lookup = np.full((len(currencies), len(currencies)), -1)
+        for position, pair in enumerate(self.pairs):
+            base, quote = pair[:3], pair[3:]
+            if base in currencies and quote in currencies:
+                lookup[currencies.index(base), currencies.index(quote)] = position
+
+        defined = ~np.isnan(strength).all(axis=1)
+        strongest = np.nanargmax(np.where(defined[:, None], strength, 0), axis=1)
+        weakest = np.nanargmin(np.where(defined[:, None], strength, 0), axis=1)
+        column = np.where(defined, lookup[strongest, weakest], -1)
+        # The pair chosen on a bar is traded on the next one
+        column = np.concatenate([[-1], column[:-1]])
+        names = np.array([a + b for a in currencies for b in currencies], dtype=object).reshape(len(currencies), -1)
+        pair = np.where(defined, names[strongest, weakest], None)
+
+        returns = np.full(len(column), np.nan)
+        traded = column >= 0
+        returns[traded] = pair_returns[np.flatnonzero(traded), column[traded]]
+        index = rates.index[window:]
+        return pd.DataFrame({'trading_pair': pd.Series(pair, index=index).shift(1), 'strategy_return': returns},
+                            index=index)
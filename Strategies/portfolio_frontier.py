@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+METRIC_COLUMNS = ['Est.Returns', 'Risk', 'Sharpe']
+
+
+class FrontierEngine:
+    """
+    Efficient frontier of a set of assets, from their daily returns and estimated annual returns.
+
+    The annualized covariance matrix is computed once. Random portfolios are evaluated in
+    chunks as a batched quadratic form, and the min-risk, max-Sharpe and target-return
+    portfolios are solved exactly: in closed form when short selling is allowed, with a
+    quadratic program (SLSQP) for long-only portfolios.
+    """
+
+    def __init__(self, returns, estimated_returns, risk_free=0.0, periods=252, allow_short=False):
+        self.tickers = list(returns.columns)
+        self.estimated_returns = np.asarray(estimated_returns, dtype=float)
+        self.risk_free = risk_free
+        self.allow_short = allow_short
+        self.cov_matrix = returns.cov().to_numpy() * periods
+
+    # ------------------------------------------------------------------
+    # Evaluation of given weights
+    # ------------------------------------------------------------------
+
+    def evaluate(self, weights):
+        """Estimated return, risk and Sharpe ratio of each row of a weights matrix."""
+        weights = np.atleast_2d(np.asarray(weights, dtype=float))
+        estimated_return = weights @ self.estimated_returns
+        # Batched quadratic form w' C w, one value per row
+        variance = np.einsum('ij,jk,ik->i', weights, self.cov_matrix, weights)
+        risk = np.sqrt(variance)
+        sharpe = (estimated_return - self.risk_free) / risk
+        return np.column_stack([estimated_return, risk, sharpe])
+
+    def portfolios(self, weights):
+        """Return, risk, Sharpe ratio and weights of each row of a weights matrix, as a DataFrame."""
+        metrics = pd.DataFrame(self.evaluate(weights), columns=METRIC_COLUMNS)
+        return metrics.join(pd.DataFrame(weights, columns=self.tickers))
+
+    def simulate_chunks(self, n_portfolios, chunk_size=100_000, seed=None):
+        """Random long-only portfolios (weights summing to 1), yielded chunk by chunk."""
+        rng = np.random.default_rng(seed)
+        for start in range(0, n_portfolios, chunk_size):
+            weights = rng.random((min(chunk_size, n_portfolios - start), len(self.tickers)))
+            weights /= weights.sum(axis=1, keepdims=True)
+            yield self.portfolios(weights)
+
+    def simulate(self, n_portfolios, chunk_size=100_000, seed=None):
+        """
+        All the random portfolios in one DataFrame. The chunks are concatenated, so memory
+        grows with ``n_portfolios``; iterate over ``simulate_chunks`` or use
+        ``best_of_simulation`` to stay in constant memory.
+        """
+        return pd.concat(list(self.simulate_chunks(n_portfolios, chunk_size, seed)), ignore_index=True)
+
+    def best_of_simulation(self, n_portfolios, chunk_size=100_000, seed=None):
+        """Min risk, max return and max Sharpe portfolios of a simulation, in constant memory."""
+        best = {}
+        for chunk in self.simulate_chunks(n_portfolios, chunk_size, seed):
+            for name, column, pick in (('Min Risk', 'Risk', 'idxmin'), ('Max Return', 'Est.Returns', 'idxmax'),
+                                       ('Max Sharpe', 'Sharpe', 'idxmax')):
+                candidate = chunk.loc[getattr(chunk[column], pick)()]
+                current = best.get(name)
+                if current is None:
+                    best[name] = candidate
+                elif (candidate[column] < current[column]) if pick == 'idxmin' else (candidate[column] > current[column]):
+                    best[name] = candidate
+        return pd.DataFrame(best).T
+
+    # ------------------------------------------------------------------
+    # Exact optimal portfolios
+    # ------------------------------------------------------------------
+
+    def _solve(self, objective, constraints):
+        n = len(self.tickers)
+        result = minimize(
+            objective,
+            np.full(n, 1 / n),
+            method='SLSQP',
+            bounds=None if self.allow_short else [(0, 1)] * n,
+            constraints=[{'type': 'eq', 'fun': lambda w: w.sum() - 1}] + constraints,
+            options={'ftol': 1e-12, 'maxiter': 500},
+        )
+        if not result.success:
+            raise ValueError(f"Optimization failed: {result.message}")
+        return result.x
+
+    def min_risk(self):
+        if self.allow_short:
+            # w = C^-1 1 / (1' C^-1 1)
+            w = np.linalg.solve(self.cov_matrix, np.ones(len(self.tickers)))
+            return w / w.sum()
+        return self._solve(lambda w: w @ self.cov_matrix @ w, [])
+
+    def max_sharpe(self):
+        excess = self.estimated_returns - self.risk_free
+        if self.allow_short:
+            # Tangency portfolio: w proportional to C^-1 (mu - rf)
+            w = np.linalg.solve(self.cov_matrix, excess)
+            if w.sum() <= 1e-12 * np.abs(w).sum():
+                # Scaling by a negative sum would give the minimum Sharpe portfolio instead
+                raise ValueError("No max Sharpe portfolio: the risk-free rate is not below the return of the "
+                                 "min risk portfolio, so with short selling the Sharpe ratio only grows with leverage")
+            return w / w.sum()
+        return self._solve(lambda w: -(w @ excess) / np.sqrt(w @ self.cov_matrix @ w), [])
+
+    def target_return(self, target):
+        """Minimum risk portfolio with the given estimated return."""
+        if self.allow_short:
+            # Two-fund solution of min w'Cw s.t. w'mu = target, w'1 = 1
+            ones = np.ones(len(self.tickers))
+            inv_ones = np.linalg.solve(self.cov_matrix, ones)
+            inv_mu = np.linalg.solve(self.cov_matrix, self.estimated_returns)
+            a, b, c = ones @ inv_ones, ones @ inv_mu, self.estimated_returns @ inv_mu
+            d = a * c - b * b
+            return ((c - b * target) * inv_ones + (a * target - b) * inv_mu) / d
+        return self._solve(lambda w: w @ self.cov_matrix @ w,
+                           [{'type': 'eq', 'fun': lambda w: w @ self.estimated_returns - target}])
+
+    def optimal_portfolios(self):
+        """Exact min risk and max Sharpe portfolios as a DataFrame like the simulations."""
+        frame = self.portfolios(np.vstack([self.min_risk(), self.max_sharpe()]))
+        frame.insert(0, 'Description', ['Min Risk', 'Max Sharpe'])
+        return frame
+
+    def frontier(self, n_points=50):
+        """Efficient frontier from the min risk portfolio up to the highest reachable return."""
+        low = self.min_risk() @ self.estimated_returns
+        high = self.estimated_returns.max() if not self.allow_short else 2 * self.estimated_returns.max() - low
+        weights = np.vstack([self.target_return(target) for target in np.linspace(low, high, n_points)])
+        return self.portfolios(weights)
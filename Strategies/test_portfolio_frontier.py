@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from portfolio_frontier import FrontierEngine
+
+
+def _engine(seed, allow_short):
+    rng = np.random.default_rng(seed)
+    returns = pd.DataFrame(rng.normal(0, 0.01, (500, 4)))
+    return FrontierEngine(returns, rng.normal(0.05, 0.1, 4), risk_free=0.03, allow_short=allow_short)
+
+
+def _sharpe(engine, weights):
+    return engine.evaluate(weights)[0, 2]
+
+
+@pytest.mark.parametrize('allow_short', [False, True])
+@pytest.mark.parametrize('seed', range(10))
+def test_max_sharpe_beats_min_risk(seed, allow_short):
+    engine = _engine(seed, allow_short)
+    try:
+        max_sharpe = engine.max_sharpe()
+    except ValueError:
+        # No tangency portfolio with short selling, see test_max_sharpe_without_tangency
+        assert allow_short
+        return
+    assert max_sharpe.sum() == pytest.approx(1)
+    assert _sharpe(engine, max_sharpe) >= _sharpe(engine, engine.min_risk()) - 1e-9
+
+
+def test_max_sharpe_without_tangency():
+    # Risk-free rate above the return of the min risk portfolio (seed 0)
+    engine = _engine(0, allow_short=True)
+    assert engine.min_risk() @ engine.estimated_returns < engine.risk_free
+    with pytest.raises(ValueError):
+        engine.max_sharpe()
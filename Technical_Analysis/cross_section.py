@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+
+class MembershipIndex:
+    """
+    Point-in-time index membership, from (ticker, start, end) intervals.
+
+    ``end`` is inclusive and NaT for the current members. The intervals are turned into
+    a date x ticker boolean bitmap with one difference array (+1 at the start, -1 after
+    the end, cumulated over the dates), instead of testing every interval per ticker.
+    """
+
+    def __init__(self, tickers, starts, ends):
+        frame = pd.DataFrame({'ticker': np.asarray(tickers, dtype=str), 'start': pd.to_datetime(starts),
+                              'end': pd.to_datetime(ends)})
+        # Intervals without a start are not used, like in the notebook
+        self.intervals = frame.dropna(subset=['start']).reset_index(drop=True)
+        self.tickers = list(dict.fromkeys(self.intervals['ticker']))
+
+    @classmethod
+    def from_components(cls, components, code='Code', start='StartDate', end='EndDate'):
+        """From the HistoricalTickerComponents table of an index (df_symbols in the notebook)."""
+        return cls(components[code].astype(str), pd.to_datetime(components[start], errors='coerce'),
+                   pd.to_datetime(components[end], errors='coerce'))
+
+    def bitmap(self, dates, tickers=None):
+        """Boolean array, True where the ticker (column) is a member of the index on the date (row)."""
+        dates = pd.DatetimeIndex(dates)
+        tickers = self.tickers if tickers is None else list(tickers)
+        column = pd.Index(tickers).get_indexer(self.intervals['ticker'])
+        known = column >= 0
+
+        first = dates.searchsorted(self.intervals['start'].to_numpy()[known], side='left')
+        ends = self.intervals['end'].to_numpy()[known]
+        after = np.where(pd.isna(ends), len(dates), dates.searchsorted(ends, side='right'))
+        changes = np.zeros((len(dates) + 1, len(tickers)), dtype=np.int32)
+        np.add.at(changes, (first, column[known]), 1)
+        np.add.at(changes, (after, column[known]), -1)
+        return np.cumsum(changes[:-1], axis=0) > 0
+
+    def frame(self, dates, tickers=None):
+        tickers = self.tickers if tickers is None else list(tickers)
+        return pd.DataFrame(self.bitmap(dates, tickers), index=pd.DatetimeIndex(dates), columns=tickers)
+
+
+def rebalance_positions(index, freq='M'):
+    """Position of the first date of every period (month by default) of a DatetimeIndex."""
+    periods = pd.DatetimeIndex(index).to_period(freq)
+    return np.flatnonzero(np.concatenate([[True], periods[1:] != periods[:-1]]))
+
+
+class CrossSectionalRanker:
+    """
+    Portfolios of the highest and lowest ranked members of an index, rebalanced on the
+    first date of every period, as in the High vs Low Volatility Analysis notebook.
+
+    ``returns`` has one column per ticker and ``membership`` is the matching date x ticker
+    boolean bitmap. On every rebalance date the scores of the members are ranked, the
+    ``n`` highest and lowest (or a ``fraction`` of the members, 0.1 for deciles) are held
+    until the next one, and the portfolio returns are equal weighted means computed with
+    masked matrix reductions over all the dates at once.
+    """
+
+    def __init__(self, returns, membership):
+        self.returns = returns.astype(float)
+        self.membership = np.asarray(membership, dtype=bool)
+
+    def rolling_volatility(self, window=22):
+        return self.returns.rolling(window).std()
+
+    def _masked_mean(self, holdings):
+        values = self.returns.to_numpy()
+        held = holdings & ~np.isnan(values)
+        count = held.sum(axis=1)
+        with np.errstate(invalid='ignore'):
+            return np.where(count > 0, np.where(held, values, 0).sum(axis=1) / count, np.nan)
+
+    def select(self, scores, n=None, fraction=None, freq='M'):
+        """
+        Highest and lowest ranked members on the rebalance dates, as two boolean arrays
+        (rebalance date x ticker), with the positions of the rebalance dates.
+        """
+        positions = rebalance_positions(self.returns.index, freq)
+        values = np.asarray(scores, dtype=float)[positions]
+        eligible = self.membership[positions] & ~np.isnan(values)
+        available = eligible.sum(axis=1)
+        size = np.full(len(positions), n) if fraction is None else np.floor(available * fraction).astype(int)
+        size = np.minimum(size, available)
+
+        # Rank of every eligible ticker from the highest score (0) and from the lowest one (0)
+        order = np.argsort(np.where(eligible, -values, np.inf), axis=1, kind='stable')
+        rank_high = np.empty_like(order)
+        np.put_along_axis(rank_high, order, np.arange(values.shape[1])[None, :], axis=1)
+        order = np.argsort(np.where(eligible, values, np.inf), axis=1, kind='stable')
+        rank_low = np.empty_like(order)
+        np.put_along_axis(rank_low, order, np.arange(values.shape[1])[None, :], axis=1)
+
+        highest = eligible & (rank_high < size[:, None])
+        lowest = eligible & (rank_low < size[:, None])
+        return highest, lowest, positions
+
+    def holdings(self, selection, positions):
+        """Daily holdings from the selections of the rebalance dates (none before the first)."""
+        period = np.searchsorted(positions, np.arange(len(self.returns)), side='right') - 1
+        daily = selection[np.maximum(period, 0)]
+        daily[period < 0] = False
+        return daily
+
+    def selected_tickers(self, selection, positions):
+        """Tickers of a selection per rebalance date, comma separated as in the notebook."""
+        columns = np.asarray(self.returns.columns.astype(str), dtype=object)
+        return pd.Series([','.join(columns[row]) for row in selection], index=self.returns.index[positions])
+
+    def run(self, scores, n=10, fraction=None, freq='M'):
+        """
+        Daily returns of the highest and lowest score portfolios and of all the members,
+        with the selected tickers of every rebalance date.
+        """
+        highest, lowest, positions = self.select(scores, n, fraction, freq)
+        returns = pd.DataFrame({
+            'highest': self._masked_mean(self.holdings(highest, positions)),
+            'lowest': self._masked_mean(self.holdings(lowest, positions)),
+            'members': self._masked_mean(self.membership),
+        }, index=self.returns.index)
+        selected = pd.DataFrame({'highest': self.selected_tickers(highest, positions),
+                                 'lowest': self.selected_tickers(lowest, positions)})
+        return returns, selected
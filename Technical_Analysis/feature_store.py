@@ -0,0 +1,326 @@
+import glob
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Tools', 'Market_Data'))
+from market_data import MarketData, EODHDProvider  # noqa: E402
+
+# EODHD technical indicators of the study, in the order they are merged
+INDICATORS = [
+    ('stochastic', {'fast_kperiod': 14, 'slow_dperiod': 3, 'slow_kperiod': 3}),
+    ('macd', {'fast_period': 12, 'slow_period': 26, 'signal_period': 9}),
+    ('sar', {'acceleration': '0.02', 'maximum': '0.2'}),
+    ('sma', {'period': '50'}),
+    ('ema', {'period': '50'}),
+    ('wma', {'period': '50'}),
+    ('volatility', {'period': '50'}),
+    ('rsi', {'period': '14'}),
+    ('slope', {'period': '50'}),
+    ('dmi', {'period': '14'}),
+    ('adx', {'period': '14'}),
+    ('atr', {'period': '14'}),
+    ('cci', {'period': '20'}),
+    ('bbands', {'period': '20'}),
+]
+
+# Forward return horizons (in bars) of the targets
+HORIZONS = {'1w': 5, '1m': 21, '3m': 63}
+
+# Classes of the targets, in the order of a LabelEncoder fitted on them
+LABELS = ['Down', 'Neutral', 'Up']
+
+PRICE_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'adjusted_close', 'volume', 'ticker']
+
+# Columns of the stored frames that are not model features
+EXCLUDED_COLUMNS = [f'target_{h}_class' for h in HORIZONS] + [f'ret_{h}' for h in HORIZONS] + PRICE_COLUMNS
+
+HIGH_LOW_WINDOW = 252
+
+# The indicators are computed by EODHD on the requested dates only: new dates are requested
+# with this much history before them, so the lookbacks are full and the recursive indicators
+# (EMA, RSI, ADX, SAR) have converged to the values of a request from the first date
+WARMUP = pd.Timedelta(days=400)
+
+# Last stored bars compared with a fresh fetch to notice a split or dividend since the
+# previous build, which rescales all the adjusted prices before it
+ADJUSTMENT_CHECK_ROWS = 5
+
+
+def fetch_indicator(ticker, indicator, start_date, end_date, api_token=None, **params):
+    """One EODHD technical indicator of a ticker, with its columns prefixed by the indicator name."""
+    import requests
+
+    query = {'api_token': api_token or os.environ.get('EODHD_API_TOKEN'), 'fmt': 'json',
+             'from': start_date, 'to': end_date, 'function': indicator}
+    query.update(params)
+    response = requests.get(f'https://eodhd.com/api/technical/{ticker}', params=query, timeout=60)
+    response.raise_for_status()
+
+    df = pd.DataFrame(response.json())
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'])
+    return df.rename(columns={col: f"{indicator}_{col}" for col in df.columns if col != 'date'})
+
+
+def label_returns(returns, threshold=0.05):
+    """'Up' / 'Down' beyond +-threshold, 'Neutral' in between and None where the return is NaN."""
+    returns = np.asarray(returns, dtype=float)
+    with np.errstate(invalid='ignore'):
+        labels = np.select([returns > threshold, returns < -threshold], ['Up', 'Down'], 'Neutral').astype(object)
+    labels[np.isnan(returns)] = None
+    return labels
+
+
+def add_price_features(df, first_row=0):
+    """
+    52-week high / low, forward returns and their labels, computed in place for the rows
+    from ``first_row`` on (the older ones are final), using only the bars they depend on.
+    """
+    begin = max(0, first_row - HIGH_LOW_WINDOW + 1)
+    adjusted = df['adjusted_close'].iloc[begin:]
+    close = df['close'].to_numpy(dtype=float)
+    rows = slice(first_row, len(df))
+    offset = first_row - begin
+
+    for column, method in (('52w_high', 'max'), ('52w_low', 'min')):
+        rolling = getattr(adjusted.rolling(window=HIGH_LOW_WINDOW, min_periods=HIGH_LOW_WINDOW), method)()
+        df.loc[df.index[rows], column] = rolling.to_numpy()[offset:]
+
+    returns = {}
+    for horizon, bars in HORIZONS.items():
+        future = np.full(len(df) - first_row, np.nan)
+        ahead = close[first_row + bars:]
+        future[:len(ahead)] = ahead
+        returns[horizon] = future / close[rows] - 1
+        df.loc[df.index[rows], f'ret_{horizon}'] = returns[horizon]
+    for horizon in HORIZONS:
+        df.loc[df.index[rows], f'target_{horizon}_class'] = label_returns(returns[horizon])
+    return df
+
+
+def prepare_features(df):
+    """
+    Model inputs of the notebook from the stored columns: distances to the price in %,
+    overbought / oversold flags and the nearest Bollinger band. Rows with a missing value
+    are dropped.
+    """
+    df = df.dropna().copy()
+    price = df['adjusted_close']
+
+    for column in ['52w_high', '52w_low', 'sma_sma', 'ema_ema', 'sar_sar']:
+        df[column] = (df[column] - price) / price * 100
+    # As in the study, the WMA feature is taken from the EMA column, once converted
+    df['wma_wma'] = (df['ema_ema'] - price) / price * 100
+
+    for column, upper, lower in [('rsi_rsi', 70, 30), ('stochastic_k_values', 80, 20),
+                                 ('stochastic_d_values', 80, 20), ('cci_cci', 100, -100)]:
+        df[column] = np.select([df[column] > upper, df[column] < lower], [1, -1], default=0).astype('int8')
+
+    df['macd_macd'] = (df['macd_macd'] - df['macd_signal']) / df['macd_signal'] * 100
+    df = df.drop(columns=['macd_signal', 'macd_divergence'])
+
+    # 1, 0 or -1 for the upper, middle or lower band closest to the price (the first on ties)
+    distances = np.abs(price.to_numpy()[:, None] - df[['bbands_uband', 'bbands_mband', 'bbands_lband']].to_numpy())
+    df['bbands_uband'] = np.array([1, 0, -1])[distances.argmin(axis=1)]
+    return df.rename(columns={'bbands_uband': 'bbands_bband'}).drop(columns=['bbands_mband', 'bbands_lband'])
+
+
+def _ticker_folder(root, ticker):
+    return os.path.join(root, f'ticker={ticker}')
+
+
+def read_ticker(root, ticker):
+    """Stored features of one ticker (None if it was never built), from its yearly partitions."""
+    paths = sorted(glob.glob(os.path.join(_ticker_folder(root, ticker), 'year=*', 'part.parquet')))
+    if not paths:
+        return None
+    return pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+
+
+def _write_years(root, ticker, df, years):
+    for year in years:
+        folder = os.path.join(_ticker_folder(root, ticker), f'year={year}')
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, 'part.parquet')
+        # Written aside and renamed, so an interrupted run never leaves a truncated partition
+        df[df['date'].dt.year == year].to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+
+
+def adjustment_changed(stored, ticker, provider):
+    """
+    Whether the adjusted_close / close ratio of the last stored bars differs from the one
+    of the same bars fetched again, i.e. the prices were adjusted since they were stored.
+    """
+    last = stored.iloc[-ADJUSTMENT_CHECK_ROWS:]
+    # Straight from the provider, a cache would only return the stored bars again
+    fresh = provider.fetch(ticker, last['date'].iloc[0], last['date'].iloc[-1] + pd.Timedelta(days=1), '1d')
+    fresh = fresh['Adj Close'] / fresh['Close']
+    stored_ratio = pd.Series((last['adjusted_close'] / last['close']).to_numpy(), index=last['date'])
+    common = stored_ratio.index.intersection(fresh.index)
+    return not np.allclose(stored_ratio[common], fresh[common], rtol=1e-4, equal_nan=True)
+
+
+def build_ticker(root, ticker, start_date, end_date, provider=None, cache_root=None):
+    """
+    Build the features of one ticker, or extend the stored ones with the dates after the
+    last stored date. Only the partitions of the years that changed are rewritten, unless
+    the prices were adjusted (a split or a dividend) since the previous build: the ticker
+    is then rebuilt from ``start_date``. Returns the number of new rows.
+    """
+    provider = provider or EODHDProvider()
+    stored = read_ticker(root, ticker)
+    if stored is not None and adjustment_changed(stored, ticker, provider):
+        MarketData(provider, cache_root).clear(ticker)
+        shutil.rmtree(_ticker_folder(root, ticker))
+        stored = None
+    end = pd.Timestamp(end_date)
+    first_new = pd.Timestamp(start_date) if stored is None else stored['date'].max() + pd.Timedelta(days=1)
+    if first_new > end:
+        return 0
+
+    history_start = pd.Timestamp(start_date) if stored is None else first_new - WARMUP
+    prices = MarketData(provider, cache_root).history(ticker, first_new, end + pd.Timedelta(days=1))
+    prices = prices.rename(columns={'Adj Close': 'adjusted_close'}).rename(columns=str.lower)
+    prices = prices.rename_axis('date').reset_index()
+    prices['ticker'] = ticker
+    new = prices.loc[prices['date'] >= first_new, PRICE_COLUMNS]
+    if new.empty:
+        return 0
+    if new['adjusted_close'].isna().all():
+        # prepare_features would drop every row of the ticker
+        raise ValueError(f"No adjusted close in the {provider.name} prices of {ticker}")
+    new = new.assign(**{'52w_high': np.nan, '52w_low': np.nan})
+
+    for indicator, params in INDICATORS:
+        values = fetch_indicator(ticker, indicator, history_start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'),
+                                 getattr(provider, 'api_token', None), **params)
+        if not values.empty:
+            new = pd.merge(new, values, on='date', how='left')
+
+    # Forward returns of the last stored rows change with the new bars
+    first_row = 0 if stored is None else max(0, len(stored) - max(HORIZONS.values()))
+    df = new if stored is None else pd.concat([stored, new], ignore_index=True)
+    df = add_price_features(df, first_row)
+    _write_years(root, ticker, df, df['date'].iloc[first_row:].dt.year.unique())
+    return len(new)
+
+
+class FeatureMatrix:
+    """
+    Model inputs of a FeatureStore as memory-mapped arrays: ``features`` (rows x columns,
+    float32 like XGBoost's DMatrix), ``targets`` (codes of LABELS per horizon), ``dates``
+    and ``tickers`` (codes into ``ticker_names``), with the rows sorted by date.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'columns.json')) as f:
+            meta = json.load(f)
+        self.columns = meta['columns']
+        self.horizons = meta['horizons']
+        self.ticker_names = meta['tickers']
+        for name in ['features', 'targets', 'dates', 'tickers']:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.dates)
+
+    def feature_columns(self, exclude=None):
+        """Positions of the feature columns, without the ``exclude`` ones."""
+        return [i for i, column in enumerate(self.columns) if column not in (exclude or [])]
+
+    def target(self, horizon):
+        return self.targets[:, self.horizons.index(horizon)]
+
+
+class FeatureStore:
+    """
+    Features of the XGBoost technical indicators study, persisted per ticker as Parquet
+    partitioned by ticker and year (``<root>/ticker=MSFT.US/year=2024/part.parquet``).
+
+    ``update`` builds the tickers in a process pool and, for a ticker already stored, only
+    fetches the indicators of the new dates and recomputes the rows they affect (the
+    52-week window and the forward returns of the last bars). ``matrix`` writes the
+    prepared features of all the tickers into memory-mapped arrays for the models.
+    """
+
+    def __init__(self, root, provider=None, cache_root=None, max_workers=None):
+        self.root = root
+        self.provider = provider or EODHDProvider()
+        self.cache_root = cache_root
+        self.max_workers = max_workers
+
+    def tickers(self):
+        return sorted(name[len('ticker='):] for name in os.listdir(self.root) if name.startswith('ticker=')) \
+            if os.path.isdir(self.root) else []
+
+    def update(self, tickers, start_date, end_date):
+        """Build or extend the features of the tickers, returns the number of new rows per ticker."""
+        new_rows = {}
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {ticker: pool.submit(build_ticker, self.root, ticker, start_date, end_date,
+                                           self.provider, self.cache_root) for ticker in tickers}
+            for ticker, future in futures.items():
+                try:
+                    new_rows[ticker] = future.result()
+                except Exception as e:
+                    print(f"Failed to build features for {ticker}: {e}")
+        return new_rows
+
+    def load(self, ticker):
+        return read_ticker(self.root, ticker)
+
+    def frame(self, tickers=None):
+        """Stored features of the tickers in one frame, sorted by ticker and date."""
+        frames = [self.load(ticker) for ticker in tickers or self.tickers()]
+        return pd.concat([frame for frame in frames if frame is not None], ignore_index=True)
+
+    def matrix(self, path, tickers=None):
+        """
+        Write the prepared features and targets of the tickers to ``path`` as .npy arrays
+        and open them memory-mapped. Tickers are read one at a time, so the full matrix
+        never has to fit in memory.
+        """
+        tickers = list(tickers or self.tickers())
+        # First pass: rows, dates and columns of every ticker
+        dates, columns = [], None
+        for ticker in tickers:
+            prepared = prepare_features(self.load(ticker))
+            columns = columns or [c for c in prepared.columns if c not in EXCLUDED_COLUMNS]
+            dates.append(prepared['date'].to_numpy(dtype='datetime64[ns]'))
+        all_dates = np.concatenate(dates)
+        # Rows sorted by date, the tickers in order within a date
+        order = np.argsort(all_dates, kind='stable')
+        position = np.empty_like(order)
+        position[order] = np.arange(len(order))
+
+        os.makedirs(path, exist_ok=True)
+        features = np.lib.format.open_memmap(os.path.join(path, 'features.npy'), mode='w+', dtype=np.float32,
+                                             shape=(len(all_dates), len(columns)))
+        targets = np.lib.format.open_memmap(os.path.join(path, 'targets.npy'), mode='w+', dtype=np.int8,
+                                            shape=(len(all_dates), len(HORIZONS)))
+        ticker_codes = np.empty(len(all_dates), dtype=np.int32)
+        first = 0
+        for code, (ticker, ticker_dates) in enumerate(zip(tickers, dates)):
+            rows = position[first:first + len(ticker_dates)]
+            prepared = prepare_features(self.load(ticker))
+            features[rows] = prepared.reindex(columns=columns).to_numpy(dtype=np.float32)
+            for i, horizon in enumerate(HORIZONS):
+                labels = prepared[f'target_{horizon}_class'].to_numpy()
+                targets[rows, i] = np.searchsorted(LABELS, labels.astype(str))
+            ticker_codes[rows] = code
+            first += len(ticker_dates)
+        features.flush()
+        targets.flush()
+        np.save(os.path.join(path, 'dates.npy'), all_dates[order])
+        np.save(os.path.join(path, 'tickers.npy'), ticker_codes)
+        with open(os.path.join(path, 'columns.json'), 'w') as f:
+            json.dump({'columns': columns, 'horizons': list(HORIZONS), 'tickers': tickers}, f)
+        return FeatureMatrix(path)
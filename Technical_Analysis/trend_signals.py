@@ -0,0 +1,254 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+TREND_METHODS = ['2_ma', 'macd_ma', 'rsi_ma', 'bbands_rsi', 'adx_ma', 'ichimoku_macd']
+
+STATS_COLUMNS = ['max_drawdown', 'sharpe_ratio', 'total_return', 'number_of_long_signals',
+                 'number_of_short_signals']
+
+
+# ----------------------------------------------------------------------
+# Indicators on panels (one column per ticker), with the values of pandas_ta
+# ----------------------------------------------------------------------
+
+def sma(close, length):
+    return close.rolling(length, min_periods=length).mean()
+
+
+def rma(close, length):
+    # Wilder's moving average, as pandas_ta.rma
+    return close.ewm(alpha=1.0 / length, min_periods=length).mean()
+
+
+def ema(close, length):
+    """pandas_ta.ema: seeded with the SMA of the first ``length`` values of every column."""
+    values = close.to_numpy(dtype=float, copy=True)
+    n = len(values)
+    # Columns starting late (listed after the start of the panel) are seeded at their own start
+    first = np.where(np.isnan(values).all(axis=0), n, np.isnan(values).argmin(axis=0))
+    for column, start in enumerate(first):
+        seed = start + length - 1
+        if seed >= n:
+            values[:, column] = np.nan
+            continue
+        values[seed, column] = np.nansum(values[start:seed + 1, column]) / length
+        values[:seed, column] = np.nan
+    return pd.DataFrame(values, index=close.index, columns=close.columns).ewm(span=length, adjust=False).mean()
+
+
+def rsi(close, length=14):
+    change = close.diff()
+    gain = rma(change.clip(lower=0), length)
+    loss = rma(change.clip(upper=0), length)
+    return 100 * gain / (gain + loss.abs())
+
+
+def macd(close, fast=12, slow=26, signal=9):
+    """MACD line and signal line."""
+    line = ema(close, fast) - ema(close, slow)
+    return line, ema(line, signal)
+
+
+def true_range(high, low, close):
+    high_low = high - low
+    # pandas_ta.non_zero_range: a column with a zero range is shifted by epsilon
+    high_low = high_low + (high_low == 0).any() * sys.float_info.epsilon
+    previous_close = close.shift(1)
+    # Largest of the three ranges, skipping NaN like DataFrame.max
+    ranges = np.fmax(np.fmax(high_low.abs().to_numpy(), (high - previous_close).abs().to_numpy()),
+                     (previous_close - low).abs().to_numpy())
+    result = pd.DataFrame(ranges, index=close.index, columns=close.columns)
+    result.iloc[:1] = np.nan
+    return result
+
+
+def adx(high, low, close, length=14):
+    atr = rma(true_range(high, low, close), length)
+    up = high.diff()
+    down = -low.diff()
+    plus = ((up > down) & (up > 0)) * up
+    minus = ((down > up) & (down > 0)) * down
+    plus_di = 100 / atr * rma(plus.mask(plus.abs() < sys.float_info.epsilon, 0), length)
+    minus_di = 100 / atr * rma(minus.mask(minus.abs() < sys.float_info.epsilon, 0), length)
+    dx = 100 * (plus_di - minus_di).abs() / (plus_di + minus_di)
+    return rma(dx, length)
+
+
+def midprice(high, low, length):
+    return (high.rolling(length, min_periods=length).max() + low.rolling(length, min_periods=length).min()) / 2
+
+
+def ichimoku(high, low, tenkan=9, kijun=26, senkou=52):
+    """Conversion and base lines, and the leading spans shifted forward by ``kijun`` bars."""
+    conversion = midprice(high, low, tenkan)
+    base = midprice(high, low, kijun)
+    span_a = (0.5 * (conversion + base)).shift(kijun)
+    span_b = midprice(high, low, senkou).shift(kijun)
+    return conversion, base, span_a, span_b
+
+
+# ----------------------------------------------------------------------
+# Trend rules: (long condition, short condition) as arrays, long wins when both hold
+# ----------------------------------------------------------------------
+
+def _rule_2_ma(ind, period_fast=9, period_slow=21):
+    fast, slow = ind.sma(period_fast), ind.sma(period_slow)
+    return fast > slow, fast < slow
+
+
+def _rule_macd_ma(ind, ma_period=50, macd_fast=12, macd_slow=26, macd_signal=9):
+    ma = ind.sma(ma_period)
+    line, signal = ind.macd(macd_fast, macd_slow, macd_signal)
+    return (ind.close > ma) & (line > signal), (ind.close < ma) & (line < signal)
+
+
+def _rule_rsi_ma(ind, rsi_period=14, ma_fast=14, ma_slow=50):
+    # The notebook's calculate_trend_rsi_ma always uses the 14 and 50 bar MAs
+    strength = ind.rsi(rsi_period)
+    fast, slow = ind.sma(ma_fast), ind.sma(ma_slow)
+    return (strength > 50) & (fast > slow), (strength < 50) & (fast < slow)
+
+
+def _rule_bbands_rsi(ind, bbands_period=5, rsi_period=14):
+    # Only the middle band (the SMA) takes part in the rule
+    middle = ind.sma(bbands_period)
+    strength = ind.rsi(rsi_period)
+    return (ind.close > middle) & (strength > 50), (ind.close < middle) & (strength < 50)
+
+
+def _rule_adx_ma(ind, adx_period=14, fast_ma_period=14, slow_ma_period=50, adx_threshold=25):
+    trending = ind.adx(adx_period) > adx_threshold
+    fast, slow = ind.sma(fast_ma_period), ind.sma(slow_ma_period)
+    return trending & (fast > slow), trending & (fast < slow)
+
+
+def _rule_ichimoku_macd(ind, macd_fast=12, macd_slow=26, macd_signal=9, tenkan=9, kijun=26, senkou=52):
+    conversion, _, _, span_b = ind.ichimoku(tenkan, kijun, senkou)
+    # Like the notebook: the conversion line stands for span A, and the cloud edges follow
+    # Python's max / min, which return span A when span B is NaN and NaN when span A is
+    span_a = conversion
+    with np.errstate(invalid='ignore'):
+        top = np.where(np.isnan(span_b), span_a, np.maximum(span_a, span_b))
+        bottom = np.where(np.isnan(span_b), span_a, np.minimum(span_a, span_b))
+    line, signal = ind.macd(macd_fast, macd_slow, macd_signal)
+    return (ind.close > top) & (line > signal), (ind.close < bottom) & (line < signal)
+
+
+TREND_RULES = {
+    '2_ma': _rule_2_ma,
+    'macd_ma': _rule_macd_ma,
+    'rsi_ma': _rule_rsi_ma,
+    'bbands_rsi': _rule_bbands_rsi,
+    'adx_ma': _rule_adx_ma,
+    'ichimoku_macd': _rule_ichimoku_macd,
+}
+
+
+class TrendSignals:
+    """
+    Trend labels (1 up, -1 down, 0 none) of the Compare_6 methods for a panel of tickers.
+
+    ``high``, ``low`` and ``close`` are frames with one column per ticker on the same
+    dates. Every indicator is computed once for the whole panel and shared by the rules
+    using it (the 14 bar RSI, the 14 and 50 bar MAs and the MACD each serve two methods),
+    and each rule is an np.select over the indicator arrays instead of a row-wise apply.
+    """
+
+    def __init__(self, high, low, close):
+        self.index = close.index
+        self.tickers = list(close.columns)
+        self._high = high.reindex(index=self.index, columns=self.tickers).astype(float)
+        self._low = low.reindex(index=self.index, columns=self.tickers).astype(float)
+        self._close = close.astype(float)
+        self.close = self._close.to_numpy()
+        self._cache = {}
+
+    @classmethod
+    def from_ohlc(cls, df, ticker='Close'):
+        """Single ticker panel from an OHLC frame like the notebook's df."""
+        return cls(df[['High']].set_axis([ticker], axis=1), df[['Low']].set_axis([ticker], axis=1),
+                   df[['Close']].set_axis([ticker], axis=1))
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            result = compute()
+            self._cache[key] = tuple(frame.to_numpy() for frame in result) if isinstance(result, tuple) \
+                else result.to_numpy()
+        return self._cache[key]
+
+    def sma(self, length):
+        return self._cached(('sma', length), lambda: sma(self._close, length))
+
+    def rsi(self, length=14):
+        return self._cached(('rsi', length), lambda: rsi(self._close, length))
+
+    def macd(self, fast=12, slow=26, signal=9):
+        return self._cached(('macd', fast, slow, signal), lambda: macd(self._close, fast, slow, signal))
+
+    def adx(self, length=14):
+        return self._cached(('adx', length), lambda: adx(self._high, self._low, self._close, length))
+
+    def ichimoku(self, tenkan=9, kijun=26, senkou=52):
+        return self._cached(('ichimoku', tenkan, kijun, senkou),
+                            lambda: ichimoku(self._high, self._low, tenkan, kijun, senkou))
+
+    def indicator(self, name, *args):
+        """Cached indicator as a frame (or a tuple of frames), e.g. indicator('sma', 50)."""
+        values = getattr(self, name)(*args)
+        if isinstance(values, tuple):
+            return tuple(pd.DataFrame(v, index=self.index, columns=self.tickers) for v in values)
+        return pd.DataFrame(values, index=self.index, columns=self.tickers)
+
+    def trend_values(self, method, **params):
+        with np.errstate(invalid='ignore'):
+            long, short = TREND_RULES[method](self, **params)
+        return np.select([long, short], [1, -1], 0).astype(np.int8)
+
+    def trend(self, method, **params):
+        """Trend of every ticker for one method, with the notebook's parameters by default."""
+        return pd.DataFrame(self.trend_values(method, **params), index=self.index, columns=self.tickers)
+
+    def trends(self, methods=None):
+        """Trends of several methods, with (method, ticker) columns."""
+        methods = methods or TREND_METHODS
+        return pd.concat({method: self.trend(method) for method in methods}, axis=1)
+
+    def strategy_returns(self, trend):
+        """Daily returns of following a trend (entered at the close it is known)."""
+        trend = np.asarray(trend, dtype=float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            daily = self.close[1:] / self.close[:-1] - 1
+        returns = np.zeros_like(self.close)
+        returns[1:] = daily * trend[:-1]
+        return np.nan_to_num(returns, nan=0.0)
+
+    def equity_curve(self, method, **params):
+        """Equity curve (starting at 100) of following the trend of one method, per ticker."""
+        returns = self.strategy_returns(self.trend_values(method, **params))
+        return pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=self.index, columns=self.tickers)
+
+    def compare(self, methods=None, periods=252):
+        """
+        Stats of calculate_returns for every method and ticker, as rows indexed by
+        (ticker, method).
+        """
+        methods = methods or TREND_METHODS
+        trends = np.stack([self.trend_values(method) for method in methods])
+        returns = np.stack([self.strategy_returns(trend) for trend in trends])
+
+        equity = 100 * np.cumprod(1 + returns, axis=1)
+        drawdown = (equity - np.maximum.accumulate(equity, axis=1)) / np.maximum.accumulate(equity, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sharpe = returns.mean(axis=1) / returns.std(axis=1, ddof=1) * np.sqrt(periods)
+        stats = {
+            'max_drawdown': drawdown.min(axis=1),
+            'sharpe_ratio': sharpe,
+            'total_return': equity[:, -1] / equity[:, 0] - 1,
+            'number_of_long_signals': (trends == 1).sum(axis=1),
+            'number_of_short_signals': (trends == -1).sum(axis=1),
+        }
+        index = pd.MultiIndex.from_product([methods, self.tickers], names=['method', 'ticker'])
+        frame = pd.DataFrame({column: values.ravel() for column, values in stats.items()}, index=index)
+        return frame.swaplevel().sort_index(level=0, sort_remaining=False)[STATS_COLUMNS]
@@ -0,0 +1,236 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+BAND_COLUMNS = ['VWAP', 'std', 'Upper_Channel', 'Lower_Channel']
+
+
+def _column(df, name):
+    # The notebooks use both 'close' (FMP) and 'Close' (yfinance, EODHD) columns
+    return df[name] if name in df.columns else df[name.capitalize()]
+
+
+def typical_price(df):
+    return (_column(df, 'high') + _column(df, 'low') + _column(df, 'close')) / 3
+
+
+def _local_index(index):
+    index = pd.DatetimeIndex(index)
+    # Sessions follow the exchange's wall clock, like index.date on a tz-aware index
+    return index.tz_localize(None) if index.tz is not None else index
+
+
+def _after_anchor(index, anchor):
+    return _local_index(index) >= pd.Timestamp(anchor).tz_localize(None)
+
+
+def session_codes(index, session='D'):
+    """Number of the session (day by default, any pandas period) of every bar, 0 for a single session."""
+    if session is None:
+        return np.zeros(len(index), dtype=np.int64)
+    periods = _local_index(index).to_period(session)
+    return np.concatenate([[0], np.cumsum(periods[1:] != periods[:-1])]).astype(np.int64)
+
+
+def _within_session(codes, window):
+    # True where the ``window`` bars ending at a bar all belong to its session
+    inside = np.zeros(len(codes), dtype=bool)
+    inside[window - 1:] = codes[window - 1:] == codes[:len(codes) - window + 1]
+    return inside
+
+
+def _expanding_std(values, codes):
+    """Standard deviation (ddof=1, NaN skipped) of the values of each session up to every bar."""
+    values = pd.Series(values)
+    grouped = values.groupby(codes)
+    # Centered on the first value of the session, so the running sums of squares stay accurate
+    centered = values - grouped.transform('first')
+    count = values.notna().groupby(codes).cumsum().to_numpy()
+    total = centered.fillna(0).groupby(codes).cumsum().to_numpy()
+    squares = (centered ** 2).fillna(0).groupby(codes).cumsum().to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = np.maximum(squares - total ** 2 / count, 0) / (count - 1)
+    return np.where(count > 1, np.sqrt(variance), np.nan)
+
+
+def vwap_bands(df, session='D', window=None, std_window=None, std_multiplier=2, anchor=None):
+    """
+    VWAP and standard deviation channels of the VWAP_101 notebook for a whole intraday history.
+
+    The VWAP restarts with every ``session`` (a pandas period such as 'D' or 'W', None for
+    one continuous session) and is cumulative within it, or over the last ``window`` bars
+    of the session. The channels are ``std_multiplier`` standard deviations of the VWAP
+    away from it: the standard deviation of all the VWAP values of the session so far, or
+    of the last ``std_window`` ones. With an ``anchor`` date the bars before it are left NaN.
+
+    Everything comes from grouped cumulative sums and rolling sums masked at the session
+    boundaries, with no per session callback.
+    """
+    result = pd.DataFrame(np.nan, index=df.index, columns=BAND_COLUMNS)
+    if anchor is not None:
+        df = df.loc[_after_anchor(df.index, anchor)]
+    if df.empty:
+        return result
+
+    codes = session_codes(df.index, session)
+    volume = _column(df, 'volume').astype(float)
+    price_volume = typical_price(df) * volume
+    if window is None:
+        vwap = (price_volume.groupby(codes).cumsum() / volume.groupby(codes).cumsum()).to_numpy()
+    else:
+        # Rolling sums over the whole history, dropped where the window spans two sessions
+        vwap = (price_volume.rolling(window).sum() / volume.rolling(window).sum()).to_numpy()
+        vwap = np.where(_within_session(codes, window), vwap, np.nan)
+
+    if std_window is None:
+        std = _expanding_std(vwap, codes)
+    else:
+        std = pd.Series(vwap).rolling(std_window).std().to_numpy()
+        std = np.where(_within_session(codes, std_window), std, np.nan)
+
+    bands = np.column_stack([vwap, std, vwap + std_multiplier * std, vwap - std_multiplier * std])
+    result.loc[df.index, BAND_COLUMNS] = bands
+    return result
+
+
+class VWAP:
+    """
+    VWAP with standard deviation channels, computed for a whole history (``compute``) or
+    bar by bar for live data (``start`` on the history, then ``update`` on every new bar).
+
+    The parameters are the ones of ``vwap_bands``. ``update`` keeps running sums of the
+    session (or of the last ``window`` bars) and a running variance of the VWAP values
+    (Welford, with the value leaving the window removed when ``std_window`` is set), so a
+    new bar costs O(1) whatever the length of the session.
+    """
+
+    def __init__(self, session='D', window=None, std_window=None, std_multiplier=2, anchor=None):
+        self.session = session
+        self.window = window
+        self.std_window = std_window
+        self.std_multiplier = std_multiplier
+        self.anchor = anchor
+        self._reset(None)
+
+    def compute(self, df):
+        return vwap_bands(df, self.session, self.window, self.std_window, self.std_multiplier, self.anchor)
+
+    # ------------------------------------------------------------------
+    # Incremental path
+    # ------------------------------------------------------------------
+
+    def _reset(self, session_end):
+        self._session_end = session_end
+        self._price_volume = 0.0
+        self._volume = 0.0
+        self._bars = deque()
+        self._bars_seen = 0
+        # Running count, mean and sum of squared deviations of the VWAP values
+        self._count, self._mean, self._m2 = 0, 0.0, 0.0
+        self._values = deque()
+        self._missing = 0
+
+    def _next_session_end(self, timestamp):
+        if self.session is None:
+            return pd.Timestamp.max
+        return (timestamp.to_period(self.session) + 1).start_time
+
+    def _add_value(self, value):
+        if np.isnan(value):
+            self._missing += 1
+        else:
+            self._count += 1
+            delta = value - self._mean
+            self._mean += delta / self._count
+            self._m2 += delta * (value - self._mean)
+        if self.std_window is not None:
+            self._values.append(value)
+            if len(self._values) > self.std_window:
+                self._remove_value(self._values.popleft())
+
+    def _remove_value(self, value):
+        if np.isnan(value):
+            self._missing -= 1
+            return
+        self._count -= 1
+        if self._count == 0:
+            self._mean, self._m2 = 0.0, 0.0
+            return
+        delta = value - self._mean
+        self._mean -= delta / self._count
+        self._m2 = max(self._m2 - delta * (value - self._mean), 0.0)
+
+    def _std(self):
+        if self.std_window is not None and (len(self._values) < self.std_window or self._missing):
+            return np.nan
+        return np.sqrt(self._m2 / (self._count - 1)) if self._count > 1 else np.nan
+
+    def update(self, timestamp, high, low, close, volume):
+        """VWAP, std and channels after a new bar, as a dict keyed like the columns of ``compute``."""
+        local = pd.Timestamp(timestamp).tz_localize(None)
+        if self.anchor is not None and local < pd.Timestamp(self.anchor).tz_localize(None):
+            return dict.fromkeys(BAND_COLUMNS, np.nan)
+        if self._session_end is None or local >= self._session_end:
+            self._reset(self._next_session_end(local))
+
+        price_volume = (high + low + close) / 3 * volume
+        self._price_volume += price_volume
+        self._volume += volume
+        if self.window is None:
+            vwap = self._price_volume / self._volume if self._volume else np.nan
+        else:
+            self._bars.append((price_volume, volume))
+            if len(self._bars) > self.window:
+                old_price_volume, old_volume = self._bars.popleft()
+                self._price_volume -= old_price_volume
+                self._volume -= old_volume
+            self._bars_seen += 1
+            if self._bars_seen % self.window == 0:
+                # Re-summed every ``window`` bars, so the rounding errors of the removals do not pile up
+                self._price_volume = sum(bar[0] for bar in self._bars)
+                self._volume = sum(bar[1] for bar in self._bars)
+            full = len(self._bars) == self.window
+            vwap = self._price_volume / self._volume if full and self._volume else np.nan
+
+        self._add_value(vwap)
+        std = self._std()
+        return {'VWAP': vwap, 'std': std, 'Upper_Channel': vwap + self.std_multiplier * std,
+                'Lower_Channel': vwap - self.std_multiplier * std}
+
+    def start(self, df):
+        """Bands of the history, keeping the state of its last session for the bars passed to ``update``."""
+        bands = self.compute(df)
+        self._reset(None)
+        if self.anchor is not None:
+            df = df.loc[_after_anchor(df.index, self.anchor)]
+        if df.empty:
+            return bands
+
+        local = _local_index(df.index)
+        codes = session_codes(df.index, self.session)
+        last = codes == codes[-1]
+        self._session_end = self._next_session_end(local[-1])
+
+        session = df[last]
+        price_volume = (typical_price(session) * _column(session, 'volume')).to_numpy(dtype=float)
+        volume = _column(session, 'volume').to_numpy(dtype=float)
+        if self.window is None:
+            self._price_volume, self._volume = price_volume.sum(), volume.sum()
+        else:
+            self._bars = deque(zip(price_volume[-self.window:], volume[-self.window:]))
+            self._bars_seen = len(self._bars)
+            self._price_volume = sum(bar[0] for bar in self._bars)
+            self._volume = sum(bar[1] for bar in self._bars)
+
+        values = bands['VWAP'].to_numpy()[-len(session):]
+        if self.std_window is not None:
+            values = values[-self.std_window:]
+            self._values = deque(values)
+        valid = values[~np.isnan(values)]
+        self._missing = len(values) - len(valid)
+        self._count = len(valid)
+        if len(valid):
+            self._mean = valid.mean()
+            self._m2 = ((valid - self._mean) ** 2).sum()
+        return bands
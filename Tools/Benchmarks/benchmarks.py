@@ -0,0 +1,441 @@
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+M1_DATA = os.path.join(ROOT, 'Data', 'EURUSD_M1_TestData.csv')
+H1_DATA = os.path.join(ROOT, 'Data', 'EURUSD_H1_TestData.csv')
+PORTFOLIO_DATA = os.path.join(ROOT, 'Porfolio_Streamlit_Dashboard', 'portfolio_1.csv')
+ALLOCATION_DATA = os.path.join(ROOT, 'Strategies', 'Asset_Allocation', 'csv', 'results_of_combinations.csv')
+
+# Folders of the modules under test, imported like the notebooks do (sys.path.append)
+MODULE_FOLDERS = {
+    'portfolio_stats': 'Porfolio_Streamlit_Dashboard',
+    'exposures': 'Porfolio_Streamlit_Dashboard',
+    'valuation': 'Porfolio_Streamlit_Dashboard',
+    'rolling_correlation': 'Porfolio_Streamlit_Dashboard',
+    'session_calendar': os.path.join('Backtesting', 'London Breakout'),
+    'breakout_kernel': os.path.join('Backtesting', 'London Breakout'),
+    'allocation_grid': os.path.join('Strategies', 'Asset_Allocation'),
+    'sma_optimizer': 'Backtesting',
+}
+
+SCALES = [1, 10, 100, 1000]
+SEED = 42
+
+# Days of the base synthetic price panel, scaled by the benchmark scale
+BASE_DAYS = 252
+
+# Currencies of the scaled-up portfolios with their rate to EUR (units per EUR)
+CURRENCY_RATES = {'EUR': 1.0, 'USD': 1.08, 'GBP': 0.86, 'CHF': 0.95, 'JPY': 162.0, 'CAD': 1.47,
+                  'AUD': 1.65, 'SEK': 11.2, 'NOK': 11.6, 'DKK': 7.46, 'HKD': 8.45, 'SGD': 1.45}
+
+ETF_COUNTRIES = {'United States': 62.0, 'Europe': 18.0, 'Japan': 8.0, 'United Kingdom': 5.0, 'Other': 7.0}
+ETF_SECTORS = {'Technology': 35.0, 'Healthcare': 15.0, 'Financial Services': 20.0, 'Industrials': 30.0}
+
+
+def _module(name):
+    folder = os.path.join(ROOT, MODULE_FOLDERS[name])
+    if folder not in sys.path:
+        sys.path.append(folder)
+    return importlib.import_module(name)
+
+
+# ----------------------------------------------------------------------
+# Data sets: the bundled files, scaled up
+# ----------------------------------------------------------------------
+
+def read_ohlc(path):
+    return pd.read_csv(path, index_col='DateTime', parse_dates=True)
+
+
+def tiled_ohlc(path, scale):
+    """
+    The bars of a data file repeated ``scale`` times, each copy shifted by whole weeks
+    after the previous one, so weekdays and trading hours are kept and the history
+    crosses the summer time changes of the years it spans.
+    """
+    df = read_ohlc(path)
+    if scale == 1:
+        return df
+    span = df.index[-1] - df.index[0]
+    shift = pd.Timedelta(weeks=span // pd.Timedelta(weeks=1) + 1)
+    offsets = np.repeat(np.arange(scale) * shift.value, len(df))
+    index = pd.DatetimeIndex(np.tile(df.index.as_unit('ns').asi8, scale) + offsets)
+    return pd.DataFrame(np.tile(df.to_numpy(), (scale, 1)), index=index.rename(df.index.name),
+                        columns=df.columns).astype(df.dtypes.to_dict())
+
+
+def synthetic_prices(assets, n_days, seed=SEED):
+    """Daily close prices of the assets (geometric random walks), some listed after the first day."""
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0003, 0.015, size=(n_days, len(assets)))
+    prices = 100 * np.exp(np.cumsum(returns, axis=0))
+    listed = rng.integers(0, max(1, n_days // 10), size=len(assets))
+    listed[:2] = 0
+    prices[np.arange(n_days)[:, None] < listed[None, :]] = np.nan
+    index = pd.bdate_range('2000-01-03', periods=n_days, name='date')
+    return pd.DataFrame(prices, index=index, columns=list(assets))
+
+
+def synthetic_portfolio(scale, seed=SEED):
+    """
+    portfolio.json and currencies.json content for portfolio_1.csv repeated ``scale``
+    times. The first copy keeps the assets of the file; the others get random
+    quantities, prices and currencies, and the ETFs a look-through breakdown.
+    """
+    rng = np.random.default_rng(seed)
+    base = pd.read_csv(PORTFOLIO_DATA, skipinitialspace=True)
+    currencies = list(CURRENCY_RATES)
+    portfolio = {}
+    for copy in range(scale):
+        for row in base.itertuples(index=False):
+            asset = row.asset if copy == 0 else f'{row.asset}_{copy}'
+            etf = row.asset.split('.')[0] in ('VOO', 'XLK', 'GPIX', 'BULLP')
+            if copy == 0:
+                currency = 'EUR' if row.asset.endswith('.PA') else 'USD'
+            else:
+                currency = currencies[rng.integers(len(currencies))]
+            purchase = float(row.avg_weighted_purchase_price) * rng.uniform(0.8, 1.2)
+            last = purchase * rng.uniform(0.7, 1.5)
+            portfolio[asset] = {
+                'asset': asset,
+                'quantity': float(row.quantity) * (1 if copy == 0 else rng.uniform(0.5, 2)),
+                'currency': currency,
+                'avg_weighted_purchase_price': purchase,
+                'last_price': last,
+                'previous_price': last * rng.uniform(0.97, 1.03),
+                'type': 'ETF' if etf else ('Crypto' if row.asset.endswith('.CC') else 'Common Stock'),
+                'country_exposure': {country: {'Relative_to_Category': share}
+                                     for country, share in ETF_COUNTRIES.items()} if etf else 'Undefined',
+                'sector': {sector: {'Relative_to_Category': share} for sector, share in ETF_SECTORS.items()}
+                if etf else ('Crypto' if row.asset.endswith('.CC') else 'Technology'),
+            }
+    currency_data = {currency: {'rate_to_main': rate} for currency, rate in CURRENCY_RATES.items()}
+
+    valuation = _module('valuation').PortfolioValuation.from_portfolio(portfolio, currency_data)
+    frame = valuation.frame()
+    for asset, details in portfolio.items():
+        details['total_value_in_main_currency'] = frame.at[asset, 'total_value_in_main_currency']
+        details['pnl_in_main_currency'] = frame.at[asset, 'pnl_in_main_currency']
+        details['weight'] = round(frame.at[asset, 'weight'], 2)
+    return portfolio, currency_data
+
+
+def synthetic_asset_returns(assets, n_days, seed=SEED):
+    """Daily returns of the asset classes of the allocation study, the cash at a flat rate."""
+    rng = np.random.default_rng(seed)
+    returns = pd.DataFrame(rng.normal(0.0003, 0.01, size=(n_days, len(assets))), columns=assets,
+                           index=pd.bdate_range('2000-01-03', periods=n_days))
+    if 'MMF' in returns:
+        returns['MMF'] = 0.02 / 252
+    return returns
+
+
+# ----------------------------------------------------------------------
+# Benchmarks
+# ----------------------------------------------------------------------
+
+# name -> function(scale) returning (items, unit, callable timed)
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+@benchmark('dashboard/portfolio_stats')
+def bench_portfolio_stats(scale):
+    # Diversification gauges: covariance of the price panel, then the three metrics
+    PortfolioStats = _module('portfolio_stats').PortfolioStats
+    portfolio, _ = synthetic_portfolio(1)
+    prices = synthetic_prices(portfolio.keys(), BASE_DAYS * scale)
+    weights = [details['weight'] for details in portfolio.values()]
+
+    def run():
+        stats = PortfolioStats(prices, portfolio.keys(), weights)
+        return stats.herfindahl_pdi(), stats.diversification_ratio(), stats.effective_bets()
+    return prices.size, 'prices', run
+
+
+@benchmark('dashboard/headline_metrics')
+def bench_headline_metrics(scale):
+    # Total value, P&L and daily change of the book, from portfolio.json and currencies.json
+    PortfolioValuation = _module('valuation').PortfolioValuation
+    portfolio, currency_data = synthetic_portfolio(scale)
+
+    def run():
+        valuation = PortfolioValuation.from_portfolio(portfolio, currency_data)
+        return valuation.total_value, valuation.total_pnl, valuation.daily_change
+    return len(portfolio), 'positions', run
+
+
+@benchmark('dashboard/valuation_ticks')
+def bench_valuation_ticks(scale):
+    # 100 price ticks of 1% of the positions and an FX tick, the headline figures after each
+    PortfolioValuation = _module('valuation').PortfolioValuation
+    portfolio, currency_data = synthetic_portfolio(scale)
+    valuation = PortfolioValuation.from_portfolio(portfolio, currency_data)
+    rng = np.random.default_rng(SEED)
+    assets = np.array(valuation.assets, dtype=object)
+    ticks = [pd.Series(valuation.last_prices[rows] * rng.uniform(0.99, 1.01, len(rows)), index=assets[rows])
+             for rows in (rng.choice(len(assets), max(1, len(assets) // 100), replace=False) for _ in range(100))]
+
+    def run():
+        for k, tick in enumerate(ticks):
+            valuation.update_prices(tick)
+            if k % 10 == 0:
+                valuation.update_rates({'USD': CURRENCY_RATES['USD'] * (1 + k / 1000)})
+            valuation.total_value, valuation.total_pnl, valuation.daily_change
+    return len(ticks), 'ticks', run
+
+
+@benchmark('dashboard/exposures')
+def bench_exposures(scale):
+    # Compilation of the exposure matrices and the pie chart breakdowns of the dashboard
+    ExposureEngine = _module('exposures').ExposureEngine
+    portfolio, _ = synthetic_portfolio(scale)
+
+    def run():
+        engine = ExposureEngine(portfolio)
+        engine.breakdown('type', by='weight', name='type')
+        engine.breakdown('currency', by='weight', name='Currency')
+        engine.breakdown('country', min_percentage=3, top_n=4)
+        engine.breakdown('sector', min_percentage=3, top_n=5)
+    return len(portfolio), 'positions', run
+
+
+@benchmark('dashboard/rolling_correlation')
+def bench_rolling_correlation(scale):
+    # All the pairwise 90 days rolling correlations of the portfolio assets, as on a first rerun
+    RollingCorrelationEngine = _module('rolling_correlation').RollingCorrelationEngine
+    portfolio, _ = synthetic_portfolio(1)
+    prices = synthetic_prices(portfolio.keys(), BASE_DAYS * scale)
+    n_pairs = len(prices.columns) * (len(prices.columns) - 1) // 2
+
+    def run():
+        return RollingCorrelationEngine(prices).rolling(list(prices.columns), 90)
+    return len(prices) * n_pairs, 'pair-days', run
+
+
+def _label_sessions(path, scale):
+    label_sessions = _module('session_calendar').label_sessions
+    df = tiled_ohlc(path, scale)
+    return len(df), 'bars', lambda: label_sessions(df)
+
+
+@benchmark('sessions/label_m1')
+def bench_label_sessions_m1(scale):
+    return _label_sessions(M1_DATA, scale)
+
+
+@benchmark('sessions/label_h1')
+def bench_label_sessions_h1(scale):
+    return _label_sessions(H1_DATA, scale)
+
+
+@benchmark('allocation/grid')
+def bench_allocation_grid(scale):
+    # The grid of results_of_combinations.csv repeated ``scale`` times, on a year of returns
+    AllocationGridEngine = _module('allocation_grid').AllocationGridEngine
+    assets = ['STOCKS', 'BONDS', 'COMMODITIES', 'REAL-ESTATE', 'MMF']
+    grid = pd.read_csv(ALLOCATION_DATA, usecols=assets)
+    grid = pd.concat([grid] * scale, ignore_index=True)
+    engine = AllocationGridEngine(synthetic_asset_returns(assets, BASE_DAYS))
+    return len(grid), 'combinations', lambda: engine.evaluate(grid)
+
+
+def _asian_range(df):
+    # High and low of the Asian session, kept during Asia and London (cell 3 of the notebook)
+    outside = ~df['LondonOpen'] & ~df['AsiaOpen']
+    for column, price, aggregate in (('HighAsianSession', 'High', 'max'), ('LowAsianSession', 'Low', 'min')):
+        df[column] = df.groupby('AsianSession')[price].transform(aggregate).where(df['AsiaOpen']).ffill()
+        df.loc[outside, column] = np.nan
+    return df
+
+
+@benchmark('backtests/london_breakout')
+def bench_london_breakout(scale):
+    LondonBreakoutKernel = _module('breakout_kernel').LondonBreakoutKernel
+    df = tiled_ohlc(M1_DATA, scale)[['Open', 'High', 'Low', 'Close']]
+    df.index = df.index.tz_localize('GMT')
+    df = _asian_range(_module('session_calendar').label_sessions(df))
+    return len(df), 'bars', lambda: LondonBreakoutKernel().run(df)
+
+
+@benchmark('backtests/sma_cross_grid')
+def bench_sma_cross_grid(scale):
+    # 20 SmaCross runs on the H1 bars, the SMAs served from the indicator cache
+    SmaCrossOptimizer = _module('sma_optimizer').SmaCrossOptimizer
+    df = tiled_ohlc(H1_DATA, scale)
+    optimizer = SmaCrossOptimizer(df, n_jobs=1, commission=.002, exclusive_orders=True)
+    ranges = {'sma_fast_length': range(5, 22, 4), 'sma_slow_length': range(50, 201, 50)}
+    n_runs = len(optimizer.grid(**ranges))
+    return len(df) * n_runs, 'bar-runs', lambda: optimizer.optimize(maximize='Return [%]', **ranges)
+
+
+# ----------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------
+
+def measure(run, repeat=3, min_time=0.05):
+    """
+    Wall time per run of ``repeat`` samples, then the peak traced memory of one more run
+    (bytes). Fast callables are run several times per sample, so a sample lasts at least
+    ``min_time`` seconds and the timer resolution does not matter.
+    """
+    start = time.perf_counter()
+    run()
+    first = time.perf_counter() - start
+    number = max(1, int(np.ceil(min_time / first))) if first > 0 else 1
+
+    # A slow first run already is a sample
+    times = [first] if number == 1 else []
+    while len(times) < repeat:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        times.append((time.perf_counter() - start) / number)
+    # Traced separately, tracemalloc slows down the allocations it records
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return times, peak
+
+
+def run_benchmarks(names, scales, repeat=3, log=print):
+    results = []
+    for name in names:
+        for scale in scales:
+            result = {'benchmark': name, 'scale': scale}
+            try:
+                items, unit, run = BENCHMARKS[name](scale)
+                times, peak = measure(run, repeat)
+            except ImportError as e:
+                # Backtests need backtesting.py, the rest only the numerical stack
+                result.update(status='skipped', reason=str(e))
+            except Exception as e:
+                result.update(status='error', reason=f'{type(e).__name__}: {e}')
+            else:
+                best = min(times)
+                result.update(status='ok', items=items, unit=unit, best_s=best, median_s=float(np.median(times)),
+                              throughput=items / best if best else float('inf'), peak_memory_mb=peak / 1024 ** 2)
+            results.append(result)
+            log(_format(result))
+    return results
+
+
+def _format(result):
+    label = f"{result['benchmark']:<30} x{result['scale']:<5}"
+    if result['status'] != 'ok':
+        return f"{label} {result['status']}: {result['reason']}"
+    return (f"{label} {result['best_s'] * 1000:10.2f} ms  {result['throughput']:14,.0f} {result['unit']}/s"
+            f"  {result['peak_memory_mb']:9.1f} MB")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def save_results(results, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+
+def compare(results, baseline_path, threshold=1.25):
+    """
+    Best times against a previous results file, per benchmark and scale. Returns the
+    comparison and whether some benchmark got slower than ``threshold`` times its baseline.
+    """
+    with open(baseline_path) as f:
+        baseline = {(r['benchmark'], r['scale']): r for r in json.load(f)['results'] if r['status'] == 'ok'}
+    rows = []
+    for result in results:
+        before = baseline.get((result['benchmark'], result['scale']))
+        if result['status'] != 'ok' or before is None:
+            continue
+        rows.append({'benchmark': result['benchmark'], 'scale': result['scale'],
+                     'baseline_ms': before['best_s'] * 1000, 'best_ms': result['best_s'] * 1000,
+                     'time_ratio': result['best_s'] / before['best_s'],
+                     'memory_ratio': result['peak_memory_mb'] / before['peak_memory_mb']
+                     if before['peak_memory_mb'] else np.nan})
+    comparison = pd.DataFrame(rows, columns=['benchmark', 'scale', 'baseline_ms', 'best_ms', 'time_ratio',
+                                             'memory_ratio'])
+    return comparison, bool((comparison['time_ratio'] > threshold).any())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks of the dashboard metrics, session labelling, allocation grid and "
+                    "backtests, on the bundled data sets scaled up. Writes throughput and peak memory to a "
+                    "JSON results file.")
+    parser.add_argument('-k', '--filter', default='', help="Only the benchmarks whose name contains this text")
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES)
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per benchmark, the best is kept")
+    parser.add_argument('--output', help="Results file (default: results/benchmarks-<date>.json)")
+    parser.add_argument('--compare', help="Previous results file to compare with")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="Slowdown ratio over the baseline reported as a regression")
+    parser.add_argument('--list', action='store_true', help="List the benchmarks and exit")
+    args = parser.parse_args(argv)
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    if args.list:
+        print('\n'.join(names))
+        return 0
+
+    # backtesting.py warns about the trades still open at the end of every run
+    warnings.filterwarnings('ignore')
+    results = run_benchmarks(names, args.scales, args.repeat)
+    output = args.output or os.path.join(RESULTS_DIR, f"benchmarks-{datetime.now():%Y%m%d-%H%M%S}.json")
+    save_results(results, output)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        comparison, regressed = compare(results, args.compare, args.threshold)
+        print(comparison.to_string(index=False, float_format='{:.3f}'.format))
+        if regressed:
+            print(f"Slower than {args.threshold}x the baseline")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import matplotlib.dates as mdates
+import numpy as np
+import pandas as pd
+from matplotlib.collections import LineCollection
+
+# Line colors of the notebooks: up trend, down trend, anything else
+TREND_COLORS = {1: 'green', -1: 'red', 0: 'darkgrey'}
+
+
+def _x_values(x):
+    x = pd.Index(x)
+    if isinstance(x, pd.DatetimeIndex):
+        if x.tz is not None:
+            x = x.tz_localize(None)
+        return mdates.date2num(x.to_numpy()), True
+    return x.to_numpy(dtype=float), False
+
+
+def downsample(y, max_points):
+    """
+    Positions of the bars kept to draw ``y`` with about ``max_points`` points.
+
+    The bars are split in buckets and the first, lowest, highest and last bar of every
+    bucket are kept, so the drawn line still reaches every peak and trough.
+    """
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    size = -(-n // max(1, max_points // 4))
+    starts = np.arange(0, n, size)
+    padded = np.full(len(starts) * size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(len(starts), size)
+    lowest = np.where(np.isnan(buckets), np.inf, buckets).argmin(axis=1) + starts
+    highest = np.where(np.isnan(buckets), -np.inf, buckets).argmax(axis=1) + starts
+    lowest, highest = np.minimum(lowest, n - 1), np.minimum(highest, n - 1)
+    ends = np.minimum(starts + size, n) - 1
+    return np.unique(np.concatenate([starts, lowest, highest, ends]))
+
+
+def trend_segments(x, y, signal, max_points=5_000):
+    """
+    Polylines of consecutive bars with the same signal, and the signal of each.
+
+    The line from a bar to the next one takes the signal of the next bar, like the
+    notebooks' per-bar plots, and every run of equal signals is one polyline.
+    """
+    y = np.asarray(y, dtype=float)
+    keep = downsample(y, max_points)
+    x_values, _ = _x_values(pd.Index(x)[keep])
+    y, signal = y[keep], np.asarray(signal)[keep]
+    if len(y) < 2:
+        return [], np.array([], dtype=signal.dtype)
+
+    # Runs of equal signals over the bars 1..n-1, each drawn from the bar before it
+    changes = np.flatnonzero(signal[2:] != signal[1:-1]) + 2
+    starts = np.concatenate([[1], changes])
+    ends = np.concatenate([changes, [len(y)]])
+    points = np.column_stack([x_values, y])
+    segments = [points[start - 1:end] for start, end in zip(starts, ends)]
+    return segments, signal[starts]
+
+
+def plot_trend(ax, x, y, signal, colors=None, max_points=5_000, linewidth=2, **kwargs):
+    """
+    Draw ``y`` colored by ``signal`` (1 up, -1 down, other values neutral) as a single
+    LineCollection, whatever the number of bars.
+
+    Replaces the loops of ``ax.plot`` calls over each pair of bars. Series longer than
+    ``max_points`` are downsampled for display first. Returns the collection.
+    """
+    colors = {**TREND_COLORS, **(colors or {})}
+    segments, run_signals = trend_segments(x, y, signal, max_points)
+    run_colors = [colors.get(value, colors[0]) if not pd.isna(value) else colors[0] for value in run_signals]
+    collection = LineCollection(segments, colors=run_colors, linewidths=linewidth, **kwargs)
+    ax.add_collection(collection)
+
+    _, is_date = _x_values(pd.Index(x)[:1])
+    if is_date:
+        ax.xaxis_date()
+    ax.autoscale_view()
+    return collection
@@ -0,0 +1,413 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+# FIELDS name of the columns of the EODHD and FMP bars
+RAW_COLUMNS = {'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'adjusted_close': 'Adj Close',
+               'adjClose': 'Adj Close', 'volume': 'Volume'}
+
+# Version of the cached series: entries written by another version are fetched again
+# (before 2, the EODHD and FMP series were cached without their Adj Close)
+CACHE_VERSION = 2
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.market_data')
+
+NS_PER_SECOND = 10 ** 9
+
+
+def _timestamp(value):
+    # Bounds are wall-clock times like the yf.download start / end arguments
+    value = pd.Timestamp(value)
+    return value.tz_localize(None) if value.tz is not None else value
+
+
+def _normalize(frame):
+    """Provider result as a sorted frame with a DatetimeIndex named Date and the FIELDS columns."""
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=FIELDS, index=pd.DatetimeIndex([], name='Date'), dtype=float)
+    if isinstance(frame.columns, pd.MultiIndex):
+        # yf.download with a single ticker still returns (field, ticker) columns
+        frame = frame.droplevel(-1, axis=1)
+    frame = frame.reindex(columns=FIELDS).astype(float)
+    frame.index = pd.DatetimeIndex(frame.index, name='Date')
+    frame = frame[~frame.index.duplicated(keep='last')]
+    return frame.sort_index()
+
+
+def _slice(frame, start, end):
+    """Rows in [start, end), with naive bounds taken in the timezone of the index."""
+    index = frame.index
+    if index.tz is not None:
+        start, end = start.tz_localize(index.tz), end.tz_localize(index.tz)
+    return frame[(index >= start) & (index < end)]
+
+
+def _missing(start, end, covered):
+    """Parts of [start, end) not in the sorted, disjoint covered intervals."""
+    gaps = []
+    cursor = start
+    for low, high in covered:
+        if high <= cursor:
+            continue
+        if low >= end:
+            break
+        if low > cursor:
+            gaps.append((cursor, low))
+        cursor = max(cursor, high)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def _union(covered, low, high):
+    """Sorted, disjoint covered intervals with [low, high) added."""
+    merged = []
+    for interval in sorted(covered + [[low, high]]):
+        if merged and interval[0] <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], interval[1])
+        else:
+            merged.append(list(interval))
+    return merged
+
+
+def _split(start, end, max_span):
+    # Providers limit the range of a single request (mostly for intraday data)
+    if max_span is None:
+        return [(start, end)]
+    step = max_span.value
+    return [(low, min(low + step, end)) for low in range(start, end, step)]
+
+
+def _get_json(url, params):
+    import requests
+
+    response = requests.get(url, params=params, timeout=60)
+    response.raise_for_status()
+    return response.json()
+
+
+# ----------------------------------------------------------------------
+# Providers
+# ----------------------------------------------------------------------
+
+class YFinanceProvider:
+    """Yahoo Finance through yfinance, with the tickers and intervals of yf.download."""
+
+    name = 'yfinance'
+
+    # Longest range Yahoo serves in one request for the intraday intervals
+    MAX_SPAN = {'1m': pd.Timedelta(days=7), '2m': pd.Timedelta(days=59), '5m': pd.Timedelta(days=59),
+                '15m': pd.Timedelta(days=59), '30m': pd.Timedelta(days=59), '60m': pd.Timedelta(days=729),
+                '90m': pd.Timedelta(days=59), '1h': pd.Timedelta(days=729)}
+
+    def max_span(self, interval):
+        return self.MAX_SPAN.get(interval)
+
+    def fetch(self, symbol, start, end, interval):
+        import yfinance as yf
+
+        frame = yf.download(symbol, start=start, end=end, interval=interval,
+                            progress=False, auto_adjust=False, threads=False)
+        return _normalize(frame)
+
+
+class EODHDProvider:
+    """
+    End-of-day and intraday prices from eodhd.com, for symbols like ``AAPL.US`` or
+    ``EURUSD.FOREX``. The token defaults to the EODHD_API_TOKEN environment variable.
+    """
+
+    name = 'eodhd'
+    BASE_URL = 'https://eodhd.com/api'
+    PERIODS = {'1d': 'd', '1wk': 'w', '1mo': 'm'}
+    MAX_SPAN = {'1m': pd.Timedelta(days=120), '5m': pd.Timedelta(days=600), '1h': pd.Timedelta(days=7200)}
+
+    def __init__(self, api_token=None):
+        self.api_token = api_token or os.environ.get('EODHD_API_TOKEN')
+
+    def max_span(self, interval):
+        return self.MAX_SPAN.get(interval)
+
+    def fetch(self, symbol, start, end, interval):
+        if interval in self.PERIODS:
+            # 'to' is inclusive
+            data = _get_json(f'{self.BASE_URL}/eod/{symbol}', {
+                'api_token': self.api_token, 'fmt': 'json', 'order': 'a', 'period': self.PERIODS[interval],
+                'from': start.strftime('%Y-%m-%d'),
+                'to': (end - pd.Timedelta(days=1)).strftime('%Y-%m-%d'),
+            })
+            frame = pd.DataFrame(data)
+            if frame.empty:
+                return _normalize(None)
+            frame = frame.set_index(pd.to_datetime(frame['date']))
+        elif interval in self.MAX_SPAN:
+            # Intraday bars are requested and returned in UTC
+            data = _get_json(f'{self.BASE_URL}/intraday/{symbol}', {
+                'api_token': self.api_token, 'fmt': 'json', 'interval': interval,
+                'from': start.value // NS_PER_SECOND, 'to': end.value // NS_PER_SECOND - 1,
+            })
+            frame = pd.DataFrame(data)
+            if frame.empty:
+                return _normalize(None)
+            frame = frame.set_index(pd.to_datetime(frame['timestamp'], unit='s', utc=True))
+            frame['Adj Close'] = frame['close']
+        else:
+            raise ValueError(f"Unsupported interval for {self.name}: {interval}")
+        return _normalize(frame.rename(columns=RAW_COLUMNS))
+
+
+class FMPProvider:
+    """
+    Prices from financialmodelingprep.com: daily bars for ``1d`` and the historical-chart
+    timeframes (``1min``, ``5min``, ``15min``, ``30min``, ``1hour``, ``4hour``) otherwise.
+    The key defaults to the FMP_API_KEY environment variable.
+    """
+
+    name = 'fmp'
+    BASE_URL = 'https://financialmodelingprep.com/api/v3'
+    TIMEFRAMES = ['1min', '5min', '15min', '30min', '1hour', '4hour']
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key or os.environ.get('FMP_API_KEY')
+
+    def max_span(self, interval):
+        # The historical chart only returns about a month of intraday bars per request
+        return pd.Timedelta(days=31) if interval in self.TIMEFRAMES else None
+
+    def fetch(self, symbol, start, end, interval):
+        params = {'apikey': self.api_key, 'from': start.strftime('%Y-%m-%d'),
+                  'to': (end - pd.Timedelta(days=1)).strftime('%Y-%m-%d')}
+        if interval == '1d':
+            data = _get_json(f'{self.BASE_URL}/historical-price-full/{symbol}', params).get('historical', [])
+        elif interval in self.TIMEFRAMES:
+            data = _get_json(f'{self.BASE_URL}/historical-chart/{interval}/{symbol}', params)
+        else:
+            raise ValueError(f"Unsupported interval for {self.name}: {interval}")
+        frame = pd.DataFrame(data)
+        if frame.empty:
+            return _normalize(None)
+        frame = frame.set_index(pd.to_datetime(frame['date']))
+        if 'adjClose' not in frame:
+            frame['adjClose'] = frame['close']
+        return _slice(_normalize(frame.rename(columns=RAW_COLUMNS)), start, end)
+
+
+class FileProvider:
+    """
+    Offline provider reading ``<root>/<symbol>_<interval>.parquet`` (or ``.csv``) files.
+
+    Stands in for a web provider in notebooks and tests: record the data once with
+    ``write`` (or drop exported files in the folder) and every fetch is served from disk.
+    """
+
+    def __init__(self, root, name='file'):
+        self.root = root
+        self.name = name
+
+    def max_span(self, interval):
+        return None
+
+    def _path(self, symbol, interval, extension):
+        return os.path.join(self.root, f"{re.sub(r'[^A-Za-z0-9._=^-]', '_', symbol)}_{interval}.{extension}")
+
+    def write(self, symbol, interval, frame):
+        os.makedirs(self.root, exist_ok=True)
+        _normalize(frame).to_parquet(self._path(symbol, interval, 'parquet'))
+
+    def fetch(self, symbol, start, end, interval):
+        path = self._path(symbol, interval, 'parquet')
+        if os.path.exists(path):
+            frame = pd.read_parquet(path)
+        elif os.path.exists(self._path(symbol, interval, 'csv')):
+            frame = pd.read_csv(self._path(symbol, interval, 'csv'), index_col=0, parse_dates=True)
+        else:
+            raise FileNotFoundError(f"No {interval} data for {symbol} in {self.root}")
+        return _slice(_normalize(frame), start, end)
+
+
+def default_provider():
+    """FileProvider of the MARKET_DATA_DIR folder when the variable is set, Yahoo Finance otherwise."""
+    root = os.environ.get('MARKET_DATA_DIR')
+    return FileProvider(root) if root else YFinanceProvider()
+
+
+# ----------------------------------------------------------------------
+# Cache
+# ----------------------------------------------------------------------
+
+class MarketData:
+    """
+    Local cache of provider prices shared by the notebooks.
+
+    Every (provider, symbol, interval) series is stored once, under the hash of its key, as
+    a Parquet file with one column per field next to a JSON file listing the date ranges
+    already fetched. A request only fetches the ranges it is missing, and ranges reaching
+    into the current day are fetched again on the next request. Concurrent requests for
+    the same series wait for each other instead of downloading the same data, and lists
+    of symbols are fetched concurrently by at most ``max_concurrency`` threads.
+    """
+
+    def __init__(self, provider=None, root=None, max_concurrency=8):
+        self.provider = provider or default_provider()
+        self.root = root or os.environ.get('MARKET_DATA_CACHE', DEFAULT_ROOT)
+        self.max_concurrency = max_concurrency
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._executor = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}(provider={self.provider.name!r}, root={self.root!r})"
+
+    def key(self, symbol, interval):
+        return hashlib.sha1(f'{self.provider.name}|{symbol}|{interval}'.encode()).hexdigest()
+
+    def _paths(self, key):
+        folder = os.path.join(self.root, key[:2])
+        return os.path.join(folder, f'{key}.parquet'), os.path.join(folder, f'{key}.json')
+
+    def _lock(self, key):
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _read_meta(self, key):
+        _, meta_path = self._paths(key)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _read(self, key, meta, columns=None):
+        data_path, _ = self._paths(key)
+        frame = pd.read_parquet(data_path, columns=columns)
+        if meta['tz']:
+            # Stored as UTC wall-clock times
+            frame.index = frame.index.tz_localize('UTC').tz_convert(meta['tz'])
+        return frame
+
+    def _write(self, key, meta, frame):
+        data_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        if frame.index.tz is not None:
+            frame = frame.tz_convert('UTC').tz_localize(None)
+        # Written aside and renamed, so an interrupted write never leaves a truncated file
+        frame.to_parquet(data_path + '.tmp')
+        os.replace(data_path + '.tmp', data_path)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def _update(self, key, symbol, interval, start, end):
+        """Fetch the parts of [start, end) missing from the cache, return the meta of the series."""
+        with self._lock(key):
+            # Read once the lock is held: a concurrent request may have fetched the range already
+            meta = self._read_meta(key)
+            if meta is None or meta.get('version') != CACHE_VERSION:
+                meta = {'version': CACHE_VERSION, 'provider': self.provider.name, 'symbol': symbol,
+                        'interval': interval, 'tz': None, 'covered': []}
+            gaps = _missing(start.value, end.value, meta['covered'])
+            if not gaps:
+                return meta
+
+            fetched = [self.provider.fetch(symbol, pd.Timestamp(low), pd.Timestamp(high), interval)
+                       for gap in gaps for low, high in _split(*gap, self.provider.max_span(interval))]
+            if meta['covered']:
+                fetched.insert(0, self._read(key, meta))
+            frame = _normalize(pd.concat([part for part in fetched if not part.empty] or [fetched[0]]))
+            if frame.index.tz is not None:
+                meta['tz'] = str(frame.index.tz)
+
+            # Bars of the current day are not final yet
+            horizon = pd.Timestamp.now(tz='UTC').tz_localize(None).normalize().value
+            for low, high in gaps:
+                if min(high, horizon) > low:
+                    meta['covered'] = _union(meta['covered'], low, min(high, horizon))
+            self._write(key, meta, frame)
+            return meta
+
+    def history(self, symbol, start, end=None, interval='1d', fields=None):
+        """
+        Bars of one symbol in [start, end) (end defaults to tomorrow), fetching only the
+        missing ranges. ``fields`` selects some of the FIELDS columns.
+        """
+        start = _timestamp(start)
+        end = _timestamp(end) if end is not None else pd.Timestamp.now().normalize() + pd.Timedelta(days=1)
+        key = self.key(symbol, interval)
+        meta = self._update(key, symbol, interval, start, end)
+        data_path, _ = self._paths(key)
+        if not os.path.exists(data_path):
+            return _normalize(None)[fields or FIELDS]
+        return _slice(self._read(key, meta, columns=fields), start, end)
+
+    async def ahistory(self, symbol, start, end=None, interval='1d', fields=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool(), self.history, symbol, start, end, interval, fields)
+
+    @staticmethod
+    def _columns(symbols, results, field, errors):
+        # One column per symbol; with errors='skip' a symbol that failed is an all-NaN column
+        columns = []
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                if errors == 'raise':
+                    raise result
+                logger.warning("Skipping %s: %s", symbol, result)
+            else:
+                columns.append(result[field].rename(symbol))
+        frame = pd.concat(columns, axis=1) if columns else _normalize(None)[[]]
+        return frame.reindex(columns=list(symbols))
+
+    async def aget(self, symbols, start, end=None, interval='1d', field='Adj Close', errors='skip'):
+        """
+        One field of many symbols as a frame with one column per symbol, fetched concurrently.
+        A symbol that cannot be fetched (delisted, unknown) is logged and left as an all-NaN
+        column with ``errors='skip'``, or raises with ``errors='raise'``.
+        """
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        results = await asyncio.gather(*[self.ahistory(symbol, start, end, interval, [field]) for symbol in symbols],
+                                       return_exceptions=True)
+        return self._columns(symbols, results, field, errors)
+
+    def get(self, symbols, start, end=None, interval='1d', field='Adj Close', errors='skip'):
+        """Same as aget, from synchronous code (a notebook cell)."""
+        if isinstance(symbols, str):
+            symbols = [symbols]
+
+        def history(symbol):
+            try:
+                return self.history(symbol, start, end, interval, [field])
+            except Exception as e:
+                return e
+
+        return self._columns(symbols, list(self._pool().map(history, symbols)), field, errors)
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        return self._executor
+
+    def clear(self, symbol=None, interval=None):
+        """Remove a cached series, or all the series of the provider when no symbol is given."""
+        if symbol is not None:
+            keys = [self.key(symbol, interval or '1d')]
+        else:
+            keys = [name[:-len('.json')] for folder, _, names in os.walk(self.root) for name in names
+                    if name.endswith('.json')]
+        for key in keys:
+            meta = self._read_meta(key)
+            if meta is None or meta['provider'] != self.provider.name:
+                continue
+            for path in self._paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,311 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+NS_PER_SECOND = 10 ** 9
+NS_PER_MINUTE = 60 * NS_PER_SECOND
+NS_PER_DAY = 24 * 60 * NS_PER_MINUTE
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Bar size of each timeframe, in minutes. Every bar falls within a day, so the
+# aggregates are computed and cached day by day.
+TIMEFRAMES = {'M1': 1, 'M5': 5, 'M15': 15, 'M30': 30, 'H1': 60, 'H4': 240, 'D1': 1440}
+
+# Column names of the MetaTrader bar and tick exports
+MT_BAR_COLUMNS = {'<OPEN>': 'Open', '<HIGH>': 'High', '<LOW>': 'Low', '<CLOSE>': 'Close'}
+MT_TICK_COLUMNS = {'<BID>': 'Bid', '<ASK>': 'Ask'}
+# Volume of the bar exports, the first of these columns present; NaN without any
+MT_VOLUME_COLUMNS = ['<TICKVOL>', '<VOL>']
+
+# Days of M1 bars read at once to build the aggregates of a timeframe
+AGGREGATE_BATCH_DAYS = 20
+
+
+# ----------------------------------------------------------------------
+# Timestamps
+# ----------------------------------------------------------------------
+
+def _nanoseconds(values):
+    return pd.DatetimeIndex(values).as_unit('ns').asi8
+
+
+def parse_timestamps(dates, times=None):
+    """
+    Nanosecond timestamps (int64) of date and time strings, or of 'date time' strings.
+
+    Exports repeat the same few thousand dates and the same 1440 minutes of the day on
+    every row, so separate date and time columns are factorized and only their distinct
+    values are parsed. Single ISO 8601 timestamps go through the pandas ISO parser.
+    """
+    if times is None:
+        try:
+            return _nanoseconds(pd.to_datetime(pd.Series(dates), format='ISO8601'))
+        except ValueError:
+            return _nanoseconds(pd.to_datetime(pd.Series(dates)))
+
+    date_codes, unique_dates = pd.factorize(np.asarray(dates, dtype=object))
+    time_codes, unique_times = pd.factorize(np.asarray(times, dtype=object))
+    # MT exports write dates as 'YYYY.MM.DD' and times as 'HH:MM', 'HH:MM:SS' or 'HH:MM:SS.fff'
+    day_ns = _nanoseconds(pd.to_datetime(pd.Series(unique_dates).str.replace('.', '-', regex=False),
+                                         format='ISO8601'))
+    unique_times = pd.Series(unique_times)
+    unique_times = unique_times.where(unique_times.str.len() != 5, unique_times + ':00')
+    time_ns = pd.to_timedelta(unique_times).to_numpy(dtype='timedelta64[ns]').astype(np.int64)
+    return day_ns[date_codes] + time_ns[time_codes]
+
+
+# ----------------------------------------------------------------------
+# Bars
+# ----------------------------------------------------------------------
+
+def _bar_frame(ns, columns):
+    index = pd.DatetimeIndex(np.asarray(ns, dtype='datetime64[ns]'), name='DateTime')
+    return pd.DataFrame(columns, index=index)[OHLCV_COLUMNS]
+
+
+def _volume(chunk, names):
+    # First volume column of the chunk, NaN when the export has none
+    name = next((name for name in names if name in chunk.columns), None)
+    return chunk[name].to_numpy() if name is not None else np.full(len(chunk), np.nan)
+
+
+def resample_bars(bars, timeframe):
+    """
+    OHLCV bars aggregated to a timeframe ('M5', 'H1', 'H4', 'D1', ...), without empty bars.
+
+    ``bars`` must be sorted by time. Bars start at multiples of the timeframe from midnight.
+    """
+    if timeframe == 'M1' or len(bars) == 0:
+        return bars
+    ns = bars.index.as_unit('ns').asi8
+    bucket = ns // (TIMEFRAMES[timeframe] * NS_PER_MINUTE)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(bucket)] - 1
+    return _bar_frame(bucket[starts] * TIMEFRAMES[timeframe] * NS_PER_MINUTE, {
+        'Open': bars['Open'].to_numpy()[starts],
+        'High': np.maximum.reduceat(bars['High'].to_numpy(), starts),
+        'Low': np.minimum.reduceat(bars['Low'].to_numpy(), starts),
+        'Close': bars['Close'].to_numpy()[ends],
+        'Volume': np.add.reduceat(bars['Volume'].to_numpy(), starts),
+    })
+
+
+def _ticks_to_bars(ns, bid):
+    # M1 bars of the bid price, the volume being the number of ticks
+    minute = ns // NS_PER_MINUTE
+    starts = np.flatnonzero(np.r_[True, minute[1:] != minute[:-1]])
+    ends = np.r_[starts[1:], len(minute)] - 1
+    return _bar_frame(minute[starts] * NS_PER_MINUTE, {
+        'Open': bid[starts],
+        'High': np.maximum.reduceat(bid, starts),
+        'Low': np.minimum.reduceat(bid, starts),
+        'Close': bid[ends],
+        'Volume': np.diff(np.r_[starts, len(minute)]),
+    })
+
+
+def read_export(path, chunksize=1_000_000):
+    """
+    M1 bars of a MetaTrader bar or tick export, or of a 'DateTime,Open,...' CSV, chunk by chunk.
+
+    Only one chunk of the file is in memory at a time. Ticks are turned into bid M1 bars;
+    the last minute of a chunk is held back until the next chunk completes it. Bar exports
+    without a volume column (<TICKVOL>, <VOL> or Volume) get a NaN volume.
+    """
+    with open(path, 'r') as f:
+        header = f.readline()
+    sep = '\t' if '\t' in header else ','
+    columns = header.strip().split(sep)
+
+    if '<DATE>' not in columns:
+        # Plain CSV with a single timestamp column first
+        time_column = columns[0]
+        for chunk in pd.read_csv(path, sep=sep, chunksize=chunksize, dtype={time_column: str}):
+            yield _bar_frame(parse_timestamps(chunk[time_column].to_numpy()),
+                             {**{name: chunk[name].to_numpy() for name in OHLCV_COLUMNS[:-1]},
+                              'Volume': _volume(chunk, ['Volume'])})
+        return
+
+    is_tick = '<BID>' in columns
+    wanted = list(MT_TICK_COLUMNS) if is_tick else list(MT_BAR_COLUMNS) + MT_VOLUME_COLUMNS
+    usecols = ['<DATE>', '<TIME>'] + [c for c in wanted if c in columns]
+    reader = pd.read_csv(path, sep=sep, chunksize=chunksize, usecols=usecols,
+                         dtype={'<DATE>': str, '<TIME>': str})
+
+    if not is_tick:
+        for chunk in reader:
+            ns = parse_timestamps(chunk['<DATE>'].to_numpy(), chunk['<TIME>'].to_numpy())
+            yield _bar_frame(ns, {**{MT_BAR_COLUMNS[name]: chunk[name].to_numpy() for name in MT_BAR_COLUMNS},
+                                  'Volume': _volume(chunk, MT_VOLUME_COLUMNS)})
+        return
+
+    last_bid = np.nan
+    held_ns, held_bid = np.empty(0, dtype=np.int64), np.empty(0)
+    for chunk in reader:
+        ns = parse_timestamps(chunk['<DATE>'].to_numpy(), chunk['<TIME>'].to_numpy())
+        # Tick rows only hold the prices that changed: carry the bid forward, across chunks too
+        bid = chunk['<BID>'].ffill().fillna(last_bid).to_numpy(dtype=float)
+        if len(bid):
+            last_bid = bid[-1]
+        ns, bid = np.r_[held_ns, ns], np.r_[held_bid, bid]
+        valid = ~np.isnan(bid)
+        ns, bid = ns[valid], bid[valid]
+        if len(ns) == 0:
+            continue
+        complete = np.searchsorted(ns // NS_PER_MINUTE, ns[-1] // NS_PER_MINUTE)
+        held_ns, held_bid = ns[complete:], bid[complete:]
+        if complete:
+            yield _ticks_to_bars(ns[:complete], bid[:complete])
+    if len(held_ns):
+        yield _ticks_to_bars(held_ns, held_bid)
+
+
+# ----------------------------------------------------------------------
+# Store
+# ----------------------------------------------------------------------
+
+def _write_parquet(frame, path):
+    tmp_path = path + '.tmp'
+    frame.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class OHLCVStore:
+    """
+    Date-partitioned Parquet store of M1 bars, with the other timeframes derived on demand.
+
+    ``ingest`` streams an export into one Parquet file per symbol and day
+    (``<root>/<symbol>/M1/<YYYY-MM-DD>.parquet``), holding at most one chunk and one day in
+    memory. ``bars`` reads the days of a date range; higher timeframes are aggregated
+    from M1 once per day and cached next to it until that day is ingested again.
+    """
+
+    def __init__(self, root='.ohlcv_store'):
+        self.root = root
+
+    def _dir(self, symbol, timeframe):
+        return os.path.join(self.root, symbol, timeframe)
+
+    def _day_path(self, symbol, timeframe, day):
+        return os.path.join(self._dir(symbol, timeframe), f'{day}.parquet')
+
+    # ------------------------------------------------------------------
+    # Ingestion
+    # ------------------------------------------------------------------
+
+    def _manifest_path(self, symbol):
+        return os.path.join(self.root, symbol, 'manifest.json')
+
+    def _read_manifest(self, symbol):
+        try:
+            with open(self._manifest_path(symbol), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'sources': {}}
+
+    def _write_manifest(self, symbol, manifest):
+        tmp_path = self._manifest_path(symbol) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, self._manifest_path(symbol))
+
+    def _write_days(self, symbol, bars):
+        if len(bars) == 0:
+            return
+        bars = bars.sort_index(kind='stable')
+        day = bars.index.as_unit('ns').asi8 // NS_PER_DAY
+        starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+        os.makedirs(self._dir(symbol, 'M1'), exist_ok=True)
+        for start, stop in zip(starts, np.r_[starts[1:], len(day)]):
+            part = bars.iloc[start:stop]
+            name = part.index[0].strftime('%Y-%m-%d')
+            path = self._day_path(symbol, 'M1', name)
+            if os.path.exists(path):
+                # Re-ingested or overlapping exports: the latest values win
+                part = pd.concat([pd.read_parquet(path), part])
+                part = part[~part.index.duplicated(keep='last')].sort_index(kind='stable')
+            _write_parquet(part, path)
+            # The aggregates of this day are stale now
+            for timeframe in TIMEFRAMES:
+                if timeframe != 'M1' and os.path.exists(self._day_path(symbol, timeframe, name)):
+                    os.remove(self._day_path(symbol, timeframe, name))
+
+    def ingest(self, path, symbol, chunksize=1_000_000, force=False):
+        """
+        Add an export to the store; returns the number of M1 bars read.
+
+        An export already ingested is skipped while its modification time and size are
+        unchanged, unless ``force``.
+        """
+        stat = os.stat(path)
+        fingerprint = [stat.st_mtime_ns, stat.st_size]
+        source = os.path.abspath(path)
+        os.makedirs(os.path.join(self.root, symbol), exist_ok=True)
+        manifest = self._read_manifest(symbol)
+        if not force and manifest['sources'].get(source) == fingerprint:
+            return 0
+
+        rows = 0
+        pending = None
+        for bars in read_export(path, chunksize):
+            rows += len(bars)
+            if pending is not None:
+                bars = pd.concat([pending, bars])
+            # The last day may continue in the next chunk, it is written once complete
+            day = bars.index.as_unit('ns').asi8 // NS_PER_DAY
+            last_day = np.searchsorted(day, day[-1]) if (np.diff(day) >= 0).all() else len(bars)
+            self._write_days(symbol, bars.iloc[:last_day])
+            pending = bars.iloc[last_day:]
+        if pending is not None:
+            self._write_days(symbol, pending)
+
+        manifest['sources'][source] = fingerprint
+        self._write_manifest(symbol, manifest)
+        return rows
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def days(self, symbol):
+        """Dates ('YYYY-MM-DD') held for a symbol, in order."""
+        try:
+            names = os.listdir(self._dir(symbol, 'M1'))
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len('.parquet')] for name in names if name.endswith('.parquet'))
+
+    def _build_aggregates(self, symbol, timeframe, days):
+        # Aggregates of the days not cached yet, reading their M1 bars AGGREGATE_BATCH_DAYS
+        # days at a time, so a long history is never in memory at once
+        missing = [day for day in days if not os.path.exists(self._day_path(symbol, timeframe, day))]
+        if missing:
+            os.makedirs(self._dir(symbol, timeframe), exist_ok=True)
+        for first in range(0, len(missing), AGGREGATE_BATCH_DAYS):
+            batch = missing[first:first + AGGREGATE_BATCH_DAYS]
+            m1 = pq.ParquetDataset([self._day_path(symbol, 'M1', day) for day in batch]).read().to_pandas()
+            bars = resample_bars(m1, timeframe)
+            day = bars.index.as_unit('ns').asi8 // NS_PER_DAY
+            starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+            for start, stop in zip(starts, np.r_[starts[1:], len(day)]):
+                part = bars.iloc[start:stop]
+                _write_parquet(part, self._day_path(symbol, timeframe, part.index[0].strftime('%Y-%m-%d')))
+
+    def bars(self, symbol, timeframe='M1', start=None, end=None):
+        """Bars of a symbol and timeframe between two dates or timestamps (both included)."""
+        if timeframe not in TIMEFRAMES:
+            raise ValueError(f"Unknown timeframe {timeframe}, expected one of {list(TIMEFRAMES)}")
+        first = pd.Timestamp(start).strftime('%Y-%m-%d') if start is not None else None
+        last = pd.Timestamp(end).strftime('%Y-%m-%d') if end is not None else None
+        days = [day for day in self.days(symbol) if (first is None or day >= first) and (last is None or day <= last)]
+        if not days:
+            return _bar_frame(np.empty(0, dtype=np.int64), {name: [] for name in OHLCV_COLUMNS})
+
+        if timeframe != 'M1':
+            self._build_aggregates(symbol, timeframe, days)
+        bars = pq.ParquetDataset([self._day_path(symbol, timeframe, day) for day in days]).read().to_pandas()
+        return bars.loc[start:end] if start is not None or end is not None else bars
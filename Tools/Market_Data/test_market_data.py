@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import market_data
+from market_data import EODHDProvider, FMPProvider, MarketData
+
+START, END = pd.Timestamp('2024-01-02'), pd.Timestamp('2024-01-04')
+
+EODHD_BARS = [
+    {'date': '2024-01-02', 'open': 10.0, 'high': 11.0, 'low': 9.0, 'close': 10.5, 'adjusted_close': 10.2,
+     'volume': 100},
+    {'date': '2024-01-03', 'open': 10.5, 'high': 12.0, 'low': 10.0, 'close': 11.5, 'adjusted_close': 11.1,
+     'volume': 200},
+]
+
+FMP_BARS = {'historical': [{**{key: value for key, value in bar.items() if key != 'adjusted_close'},
+                            'adjClose': bar['adjusted_close']} for bar in EODHD_BARS]}
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    def get_json(url, params):
+        return FMP_BARS if 'financialmodelingprep' in url else EODHD_BARS
+
+    monkeypatch.setattr(market_data, '_get_json', get_json)
+
+
+@pytest.mark.parametrize('provider', [EODHDProvider('token'), FMPProvider('key')])
+def test_fetch_keeps_every_field(responses, provider):
+    frame = provider.fetch('AAPL.US', START, END, '1d')
+    assert list(frame.columns) == market_data.FIELDS
+    assert not frame.isna().any().any()
+    np.testing.assert_allclose(frame['Adj Close'], [10.2, 11.1])
+    np.testing.assert_allclose(frame['Volume'], [100, 200])
+
+
+def test_get_adjusted_close(responses, tmp_path):
+    prices = MarketData(EODHDProvider('token'), str(tmp_path)).get(['AAPL.US'], START, END)
+    np.testing.assert_allclose(prices['AAPL.US'], [10.2, 11.1])
+
+
+def test_cache_of_another_version_is_fetched_again(responses, tmp_path):
+    data = MarketData(EODHDProvider('token'), str(tmp_path))
+    data.history('AAPL.US', START, END)
+    # As cached before the Adj Close fix: no version and NaN adjusted closes
+    key = data.key('AAPL.US', '1d')
+    data_path, meta_path = data._paths(key)
+    with open(meta_path) as f:
+        meta = json.load(f)
+    del meta['version']
+    frame = pd.read_parquet(data_path).assign(**{'Adj Close': np.nan})
+    data._write(key, meta, frame)
+
+    np.testing.assert_allclose(data.history('AAPL.US', START, END)['Adj Close'], [10.2, 11.1])